@@ -125,6 +125,20 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Shared between workers; create the table with `manage.py createcachetable`.
+# Holds versioned payloads such as the municipality directory; the version
+# counters themselves live in the data_versions table (lib/cache_versions.py).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'mfv_cache',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -173,6 +187,19 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static'
 ]
 
+# Baked boundary GeoJSON artifacts (see bake_boundary_artifacts command)
+BOUNDARY_ARTIFACT_ROOT = BASE_DIR / 'artifacts' / 'boundaries'
+
+# Uploads are spooled to disk in chunks and hashed as they arrive
+FILE_UPLOAD_HANDLERS = [
+    'finance_viewer.lib.uploads.HashingTemporaryFileUploadHandler',
+]
+UPLOAD_MAX_BYTES = 1024 * 1024 * 1024  # 1 GB
+
+# Parcel upload job queue (see run_parcel_worker command)
+PARCEL_JOB_ROOT = BASE_DIR / 'artifacts' / 'parcel_jobs'
+PARCEL_JOB_WORKERS = 2
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -1,35 +1,64 @@
 """ API calls for all financial viewer requests """
-#pylint: disable=C0301,W0718,W0613
+#pylint: disable=C0301,W0718,W0613,W0622
 
 
 import json
+import logging
 import uuid
 
-from django.core.serializers import serialize
-from django.http import JsonResponse
-from ninja import Router, File
+from django.db import DataError, transaction
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import parse_etags
+from ninja import Router, File, Query
 from ninja.files import UploadedFile
 from ninja_jwt.authentication import JWTAuth
 
+from .lib.artifacts import artifact_key, redirect_to_artifact, serve_artifact
+from .lib.boundary_cache import get_municipality_boundary
+from .lib.cache_versions import bump_data_version
+from .lib.choropleth import BINARY_CONTENT_TYPE, DEFAULT_CLASSES, get_choropleth, mid_index_payload
+from .lib.derived_metrics import query_derived_metrics, refresh_derived_metrics
+from .lib.directory import DIRECTORY_FORMATS, OBJECTS_FORMAT, get_municipality_directory
+from .lib.expressions import ExpressionError, compile_expression
 from .lib.finance import (
+    MAX_BATCH_MIDS,
     add_municipality,
-    query_all_municipalities,
+    new_municipality_mid,
+    query_expression_values,
+    query_finance_columns,
+    query_finances_for_municipalities,
     query_finances_for_municipality,
     query_mid
 )
+from .lib.geojson_stream import GEOJSON_FORMAT, STREAM_FORMATS, stream_response
 from .lib.gis import (
-    query_municipality_boundary,
-    query_state_municipalities,
-    query_state_municipal_boundaries
+    query_state_boundaries,
+    query_state_municipal_boundaries,
+    resolve_boundary_level
 )
-from .lib.parcels import handle_shapefile_upload
+from .lib.ingest import MAX_YEAR, MIN_YEAR, UPDATE, IngestError, ingest_finances, read_finance_file
+from .lib.metric_definitions import DERIVED_METRICS, METRIC_FIELDS
+from .lib.metrics import FINANCE_VERSION, get_finance_cube, nan_to_none
+from .lib.parcel_exports import MAX_PRECISION, MIN_PRECISION, negotiate_parcel_format, serve_parcel_export
+from .lib.parcel_jobs import job_status, submit_parcel_job
+from .lib.parcel_analytics import CLASSIFICATION_METHODS, QUANTILES, DEFAULT_CLASSES as DEFAULT_PARCEL_CLASSES, classify_parcels
+from .lib.parcel_store import find_parcel_upload, iter_stored_parcel_features, load_parcel_metrics
+from .lib.ranking import rank_municipality
+from .lib.search import DEFAULT_LIMIT, get_search_index
 from .lib.state_utils import get_state_abreviation
+from .lib.tiles import build_municipal_tile, build_parcel_tile, is_valid_tile
+from .lib.trends import DEFAULT_WINDOW, MAX_WINDOW, get_trends, trend_payload
+from .lib.uploads import upload_limit_exceeded
 from .models.municipal_finance import MunicipalFinances
-from .models.gis_boundaries import StateBoundaries
+from .models.parcel_jobs import ParcelJob
 from .schemas import (
     MunicipalityFinance,
+    MunicipalityFinanceBatchRequest,
     MunicipalityInfo,
+    MunicipalitySearchResult,
     MunicipalBoundaryResponse,
+    ParcelJobResponse,
     ParcelUploadResponse,
     StateBoundaryResponse
 )
@@ -39,73 +68,218 @@ from .schemas import (
 
 router = Router()
 
+logger = logging.getLogger(__name__)
+
 @router.get("/gis/states", response=list[StateBoundaryResponse], auth=JWTAuth())
-def get_states(request):
-    """ API call for retrieving state boundaries """
+def get_states(request, resolution:str = None, zoom:int = None, format:str = GEOJSON_FORMAT):
+    """ API call for retrieving state boundaries
+
+        Args:
+            resolution (str): Geometry resolution (low, medium, high or full)
+            zoom (int): Map zoom level, used to pick a resolution when none is given
+            format (str): geojson (FeatureCollection) or ndjson (one feature per line)
+    """
+
+    if format not in STREAM_FORMATS:
+        return JsonResponse({"success": False, "message": "Unsupported format"}, status=400)
 
-    qs = StateBoundaries.objects.using('gis_boundaries').all()
-    geojson = serialize("geojson", qs, geometry_field="geometry", fields=[
-        "id", "statefp", "statens", "geoidfq", "geoid", "stusps", "name", "lsad", "aland", "awater"
-    ])
-    return JsonResponse(geojson, safe=False)
+    try:
+        level = resolve_boundary_level(resolution, zoom)
+    except ValueError as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=400)
+
+    if format == GEOJSON_FORMAT:
+        artifact = redirect_to_artifact(artifact_key("states", level))
+        if artifact is not None:
+            return artifact
+
+    return stream_response(query_state_boundaries(level), format)
 
 @router.get("/gis/municipalities", response=list[MunicipalBoundaryResponse], auth=JWTAuth())
-def get_state_municipalities(request, state_name:str, state_abbr:str, state_code:str):
+def get_state_municipalities(request, state_name:str, state_abbr:str, state_code:str,
+                             resolution:str = None, zoom:int = None, format:str = GEOJSON_FORMAT):
     """ API call for retrieving municipal boundaries for a state 
     
         Args:
             state_name (str): State Name
             state_abbr (str): 2-letter State Abbreviation i.e. CA
             state_code (str): 2-digit state FIPS code
+            resolution (str): Geometry resolution (low, medium, high or full)
+            zoom (int): Map zoom level, used to pick a resolution when none is given
+            format (str): geojson (FeatureCollection) or ndjson (one feature per line)
     """
 
-    # TODO: Optimize DB query
+    if format not in STREAM_FORMATS:
+        return JsonResponse({"success": False, "message": "Unsupported format"}, status=400)
+
+    try:
+        level = resolve_boundary_level(resolution, zoom)
+    except ValueError as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=400)
+
     # Get state abbreviation
     state_lookup = state_abbr if len(state_abbr) <= 2 else get_state_abreviation(state_name)
     if state_lookup is None:
         return JsonResponse({"success": False, "message": "State not available"}, status=500)
 
-    # Get state-county FIPS, name and mid for the available municipalities
-    available_munis_qs = query_state_municipalities(state_lookup)
-    muni_lookup = {(county_fips, name): mid for county_fips, name, mid in available_munis_qs}
+    if format == GEOJSON_FORMAT:
+        artifact = redirect_to_artifact(artifact_key("municipalities", level, state_lookup))
+        if artifact is not None:
+            return artifact
+
+    return stream_response(query_state_municipal_boundaries(state_lookup, level), format)
+
+@router.get("/gis/artifacts/{filename}", auth=JWTAuth())
+def get_boundary_artifact(request, filename:str):
+    """ API call for retrieving a baked boundary artifact by its content-hashed name
+
+        Args:
+            filename (str): Artifact file name from the state or municipal boundaries redirect
+    """
+
+    artifact = serve_artifact(request, filename)
+    if artifact is None:
+        return JsonResponse({"success": False, "message": "Artifact not found"}, status=404)
+    return artifact
+
+@router.get("/gis/tiles/{int:z}/{int:x}/{int:y}.mvt", auth=JWTAuth())
+def get_municipal_tile(request, z:int, x:int, y:int):
+    """ API call for retrieving a vector tile of municipal boundaries
 
-    data = query_state_municipal_boundaries(state_lookup, available_munis_qs)
+        Args:
+            z (int): Zoom level
+            x (int): Tile column
+            y (int): Tile row
+    """
 
-    # Attach the correct mid to each feature record
-    for feature in data['features']:
-        props = feature['properties']
-        county_fips5 = props.get('county_fips', '')[:5] or props.get('fips_code', '')[:5]
-        mun_name = props['municipal_name']
-        mid = muni_lookup.get((county_fips5, mun_name))
-        props['mid'] = mid
+    if not is_valid_tile(z, x, y):
+        return JsonResponse({"success": False, "message": "Invalid tile coordinates"}, status=400)
 
-    return JsonResponse(data, safe=False, status=200)
+    tile = build_municipal_tile(z, x, y)
+
+    response = HttpResponse(tile, content_type="application/vnd.mapbox-vector-tile", status=200)
+    response["Cache-Control"] = "private, max-age=86400"
+    return response
+
+@router.get("/gis/municipality/contains", auth=JWTAuth())
+def get_municipality_contains(request, mid:str, lon:float, lat:float):
+    """ API call for whether a point lies inside a municipality's boundary
+
+        Args:
+            mid (str): Municipality ID
+            lon (float): Longitude
+            lat (float): Latitude
+    """
+
+    if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+        return JsonResponse({"success": False, "error": "Invalid coordinates"}, status=400)
+
+    boundary = get_municipality_boundary(mid)
+    if boundary is None:
+        return JsonResponse({"success": False, "error": "Boundary not found"}, status=404)
+
+    return JsonResponse({"mid": mid, "contains": boundary.contains(lon, lat), **boundary.properties}, status=200)
 
 @router.get("/municipality/finances", response=list[MunicipalityFinance], auth=JWTAuth())
-def get_municipality_finances(request, mid:str):
-    """Get financial data for a municipality"""
+def get_municipality_finances(request, mid:str, format:str = "rows", fields:list[str] = Query(None)):
+    """Get financial data for a municipality
+
+        Args:
+            mid (str): Municipality ID
+            format (str): rows (one object per year) or columnar ({years, fields: {name: [...]}})
+            fields (list): Numeric fields to include with the columnar format, all when omitted
+    """
+
+    if format not in ("rows", "columnar"):
+        return JsonResponse({"success": False, "error": "Unsupported format"}, status=400)
 
     try:
 
+        if format == "columnar":
+            return JsonResponse(query_finance_columns(mid, fields), status=200)
+
         data = query_finances_for_municipality(mid)
         return JsonResponse(data, safe=False, status=200)
+    except ValueError as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
     except Exception as e:
         print(e)
         return JsonResponse({"success": False, "error": "Unable to retrieve finances"}, status=400)
 
 
+@router.post("/municipality/finances/batch", auth=JWTAuth())
+def get_municipalities_finances(request, payload:MunicipalityFinanceBatchRequest):
+    """ API call for financial data of many municipalities in one request
+
+        Responds with a streamed JSON object mapping each mid to its yearly
+        rows, in the same shape as /municipality/finances.
+
+        Args:
+            payload (MunicipalityFinanceBatchRequest): mids and optional year range
+    """
+
+    try:
+        mids = list(dict.fromkeys(str(uuid.UUID(mid)) for mid in payload.mids))
+    except ValueError:
+        return JsonResponse({"success": False, "error": "Invalid municipality id"}, status=400)
+
+    if not mids:
+        return JsonResponse({"success": False, "error": "No municipality ids provided"}, status=400)
+    if len(mids) > MAX_BATCH_MIDS:
+        return JsonResponse(
+            {"success": False, "error": f"At most {MAX_BATCH_MIDS} municipalities per request"},
+            status=400)
+
+    chunks = query_finances_for_municipalities(mids, payload.start_year, payload.end_year)
+    return StreamingHttpResponse(chunks, content_type="application/json", status=200)
+
 @router.get("/municipality/list", response=list[MunicipalityInfo], auth=JWTAuth())
-def get_municipality_list(request):
-    """Get list of all municipalities"""
+def get_municipality_list(request, format:str = OBJECTS_FORMAT):
+    """Get list of all municipalities
+
+        Args:
+            format (str): objects (list of records) or compact (fields plus array-of-arrays rows)
+    """
+
+    if format not in DIRECTORY_FORMATS:
+        return JsonResponse({"success": False, "error": "Unsupported format"}, status=400)
 
     try:
-        data = query_all_municipalities()
-        return JsonResponse(data, safe=False, status=200)
+        directory = get_municipality_directory()
+        etag = directory.etags[format]
+
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(directory.payloads[format], content_type="application/json", status=200)
+
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
     except Exception as e:
         print(e)
         return JsonResponse({"success": False, "error": "Unable to fetch municipalities"}, status=400)
 
 
+@router.get("/municipality/search", response=list[MunicipalitySearchResult], auth=JWTAuth())
+def search_municipalities(request, q:str, limit:int = DEFAULT_LIMIT, state:str = None, county_fips:str = None):
+    """Typeahead search over municipality names
+
+        Args:
+            q (str): Search text
+            limit (int): Maximum number of matches
+            state (str): Optional state abbreviation filter
+            county_fips (str): Optional 5-digit county FIPS filter
+    """
+
+    try:
+        data = get_search_index().search(q, limit=limit, state=state, county_fips=county_fips)
+        return JsonResponse(data, safe=False, status=200)
+    except Exception:
+        logger.exception("Error searching municipalities for %r", q)
+        return JsonResponse({"success": False, "error": "Unable to search municipalities"}, status=400)
+
+
 @router.post("/municipality/finances/add/year")
 def add_municipality_yearly_finances(request):
     """ API call for adding finances for a municipality """
@@ -120,12 +294,22 @@ def add_municipality_yearly_finances(request):
     if not all([municipality_name, state_abbr, county_fips, year]):
         return JsonResponse({"success": False, "error": "Missing required fields"}, status=400)
 
+    try:
+        year = float(year)
+    except (TypeError, ValueError):
+        year = None
+    if year is None or year % 1 != 0 or not MIN_YEAR <= year <= MAX_YEAR:
+        return JsonResponse(
+            {"success": False, "error": f"year must be a whole number from {MIN_YEAR} to {MAX_YEAR}"},
+            status=400)
+    data["year"] = year = int(year)
+
     mid = query_mid(municipality_name, state_abbr, county_fips)
 
     if mid:
 
         # Check if finance record for that year exists
-        exists = MunicipalFinances.objects.filter(mid=mid, year=year).exists()
+        exists = MunicipalFinances.objects.using('municipal_finance').filter(mid=mid, year=year).exists()
 
         if exists:
             return JsonResponse(
@@ -134,39 +318,281 @@ def add_municipality_yearly_finances(request):
                     "error": "Record for municipality and year already exists"
                 },
                 status=400)
-    else:
-        # Municipality does not exist, create new mid and insert municipality
-        mid = str(uuid.uuid5(uuid.NAMESPACE_URL, state_abbr + municipality_name))
-        add_municipality(mid, municipality_name, state_abbr, county_fips)
 
-    # Now create the MunicipalFinanceRecord entry
-    # Add mid to data to associate finance record with municipality
-    data["mid"] = mid
-    data["modifier"] = "user"
+    # The municipality, finance record and derived metrics commit together
+    with transaction.atomic(using='municipal_finance'):
+        if not mid:
+            # Municipality does not exist, create new mid and insert municipality
+            mid = new_municipality_mid(municipality_name, state_abbr)
+            add_municipality(mid, municipality_name, state_abbr, county_fips)
+
+        # Now create the MunicipalFinanceRecord entry
+        # Add mid to data to associate finance record with municipality
+        data["mid_id"] = mid
+        data["modifier"] = "user"
+        data.setdefault("created_at", timezone.now())
+
+        # Create new finance record
+        MunicipalFinances.objects.using('municipal_finance').create(**data)
+        refresh_derived_metrics([mid], [year])
 
-    # Create new finance record
-    MunicipalFinances.objects.create(**data)
+    bump_data_version(FINANCE_VERSION)
 
     return JsonResponse({"success": True, "message": "Record created successfully"}, status=200)
 
-@router.post("/gis/municipality/parcels", response=ParcelUploadResponse, auth=JWTAuth())
-def upload_parcel_data(request, file:File[UploadedFile], mid:str):
-    """ Upload and process parcel shapefile """
+@router.post("/municipality/finances/bulk", auth=JWTAuth())
+def bulk_load_finances(request, file:File[UploadedFile] = None, on_conflict:str = UPDATE, dry_run:bool = False):
+    """ API call for loading a CSV or Parquet file of finance rows
+
+        Rows are identified by mid or by municipality_name, state and
+        county_fips (missing municipalities are created). Invalid rows are
+        skipped and listed in the report's errors.
+
+        Args:
+            file (UploadedFile): CSV or Parquet file of municipal_finances columns
+            on_conflict (str): update or skip rows whose mid and year already exist
+            dry_run (bool): Validate and count without writing
+    """
+
+    if upload_limit_exceeded(request):
+        return JsonResponse({"success": False, "error": "Upload is too large."}, status=413)
+
+    if not file:
+        return JsonResponse({"success": False, "error": "No upload was received."}, status=400)
+
+    try:
+        report = ingest_finances(read_finance_file(file), on_conflict=on_conflict, dry_run=dry_run)
+    except IngestError as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+    except Exception:
+        logger.exception("Error loading finance file %s", file.name)
+        return JsonResponse({"success": False, "error": "Error loading finance file."}, status=500)
+
+    return JsonResponse(report, status=200)
+
+@router.get("/metrics/derived", auth=JWTAuth())
+def get_derived_metrics(request, mids:list[str] = Query(None), metrics:list[str] = Query(None),
+                        start_year:int = None, end_year:int = None):
+    """ API call for standard derived ratios across municipalities and years
+
+        Served from the precomputed municipal_derived_metrics table, or from
+        the finance cube until that table has been built.
 
-    if not file or not file.file:
+        Args:
+            mids (list): Municipality ids, all municipalities when omitted
+            metrics (list): Derived metric names, all when omitted
+            start_year (int): First year (inclusive)
+            end_year (int): Last year (inclusive)
+    """
+
+    if mids is not None:
+        try:
+            mids = [str(uuid.UUID(mid)) for mid in mids]
+        except ValueError:
+            return JsonResponse({"success": False, "error": "Invalid municipality id"}, status=400)
+
+    try:
+        result = query_derived_metrics(metrics, mids, start_year, end_year)
+        if result is None:
+            result = get_finance_cube().derived(metrics, mids, start_year, end_year)
+    except KeyError as e:
+        return JsonResponse({"success": False, "error": str(e.args[0])}, status=400)
+
+    return JsonResponse({
+        "mids": result["mids"].tolist(),
+        "years": result["years"].tolist(),
+        "metrics": {name: nan_to_none(values) for name, values in result["metrics"].items()}
+    }, status=200)
+
+@router.get("/metrics/ranks", auth=JWTAuth())
+def get_metric_ranks(request, mid:str, metrics:list[str] = Query(None), peers:list[str] = Query(None),
+                     start_year:int = None, end_year:int = None):
+    """ API call for a municipality's percentile rank among its peers
+
+        Percentiles are the share of peers with a lower value in the same
+        year (ties count half), nationally, within the state and within the
+        population band (boundary pop_2020, else reported population).
+
+        Args:
+            mid (str): Municipality ID
+            metrics (list): Raw, derived or custom metric expressions, all raw and derived metrics when omitted
+            peers (list): Peer groups (national, state, population), all when omitted
+            start_year (int): First year (inclusive)
+            end_year (int): Last year (inclusive)
+    """
+
+    try:
+        result = rank_municipality(
+            get_finance_cube(), mid, metrics or METRIC_FIELDS + list(DERIVED_METRICS), peers, start_year, end_year
+        )
+    except ExpressionError as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+    except KeyError as e:
+        return JsonResponse({"success": False, "error": str(e.args[0])}, status=400)
+
+    if result is None:
+        return JsonResponse({"success": False, "error": "No finances for municipality"}, status=404)
+    return JsonResponse(result, status=200)
+
+@router.get("/metrics/trends", auth=JWTAuth())
+def get_metric_trends(request, metric:str, window:int = DEFAULT_WINDOW, mids:list[str] = Query(None),
+                      start_year:int = None, end_year:int = None):
+    """ API call for year-over-year change, CAGR, rolling mean and volatility of a metric
+
+        Changes are not taken across missing fiscal years; CAGR runs from the
+        first reported year in the trailing window.
+
+        Args:
+            metric (str): Raw or derived metric name, or a custom metric expression
+            window (int): Trailing window in years for CAGR, rolling mean and volatility
+            mids (list): Municipality ids, all municipalities when omitted
+            start_year (int): First year (inclusive)
+            end_year (int): Last year (inclusive)
+    """
+
+    if not 1 <= window <= MAX_WINDOW:
+        return JsonResponse({"success": False, "error": f"window must be between 1 and {MAX_WINDOW}"}, status=400)
+
+    cube = get_finance_cube()
+    try:
+        layer = get_trends(cube, metric, window)
+    except ExpressionError as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+    except KeyError as e:
+        return JsonResponse({"success": False, "error": str(e.args[0])}, status=400)
+
+    return JsonResponse(trend_payload(cube, layer, mids, start_year, end_year), status=200)
+
+@router.get("/metrics/custom", auth=JWTAuth())
+def get_custom_metric(request, expression:str, mids:list[str] = Query(None), start_year:int = None,
+                      end_year:int = None, engine:str = "numpy"):
+    """ API call for a custom metric expression across municipalities and years
+
+        Expressions combine municipal_finances fields, derived metric names and
+        boundary attributes (sq_mi, acres, pop_2010, pop_2020) with + - * / ^,
+        abs, sqrt, min and max, e.g. (operating_grants + capital_grants) / total_revenues.
+
+        Args:
+            expression (str): Metric expression
+            mids (list): Municipality ids, all municipalities when omitted
+            start_year (int): First year (inclusive)
+            end_year (int): Last year (inclusive)
+            engine (str): numpy (in-memory cube) or sql (evaluated in Postgres)
+    """
+
+    if engine not in ("numpy", "sql"):
+        return JsonResponse({"success": False, "error": "Unsupported engine"}, status=400)
+
+    try:
+        compiled = compile_expression(expression)
+    except ExpressionError as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+
+    if engine == "numpy":
+        result = get_finance_cube().evaluate(compiled.text, mids, start_year, end_year)
+        return JsonResponse({
+            "expression": compiled.text,
+            "mids": result["mids"].tolist(),
+            "years": result["years"].tolist(),
+            "values": nan_to_none(result["values"])
+        }, status=200)
+
+    if compiled.sql is None:
+        return JsonResponse(
+            {"success": False, "error": "Boundary attributes are only available with the numpy engine"},
+            status=400)
+
+    if mids is not None:
+        try:
+            mids = [str(uuid.UUID(mid)) for mid in mids]
+        except ValueError:
+            return JsonResponse({"success": False, "error": "Invalid municipality id"}, status=400)
+
+    try:
+        rows = query_expression_values(compiled.sql, mids, start_year, end_year)
+    except DataError:
+        # Overflow or underflow in Postgres, where NumPy would give infinity or NaN
+        return JsonResponse({"success": False, "error": "Expression is out of range for the sql engine"}, status=400)
+
+    return JsonResponse({
+        "expression": compiled.text,
+        "values": [{"mid": mid, "year": year, "value": value} for mid, year, value in rows]
+    }, status=200)
+
+@router.get("/metrics/choropleth/index", auth=JWTAuth())
+def get_choropleth_index(request):
+    """ API call for the mid order shared by every choropleth values array """
+
+    payload, etag = mid_index_payload(get_finance_cube())
+
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(payload, content_type="application/json", status=200)
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+@router.get("/metrics/choropleth", auth=JWTAuth())
+def get_choropleth_values(request, metric:str, year:int, classes:int = DEFAULT_CLASSES, format:str = "binary"):
+    """ API call for one metric's value for every municipality in a year
+
+        The binary format is a little-endian uint32 header length, a JSON
+        header (metric, year, version, count, breaks) padded to 4 bytes and
+        then one float32 per municipality in /metrics/choropleth/index order,
+        NaN where there is no data.
+
+        Args:
+            metric (str): Raw or derived metric name, or a custom metric expression
+            year (int): Fiscal year
+            classes (int): Number of quantile class breaks to compute, 0 for none
+            format (str): binary or json
+    """
+
+    if format not in ("binary", "json"):
+        return JsonResponse({"success": False, "error": "Unsupported format"}, status=400)
+
+    try:
+        layer = get_choropleth(get_finance_cube(), metric, year, classes)
+    except ExpressionError as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=400)
+    except KeyError as e:
+        return JsonResponse({"success": False, "error": str(e.args[0])}, status=400)
+
+    if format == "json":
+        return JsonResponse({**layer.header(), "values": nan_to_none(layer.values)}, status=200)
+
+    if layer.etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(layer.binary, content_type=BINARY_CONTENT_TYPE, status=200)
+    response["ETag"] = layer.etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+@router.post("/gis/municipality/parcels", response=ParcelJobResponse, auth=JWTAuth())
+def upload_parcel_data(request, mid:str, file:File[UploadedFile] = None):
+    """ Upload a parcel file for background processing
+
+        Accepts a zipped shapefile, GeoPackage, FlatGeobuf or GeoParquet file
+        up to UPLOAD_MAX_BYTES. Responds right away with the job; poll
+        /gis/municipality/parcels/jobs/{job_id} and fetch the features from its
+        result, analytics and tiles endpoints once it has succeeded. Identical
+        uploads for a municipality share one job.
+    """
+
+    if upload_limit_exceeded(request):
+        return JsonResponse({ "success": False, "error": "Upload is too large."}, status=413)
+
+    if not file:
         return JsonResponse({ "success": False, "error": "No upload was received."}, status=400)
 
     if not mid or mid == "":
         return JsonResponse({ "success": False, "error": "Error processing parcel file upload." })
 
     try:
-        municipal_boundary = query_municipality_boundary(mid)
-
-        extracted = handle_shapefile_upload(
-            file.file,
-            municipal_boundary)
-
-        return JsonResponse(extracted, status=200)
+        job, created = submit_parcel_job(file, mid)
+        return JsonResponse(job_status(job), status=202 if created else 200)
     except Exception as e:
         return JsonResponse(
             {
@@ -174,3 +600,120 @@ def upload_parcel_data(request, file:File[UploadedFile], mid:str):
                 "error": str(e)
             },
             status=400)
+
+@router.get("/gis/municipality/parcels/jobs/{uuid:job_id}", response=ParcelJobResponse, auth=JWTAuth())
+def get_parcel_job(request, job_id:uuid.UUID):
+    """ API call for a parcel upload job's status and progress """
+
+    job = ParcelJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return JsonResponse({"success": False, "error": "Job not found"}, status=404)
+    return JsonResponse(job_status(job), status=200)
+
+@router.get("/gis/municipality/parcels/jobs/{uuid:job_id}/result", response=ParcelUploadResponse, auth=JWTAuth())
+def get_parcel_job_result(request, job_id:uuid.UUID, format:str = None, precision:int = None):
+    """ API call for the parcel features of a finished job
+
+        GeoJSON and NDJSON are streamed from PostGIS; FlatGeobuf, GeoArrow IPC
+        and GeoParquet are encoded once per upload and served from disk. The
+        format parameter overrides the Accept header.
+
+        Args:
+            job_id (UUID): Parcel job id
+            format (str): geojson, ndjson, fgb, arrow or parquet
+            precision (int): Coordinate decimal digits for geojson and ndjson
+    """
+
+    fmt = negotiate_parcel_format(request, format)
+    if fmt is None:
+        return JsonResponse({"success": False, "error": "Unsupported format"}, status=406 if format is None else 400)
+
+    if precision is not None:
+        if fmt not in STREAM_FORMATS:
+            return JsonResponse({"success": False, "error": "precision only applies to geojson and ndjson"}, status=400)
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            return JsonResponse({"success": False, "error": f"precision must be between {MIN_PRECISION} and {MAX_PRECISION}"}, status=400)
+
+    job = ParcelJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return JsonResponse({"success": False, "error": "Job not found"}, status=404)
+    if job.status != ParcelJob.SUCCEEDED:
+        return JsonResponse({"success": False, "error": f"Job is {job.status}", **job_status(job)}, status=409)
+
+    if fmt in STREAM_FORMATS:
+        response = stream_response(iter_stored_parcel_features(job.mid, job.content_hash, precision), fmt)
+        response["Vary"] = "Accept"
+        return response
+
+    try:
+        return serve_parcel_export(request, job.mid, job.content_hash, fmt)
+    except Exception:
+        logger.exception("Error encoding parcels of job %s as %s", job_id, fmt)
+        return JsonResponse({"success": False, "error": "Error encoding parcels."}, status=500)
+
+@router.get("/gis/municipality/parcels/jobs/{uuid:job_id}/analytics", auth=JWTAuth())
+def get_parcel_job_analytics(request, job_id:uuid.UUID, method:str = None, classes:int = None):
+    """ API call for the fiscal productivity analytics of a finished job
+
+        Value per acre classes (with their breaks), municipal totals and a
+        hexagon grid FeatureCollection of aggregated value per acre. Uploads
+        are classified into quantiles when processed; another method or class
+        count reclassifies the stored parcels for this response only, the
+        productivity_class of results and tiles stays the stored one.
+
+        Args:
+            job_id (UUID): Parcel job id
+            method (str): quantiles or jenks
+            classes (int): Number of classes
+    """
+
+    if method is not None and method not in CLASSIFICATION_METHODS:
+        return JsonResponse({"success": False, "error": f"method must be one of {', '.join(CLASSIFICATION_METHODS)}"}, status=400)
+
+    job = ParcelJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return JsonResponse({"success": False, "error": "Job not found"}, status=404)
+    if job.status != ParcelJob.SUCCEEDED:
+        return JsonResponse({"success": False, "error": f"Job is {job.status}", **job_status(job)}, status=409)
+
+    stored = find_parcel_upload(job.mid, job.content_hash)
+    if stored is None:
+        return JsonResponse({"success": False, "error": "Parcels are no longer stored"}, status=404)
+
+    analytics = stored.analytics or {}
+    stored_method = analytics.get("classification", {}).get("method")
+    if (method is None or method == stored_method) and classes is None:
+        return JsonResponse(analytics, status=200)
+
+    boundary_acres = analytics.get("municipality", {}).get("boundary_acres")
+    _, summary = classify_parcels(
+        load_parcel_metrics(job.mid, job.content_hash),
+        method or stored_method or QUANTILES,
+        DEFAULT_PARCEL_CLASSES if classes is None else classes,
+        boundary_acres
+    )
+    return JsonResponse({**analytics, **summary}, status=200)
+
+@router.get("/gis/municipality/parcels/jobs/{uuid:job_id}/tiles/{int:z}/{int:x}/{int:y}.mvt", auth=JWTAuth())
+def get_parcel_job_tile(request, job_id:uuid.UUID, z:int, x:int, y:int):
+    """ API call for a vector tile of a finished job's parcels
+
+        Args:
+            job_id (UUID): Parcel job id
+            z (int): Zoom level
+            x (int): Tile column
+            y (int): Tile row
+    """
+
+    if not is_valid_tile(z, x, y):
+        return JsonResponse({"success": False, "message": "Invalid tile coordinates"}, status=400)
+
+    job = ParcelJob.objects.filter(pk=job_id, status=ParcelJob.SUCCEEDED).first()
+    if job is None:
+        return JsonResponse({"success": False, "error": "Job not found"}, status=404)
+
+    tile = build_parcel_tile(job.mid, job.content_hash, z, x, y)
+
+    response = HttpResponse(tile, content_type="application/vnd.mapbox-vector-tile", status=200)
+    response["Cache-Control"] = "private, max-age=86400"
+    return response
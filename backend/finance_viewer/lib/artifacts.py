@@ -0,0 +1,222 @@
+""" Module for baking and serving precomputed boundary GeoJSON artifacts """
+
+import gzip
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotModified, HttpResponseRedirect
+from django.utils.http import parse_etags
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip artifacts are always written
+    brotli = None
+
+MANIFEST_NAME = "manifest.json"
+
+ARTIFACT_CONTENT_TYPE = "application/geo+json"
+# Artifact file names carry their content hash, so a URL never changes content
+ARTIFACT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# The unversioned entry points redirect to the current artifact and are revalidated on every use
+ENTRY_CACHE_CONTROL = "private, no-cache"
+
+# Preferred order when the client accepts several encodings
+ENCODINGS = [
+    ("br", ".br"),
+    ("gzip", ".gz"),
+]
+
+_manifest_cache = {"mtime": None, "data": {}, "files": {}}
+
+
+def artifact_root():
+    """ Directory holding baked artifacts """
+    return settings.BOUNDARY_ARTIFACT_ROOT
+
+def artifact_key(kind:str, level:int | None = None, state_abbr:str | None = None) -> str:
+    """ Build the manifest key for an artifact
+
+    Args:
+        kind (str): Artifact kind (states or municipalities)
+        level (int): Simplification level, None for full resolution
+        state_abbr (str): State abbreviation for per-state artifacts
+    Returns:
+        (str): Manifest key, e.g. municipalities.TX.full
+    """
+    parts = [kind]
+    if state_abbr:
+        parts.append(state_abbr.upper())
+    parts.append("full" if level is None else f"l{level}")
+    return ".".join(parts)
+
+def load_manifest() -> dict:
+    """ Load the artifact manifest, re-reading it only when it changed on disk """
+
+    path = os.path.join(artifact_root(), MANIFEST_NAME)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+
+    if _manifest_cache["mtime"] != mtime:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        _manifest_cache["data"] = data
+        _manifest_cache["files"] = {entry["file"]: entry for entry in data.values()}
+        _manifest_cache["mtime"] = mtime
+
+    return _manifest_cache["data"]
+
+def write_manifest(manifest:dict):
+    """ Atomically replace the artifact manifest """
+
+    path = os.path.join(artifact_root(), MANIFEST_NAME)
+    _write_atomic(path, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+
+def write_artifact(key:str, payload:bytes) -> dict:
+    """ Write an artifact and its precompressed variants under content-hashed names
+
+    Args:
+        key (str): Manifest key
+        payload (bytes): Uncompressed GeoJSON document
+    Returns:
+        (dict): Manifest entry for the artifact
+    """
+    os.makedirs(artifact_root(), exist_ok=True)
+
+    digest = hashlib.sha256(payload).hexdigest()[:20]
+    filename = f"{key}.{digest}.geojson"
+    entry = {"file": filename, "etag": digest, "size": len(payload), "encodings": {}}
+
+    _write_atomic(os.path.join(artifact_root(), filename), payload)
+
+    compressed = {"gzip": gzip.compress(payload, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressed["br"] = brotli.compress(payload, quality=11)
+
+    for encoding, suffix in ENCODINGS:
+        if encoding not in compressed:
+            continue
+        _write_atomic(os.path.join(artifact_root(), filename + suffix), compressed[encoding])
+        entry["encodings"][encoding] = filename + suffix
+
+    return entry
+
+def remove_stale_artifacts(manifest:dict):
+    """ Delete artifact files no longer referenced by the manifest """
+
+    keep = {MANIFEST_NAME}
+    for entry in manifest.values():
+        keep.add(entry["file"])
+        keep.update(entry["encodings"].values())
+
+    for filename in os.listdir(artifact_root()):
+        if filename not in keep and not filename.endswith(".tmp"):
+            os.remove(os.path.join(artifact_root(), filename))
+
+def parse_accept_encoding(header:str) -> dict[str, float]:
+    """ Map each coding of an Accept-Encoding header to its q-value
+
+    Args:
+        header (str): Accept-Encoding header, e.g. "gzip, br;q=0"
+    Returns:
+        (dict): {coding: q}, codings without a q-value get 1.0
+    """
+    accepted = {}
+    for part in header.split(","):
+        coding, *params = [piece.strip() for piece in part.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding.lower()] = quality
+    return accepted
+
+def choose_encoding(available, header:str) -> str | None:
+    """ Pick the precompressed variant to send for an Accept-Encoding header
+
+    Args:
+        available (Iterable): Encodings baked for the artifact
+        header (str): Accept-Encoding header
+    Returns:
+        (str): Best acceptable encoding, None for the uncompressed file
+    """
+    accepted = parse_accept_encoding(header)
+    encoding, best = None, 0.0
+    for name, _ in ENCODINGS:
+        quality = accepted.get(name, accepted.get("*", 0.0))
+        if name in available and quality > best:
+            encoding, best = name, quality
+    return encoding
+
+def redirect_to_artifact(key:str):
+    """ Redirect an unversioned boundary request to the current baked artifact
+
+    Args:
+        key (str): Manifest key
+    Returns:
+        (HttpResponse): Redirect to the content-hashed artifact URL, None when no artifact exists
+    """
+    entry = load_manifest().get(key)
+    if not entry:
+        return None
+
+    # Resolves against the /gis/ entry point to the /gis/artifacts/ route
+    response = HttpResponseRedirect(f"artifacts/{entry['file']}")
+    response["Cache-Control"] = ENTRY_CACHE_CONTROL
+    return response
+
+def serve_artifact(request, filename:str):
+    """ Serve a baked artifact straight from disk
+
+    Picks the best precompressed variant from Accept-Encoding and answers
+    conditional requests with 304.
+
+    Args:
+        request (HttpRequest): Incoming request
+        filename (str): Content-hashed artifact file name
+    Returns:
+        (HttpResponse): File or not-modified response, None when no artifact exists
+    """
+    load_manifest()
+    entry = _manifest_cache["files"].get(filename)
+    if not entry:
+        return None
+
+    encoding = choose_encoding(entry["encodings"], request.headers.get("Accept-Encoding", ""))
+    filename = entry["encodings"][encoding] if encoding else entry["file"]
+
+    # Strong validator per representation
+    etag = f'"{entry["etag"]}-{encoding}"' if encoding else f'"{entry["etag"]}"'
+
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        path = os.path.join(artifact_root(), filename)
+        try:
+            response = FileResponse(open(path, "rb"), content_type=ARTIFACT_CONTENT_TYPE)
+        except FileNotFoundError:
+            return None
+        if encoding:
+            response["Content-Encoding"] = encoding
+
+    response["ETag"] = etag
+    response["Cache-Control"] = ARTIFACT_CACHE_CONTROL
+    response["Vary"] = "Accept-Encoding"
+    return response
+
+def _write_atomic(path:str, data:bytes):
+    """ Write a file through a temporary name so readers never see partial data """
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
@@ -0,0 +1,94 @@
+""" Module for the per-worker cache of prepared municipal boundary geometries
+
+Boundaries are fetched from PostGIS as WKB through the mid crosswalk in a
+single query, decoded and prepared once, and kept in an LRU bounded by the
+total number of coordinates held. Reloading boundaries bumps the boundaries
+data version, which empties every worker's cache on its next lookup.
+"""
+
+import threading
+from collections import OrderedDict
+
+import shapely
+
+from django.contrib.gis.db.models.functions import AsWKB
+from django.db.models import F
+
+from finance_viewer.lib.cache_versions import get_data_version
+from finance_viewer.lib.gis import MUNICIPAL_BOUNDARY_FIELDS
+from finance_viewer.models.gis_boundaries import MunicipalBoundaries
+
+BOUNDARY_VERSION = "boundaries"
+
+# Coordinates held across all cached boundaries, about 16 bytes each plus
+# the prepared geometry's index
+MAX_CACHED_COORDINATES = 2_000_000
+
+
+class CachedBoundary:
+    """ Prepared boundary geometry (EPSG:4269) and properties of one municipality """
+
+    def __init__(self, mid:str, geometry, properties:dict):
+        self.mid = mid
+        self.geometry = geometry
+        self.properties = properties
+        shapely.prepare(self.geometry)
+        self.size = max(int(shapely.get_num_coordinates(geometry)), 1)
+
+    def contains(self, lon:float, lat:float) -> bool:
+        """ Whether a NAD83 longitude/latitude lies inside the boundary """
+
+        return bool(shapely.contains_xy(self.geometry, lon, lat))
+
+
+_lock = threading.Lock()
+_boundaries = OrderedDict()
+_local = {"version": None, "size": 0}
+
+def load_boundary(mid:str) -> CachedBoundary | None:
+    """ Fetch a municipality's full resolution boundary, None when it has none """
+
+    row = MunicipalBoundaries.objects.using('gis_boundaries').filter(
+        crosswalk__mid=mid, geometry__isnull=False
+    ).annotate(
+        wkb=AsWKB(F('geometry'))
+    ).values_list(*MUNICIPAL_BOUNDARY_FIELDS, 'wkb').first()
+
+    if row is None:
+        return None
+
+    return CachedBoundary(
+        mid, shapely.from_wkb(bytes(row[-1])), dict(zip(MUNICIPAL_BOUNDARY_FIELDS, row[:-1]))
+    )
+
+def get_municipality_boundary(mid:str) -> CachedBoundary | None:
+    """ Get a municipality's prepared boundary from this worker's cache
+
+    Args:
+        mid (str): Municipality ID
+    Returns:
+        (CachedBoundary): Boundary, None when the municipality has none
+    """
+    mid = str(mid)
+    version = get_data_version(BOUNDARY_VERSION)
+
+    with _lock:
+        if _local["version"] != version:
+            _boundaries.clear()
+            _local.update(version=version, size=0)
+        if mid in _boundaries:
+            _boundaries.move_to_end(mid)
+            return _boundaries[mid]
+
+    boundary = load_boundary(mid)
+    size = boundary.size if boundary is not None else 1
+
+    with _lock:
+        if _local["version"] == version and mid not in _boundaries:
+            # Missing boundaries are cached too, so they cost one query per version
+            _boundaries[mid] = boundary
+            _local["size"] += size
+            while _local["size"] > MAX_CACHED_COORDINATES and len(_boundaries) > 1:
+                _, evicted = _boundaries.popitem(last=False)
+                _local["size"] -= evicted.size if evicted is not None else 1
+    return boundary
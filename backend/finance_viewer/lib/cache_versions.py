@@ -0,0 +1,61 @@
+""" Module for shared data version counters used to invalidate worker caches
+
+Counters live in the data_versions table of the default database, where a
+bump is a single atomic upsert. Workers look a counter up at most every
+VERSION_RECHECK_SECONDS, so a change made by another worker is seen within
+that interval.
+"""
+
+import threading
+import time
+
+from django.db import connections
+
+from finance_viewer.models.data_versions import DataVersion
+
+VERSION_RECHECK_SECONDS = 5
+
+_lock = threading.Lock()
+_local = {}
+
+
+def _remember(name:str, version:int) -> int:
+    with _lock:
+        _local[name] = (version, time.monotonic())
+    return version
+
+def get_data_version(name:str) -> int:
+    """ Get the current version of a dataset
+
+    Args:
+        name (str): Dataset name
+    Returns:
+        (int): Version counter, starting at 1
+    """
+    with _lock:
+        cached = _local.get(name)
+    if cached is not None and time.monotonic() - cached[1] < VERSION_RECHECK_SECONDS:
+        return cached[0]
+
+    version = DataVersion.objects.filter(name=name).values_list('version', flat=True).first()
+    return _remember(name, version or 1)
+
+def bump_data_version(name:str) -> int:
+    """ Mark a dataset as changed so every worker rebuilds its cached copy
+
+    Args:
+        name (str): Dataset name
+    Returns:
+        (int): New version counter
+    """
+    table = DataVersion._meta.db_table
+    with connections['default'].cursor() as cursor:
+        cursor.execute(f"""
+            INSERT INTO {table} (name, version) VALUES (%s, 2)
+            ON CONFLICT (name) DO UPDATE SET version = {table}.version + 1
+            RETURNING version
+        """, [name])
+        version = cursor.fetchone()[0]
+
+    # The bumping worker sees its own change straight away
+    return _remember(name, version)
@@ -0,0 +1,142 @@
+""" Module for nationwide choropleth values in a compact binary encoding """
+
+import hashlib
+import json
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from finance_viewer.lib.expressions import normalize_expression
+from finance_viewer.lib.metrics import FinanceCube
+
+DEFAULT_CLASSES = 5
+MAX_CLASSES = 12
+
+# Layers kept per worker, oldest evicted first
+CACHE_SIZE = 64
+
+BINARY_CONTENT_TYPE = "application/octet-stream"
+
+
+class ChoroplethLayer:
+    """ One metric for one year across every municipality of a cube
+
+    Values are float32 in the cube's mid order, NaN where there is no data.
+    """
+
+    def __init__(self, metric:str, year:int, version:int, values:np.ndarray, breaks:list[float]):
+        self.metric = metric
+        self.year = year
+        self.version = version
+        self.values = values
+        self.breaks = breaks
+        self.binary = self._encode_binary()
+        self.etag = f'"{hashlib.sha1(self.binary).hexdigest()}"'
+
+    def header(self) -> dict:
+        return {
+            "metric": self.metric,
+            "year": self.year,
+            "version": self.version,
+            "count": int(self.values.size),
+            "breaks": self.breaks,
+        }
+
+    def _encode_binary(self) -> bytes:
+        """ uint32 header length, JSON header padded to 4 bytes, little-endian float32 values """
+
+        header = json.dumps(self.header(), separators=(",", ":")).encode("utf-8")
+        header += b" " * (-(len(header) + 4) % 4)
+        return struct.pack("<I", len(header)) + header + self.values.astype("<f4").tobytes()
+
+
+def quantile_breaks(values:np.ndarray, classes:int) -> list[float]:
+    """ Quantile class breaks over the finite values
+
+    Args:
+        values (ndarray): Metric values, NaN ignored
+        classes (int): Number of classes
+    Returns:
+        (list): classes + 1 ascending break values, empty when there is no data
+    """
+    finite = values[np.isfinite(values)]
+    if classes <= 0 or finite.size == 0:
+        return []
+    return np.quantile(finite, np.linspace(0, 1, classes + 1)).tolist()
+
+def build_choropleth(cube:FinanceCube, metric:str, year:int, classes:int = DEFAULT_CLASSES) -> ChoroplethLayer:
+    """ Compute a choropleth layer from the finance cube
+
+    Args:
+        cube (FinanceCube): Finance cube
+        metric (str): Raw, derived or custom metric expression
+        year (int): Fiscal year
+        classes (int): Number of quantile classes, 0 for none
+    Returns:
+        (ChoroplethLayer): Layer
+    """
+    position = cube.year_position(year)
+    if position is None:
+        raise KeyError(f"No data for year {year}.")
+
+    column = cube.metric(metric)[:, position].astype(np.float32)
+    return ChoroplethLayer(metric, year, cube.version, column, quantile_breaks(column, classes))
+
+
+_lock = threading.Lock()
+_layers = OrderedDict()
+# Encoded mid index of the latest cube version
+_mid_index = {"version": None, "payload": None}
+
+def get_choropleth(cube:FinanceCube, metric:str, year:int, classes:int = DEFAULT_CLASSES) -> ChoroplethLayer:
+    """ Get a cached choropleth layer for (metric, year, classes, data version)
+
+    Args:
+        cube (FinanceCube): Finance cube
+        metric (str): Raw, derived or custom metric expression
+        year (int): Fiscal year
+        classes (int): Number of quantile classes
+    Returns:
+        (ChoroplethLayer): Layer
+    """
+    classes = max(0, min(classes, MAX_CLASSES))
+    metric = normalize_expression(metric)
+    key = (metric, year, classes, cube.version)
+
+    with _lock:
+        layer = _layers.get(key)
+        if layer is not None:
+            _layers.move_to_end(key)
+            return layer
+
+    layer = build_choropleth(cube, metric, year, classes)
+
+    with _lock:
+        _layers[key] = layer
+        while len(_layers) > CACHE_SIZE:
+            _layers.popitem(last=False)
+    return layer
+
+def mid_index_payload(cube:FinanceCube) -> tuple[bytes, str]:
+    """ JSON list of mids in cube order, which every layer's values follow
+
+    Encoded once per cube version.
+
+    Returns:
+        (tuple): Encoded payload and its ETag
+    """
+    with _lock:
+        if _mid_index["version"] == cube.version:
+            return _mid_index["payload"]
+
+    payload = json.dumps(
+        {"version": cube.version, "mids": cube.mids.tolist()}, separators=(",", ":")
+    ).encode("utf-8")
+    encoded = payload, f'"{hashlib.sha1(payload).hexdigest()}"'
+
+    with _lock:
+        _mid_index["version"] = cube.version
+        _mid_index["payload"] = encoded
+    return encoded
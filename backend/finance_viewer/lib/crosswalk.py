@@ -0,0 +1,98 @@
+""" Module for the municipality mid to municipal boundary crosswalk
+
+Municipalities (municipal_finance database) are matched to boundaries
+(gis_boundaries database) on state, county FIPS and name. The
+build_boundary_crosswalk command rebuilds the whole table; municipalities
+created later are linked as they are added.
+"""
+
+from django.db import connections, transaction
+
+from finance_viewer.lib.boundary_cache import BOUNDARY_VERSION
+from finance_viewer.lib.cache_versions import bump_data_version
+
+CROSSWALK_TABLE = "municipal_boundary_crosswalk"
+
+SCHEMA_SQL = [
+    """
+    ALTER TABLE municipal_boundaries
+    ADD COLUMN IF NOT EXISTS county_fips5 text
+    GENERATED ALWAYS AS (substr(fips_code, 1, 5)) STORED
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS municipal_boundaries_match_idx
+    ON municipal_boundaries (state, county_fips5, municipal_name)
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {CROSSWALK_TABLE} (
+        mid uuid PRIMARY KEY,
+        boundary_id bigint NOT NULL
+    )
+    """,
+    f"""
+    CREATE INDEX IF NOT EXISTS {CROSSWALK_TABLE}_boundary_idx
+    ON {CROSSWALK_TABLE} (boundary_id)
+    """,
+]
+
+
+def match_boundaries(cursor, municipalities:list[tuple]) -> int:
+    """ Insert or update the crosswalk rows of municipalities
+
+    Args:
+        cursor (CursorWrapper): gis_boundaries cursor inside a transaction
+        municipalities (list): (mid, state, county_fips, name) tuples
+    Returns:
+        (int): Municipalities matched to a boundary
+    """
+    cursor.execute("""
+        CREATE TEMP TABLE crosswalk_source (
+            mid uuid,
+            state text,
+            county_fips text,
+            name text
+        ) ON COMMIT DROP
+    """)
+    with cursor.copy("COPY crosswalk_source (mid, state, county_fips, name) FROM STDIN") as copy:
+        for row in municipalities:
+            copy.write_row(row)
+
+    # First boundary wins when a municipality matches several
+    cursor.execute(f"""
+        INSERT INTO {CROSSWALK_TABLE} (mid, boundary_id)
+        SELECT DISTINCT ON (s.mid) s.mid, b.id
+        FROM crosswalk_source s
+        JOIN municipal_boundaries b
+            ON b.state = s.state
+            AND b.county_fips5 = s.county_fips
+            AND b.municipal_name = s.name
+        ORDER BY s.mid, b.id
+        ON CONFLICT (mid) DO UPDATE SET boundary_id = EXCLUDED.boundary_id
+    """)
+    return cursor.rowcount
+
+def link_municipality_boundaries(municipalities:list[tuple]) -> int:
+    """ Add crosswalk rows for newly created municipalities
+
+    Nothing is linked before build_boundary_crosswalk has created the table,
+    since that command matches every municipality.
+
+    Args:
+        municipalities (list): (mid, state, county_fips, name) tuples
+    Returns:
+        (int): Municipalities matched to a boundary
+    """
+    if not municipalities:
+        return 0
+
+    with transaction.atomic(using='gis_boundaries'):
+        with connections['gis_boundaries'].cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [CROSSWALK_TABLE])
+            if not cursor.fetchone()[0]:
+                return 0
+            matched = match_boundaries(cursor, municipalities)
+
+    if matched:
+        # Workers drop cached boundary misses for these mids on the next lookup
+        bump_data_version(BOUNDARY_VERSION)
+    return matched
@@ -0,0 +1,162 @@
+""" Module for the precomputed derived metrics table
+
+municipal_derived_metrics holds one row per (mid, year) with every standard
+derived ratio as a float column, computed in Postgres from the compiled
+metric expressions. The rebuild_derived_metrics command creates the table
+and computes every row; after that, rows are refreshed whenever finance rows
+are written.
+"""
+
+import logging
+
+import numpy as np
+
+from django.db import connections
+
+from finance_viewer.lib.expressions import compile_expression
+from finance_viewer.lib.finance import finance_filters
+from finance_viewer.lib.metric_definitions import DERIVED_METRICS
+
+DERIVED_TABLE = "municipal_derived_metrics"
+
+logger = logging.getLogger(__name__)
+
+# Derived metric name: SQL expression over municipal_finances columns
+DERIVED_SQL = {name: compile_expression(expression).sql for name, expression in DERIVED_METRICS.items()}
+
+SCHEMA_SQL = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {DERIVED_TABLE} (
+        mid uuid NOT NULL,
+        year integer NOT NULL,
+        updated_at timestamptz NOT NULL DEFAULT now(),
+        PRIMARY KEY (mid, year)
+    )
+    """,
+    *[
+        f"ALTER TABLE {DERIVED_TABLE} ADD COLUMN IF NOT EXISTS {name} double precision"
+        for name in DERIVED_METRICS
+    ],
+    # Ranking, screening and map queries read one metric across a year
+    *[
+        f"CREATE INDEX IF NOT EXISTS {DERIVED_TABLE}_{name}_idx ON {DERIVED_TABLE} (year, {name})"
+        for name in DERIVED_METRICS
+    ],
+]
+
+
+def _upsert_sql(where:str = "") -> str:
+    """ INSERT ... SELECT computing every derived metric for the matching finance rows """
+
+    columns = ", ".join(DERIVED_SQL)
+    values = ", ".join(DERIVED_SQL.values())
+    updates = ", ".join(f"{name} = EXCLUDED.{name}" for name in DERIVED_SQL)
+    return f"""
+        INSERT INTO {DERIVED_TABLE} (mid, year, {columns}, updated_at)
+        SELECT mid, year, {values}, now()
+        FROM municipal_finances
+        {where}
+        ON CONFLICT (mid, year) DO UPDATE SET {updates}, updated_at = EXCLUDED.updated_at
+    """
+
+def derived_table_exists(cursor) -> bool:
+    """ Whether municipal_derived_metrics has been created """
+
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [DERIVED_TABLE])
+    return cursor.fetchone()[0]
+
+def refresh_derived_metrics(mids:list[str], years:list[int], cursor=None) -> int:
+    """ Recompute the derived metrics of specific finance rows
+
+    Nothing is written before rebuild_derived_metrics has created the
+    table, since that command computes every row.
+
+    Args:
+        mids (list): Municipality IDs, paired with years
+        years (list): Fiscal years, paired with mids
+        cursor (CursorWrapper): municipal_finance cursor to run in, a new one when None
+    Returns:
+        (int): Rows written
+    """
+    if not mids:
+        return 0
+
+    if cursor is None:
+        with connections['municipal_finance'].cursor() as cursor:
+            return refresh_derived_metrics(mids, years, cursor)
+
+    if not derived_table_exists(cursor):
+        logger.warning("%s does not exist, run rebuild_derived_metrics to create it", DERIVED_TABLE)
+        return 0
+
+    cursor.execute(_upsert_sql("""
+        WHERE (mid, year) IN (
+            SELECT * FROM unnest(%s::uuid[], %s::integer[])
+        )
+    """), [list(mids), list(years)])
+    return cursor.rowcount
+
+def rebuild_derived_metrics(cursor) -> int:
+    """ Create the table if needed and recompute every row
+
+    Args:
+        cursor (CursorWrapper): municipal_finance cursor inside a transaction
+    Returns:
+        (int): Rows written
+    """
+    for statement in SCHEMA_SQL:
+        cursor.execute(statement)
+
+    cursor.execute(f"TRUNCATE {DERIVED_TABLE}")
+    cursor.execute(_upsert_sql())
+    return cursor.rowcount
+
+def query_derived_metrics(names:list[str] | None = None, mids:list[str] | None = None,
+                          start_year:int | None = None, end_year:int | None = None) -> dict | None:
+    """ Read derived metrics from municipal_derived_metrics
+
+    Args:
+        names (list): Derived metric names, all when None
+        mids (list): Municipality ids (UUIDs), all when None
+        start_year (int): First year (inclusive)
+        end_year (int): Last year (inclusive)
+    Returns:
+        (dict): mids, contiguous years and {name: (municipality, year) array},
+            NaN where missing; None when the table has not been built
+    """
+    names = names or list(DERIVED_METRICS)
+    unknown = [name for name in names if name not in DERIVED_METRICS]
+    if unknown:
+        raise KeyError(f"Unknown derived metric(s): {', '.join(unknown)}.")
+
+    # Names are validated against the derived metric definitions
+    columns = ", ".join(f"COALESCE({name}, 'NaN')" for name in names)
+    where, params = finance_filters(mids, start_year, end_year)
+
+    with connections['municipal_finance'].cursor() as cursor:
+        if not derived_table_exists(cursor):
+            return None
+        cursor.execute(f"SELECT mid::text, year, {columns} FROM {DERIVED_TABLE} {where}", params)
+        rows = cursor.fetchall()
+
+    if not rows:
+        return {
+            "mids": np.array([], dtype=object),
+            "years": np.array([], dtype=np.int32),
+            "metrics": {name: np.empty((0, 0)) for name in names},
+        }
+
+    found = {row[0] for row in rows}
+    ordered = [mid for mid in dict.fromkeys(mids) if mid in found] if mids is not None else sorted(found)
+    positions = {mid: i for i, mid in enumerate(ordered)}
+    row_years = np.array([row[1] for row in rows], dtype=np.int32)
+    years = np.arange(row_years.min(), row_years.max() + 1, dtype=np.int32)
+
+    values = np.full((len(ordered), len(years), len(names)), np.nan)
+    values[[positions[row[0]] for row in rows], row_years - years[0]] = np.array([row[2:] for row in rows], dtype=np.float64)
+
+    return {
+        "mids": np.array(ordered, dtype=object),
+        "years": years,
+        "metrics": {name: values[:, :, i] for i, name in enumerate(names)},
+    }
@@ -0,0 +1,83 @@
+""" Module for the versioned municipality directory cache """
+
+import hashlib
+import json
+import threading
+
+from django.core.cache import cache
+
+from finance_viewer.lib.cache_versions import get_data_version
+from finance_viewer.models.municipal_finance import Municipalities
+
+# Version counter bumped whenever a municipality is added
+DIRECTORY_VERSION = "municipality_directory"
+
+DIRECTORY_FIELDS = ['mid', 'name', 'state', 'county_fips']
+
+# Superseded versions age out of the shared cache
+DIRECTORY_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
+OBJECTS_FORMAT = "objects"
+COMPACT_FORMAT = "compact"
+DIRECTORY_FORMATS = (OBJECTS_FORMAT, COMPACT_FORMAT)
+
+_lock = threading.Lock()
+_local = {"directory": None}
+
+
+class MunicipalityDirectory:
+    """ Immutable snapshot of the municipality directory with pre-encoded payloads """
+
+    def __init__(self, version:int, rows:list[list]):
+        self.version = version
+        self.rows = rows
+
+        compact = json.dumps(
+            {"version": version, "fields": DIRECTORY_FIELDS, "rows": rows},
+            separators=(",", ":")
+        ).encode("utf-8")
+        objects = json.dumps(
+            [dict(zip(DIRECTORY_FIELDS, row)) for row in rows],
+            separators=(",", ":")
+        ).encode("utf-8")
+
+        self.payloads = {COMPACT_FORMAT: compact, OBJECTS_FORMAT: objects}
+        self.etags = {
+            fmt: f'"{hashlib.sha1(payload).hexdigest()}"' for fmt, payload in self.payloads.items()
+        }
+
+
+def query_directory_rows() -> list[list]:
+    """ Get every municipality as [mid, name, state, county_fips] rows in one query """
+
+    qs = Municipalities.objects.using('municipal_finance').values_list(*DIRECTORY_FIELDS).order_by('state', 'name')
+    return [[str(mid), name, state, county_fips or ''] for mid, name, state, county_fips in qs]
+
+def get_municipality_directory() -> MunicipalityDirectory:
+    """ Get the municipality directory for the current version
+
+    Workers keep their own copy and only consult the shared cache (and, on a
+    cold cache, the database) when the directory version changes.
+
+    Returns:
+        (MunicipalityDirectory): Directory snapshot
+    """
+    version = get_data_version(DIRECTORY_VERSION)
+    directory = _local["directory"]
+    if directory is not None and directory.version == version:
+        return directory
+
+    with _lock:
+        directory = _local["directory"]
+        if directory is not None and directory.version == version:
+            return directory
+
+        cache_key = f"{DIRECTORY_VERSION}:{version}"
+        rows = cache.get(cache_key)
+        if rows is None:
+            rows = query_directory_rows()
+            cache.set(cache_key, rows, timeout=DIRECTORY_CACHE_TIMEOUT)
+
+        directory = MunicipalityDirectory(version, rows)
+        _local["directory"] = directory
+        return directory
@@ -0,0 +1,218 @@
+""" Module for the custom metric expression language
+
+Expressions are arithmetic over municipal_finances fields, boundary
+attributes and the standard derived metrics, for example
+``(operating_grants + capital_grants) / total_revenues`` or
+``total_revenues / acres``. They are parsed and validated once, then
+compiled to a vectorized NumPy kernel and to a Postgres SQL expression.
+"""
+
+import ast
+import functools
+import math
+import operator
+from typing import Callable
+
+import numpy as np
+
+from finance_viewer.lib.metric_definitions import BOUNDARY_ATTRIBUTES, DERIVED_METRICS, METRIC_FIELDS
+
+MAX_EXPRESSION_LENGTH = 500
+MAX_EXPRESSION_DEPTH = 32
+
+_FIELDS = set(METRIC_FIELDS)
+
+_BINARY_OPERATORS = {
+    ast.Add: ("+", operator.add),
+    ast.Sub: ("-", operator.sub),
+    ast.Mult: ("*", operator.mul),
+    ast.Div: ("/", None),
+    ast.Pow: ("^", np.power),
+}
+
+_UNARY_OPERATORS = {
+    ast.USub: ("-", operator.neg),
+    ast.UAdd: ("+", operator.pos),
+}
+
+# name: (argument count, NumPy implementation, SQL template)
+_FUNCTIONS = {
+    "abs": (1, np.abs, "abs({0})"),
+    "sqrt": (1, np.sqrt, "CASE WHEN {0} >= 0 THEN sqrt({0}) END"),
+    "min": (2, np.fmin, "LEAST({0}, {1})"),
+    "max": (2, np.fmax, "GREATEST({0}, {1})"),
+}
+
+
+class ExpressionError(ValueError):
+    """ Exception for invalid custom metric expressions """
+
+
+def _divide(numerator, denominator):
+    """ Elementwise division with NaN wherever the denominator is zero or missing """
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = np.true_divide(numerator, denominator)
+    if np.ndim(result):
+        result[~np.isfinite(result)] = np.nan
+    elif not np.isfinite(result):
+        result = np.nan
+    return result
+
+
+class CompiledExpression:
+    """ Validated expression with its NumPy kernel and SQL translation """
+
+    def __init__(self, text:str, tree:ast.AST):
+        self.text = text
+        self.fields = set()
+        self.attributes = set()
+        self._kernel = self._compile(tree)
+        self.sql = None if self.attributes else self._to_sql(tree)
+
+    def evaluate(self, resolve:Callable[[str], np.ndarray]) -> np.ndarray:
+        """ Evaluate over arrays
+
+        Args:
+            resolve (Callable): Returns the array for a field or attribute name;
+                arrays must broadcast against each other
+        Returns:
+            (ndarray): float64 result, NaN where undefined
+        """
+        with np.errstate(invalid='ignore', over='ignore'):
+            return np.asarray(self._kernel(resolve), dtype=np.float64)
+
+    def _compile(self, node:ast.AST) -> Callable:
+        """ Turn the tree into nested closures over whole arrays """
+
+        if isinstance(node, ast.Constant):
+            value = float(node.value)
+            return lambda resolve: value
+
+        if isinstance(node, ast.Name):
+            if node.id in _FIELDS:
+                self.fields.add(node.id)
+            else:
+                self.attributes.add(node.id)
+            name = node.id
+            return lambda resolve: resolve(name)
+
+        if isinstance(node, ast.UnaryOp):
+            operand = self._compile(node.operand)
+            func = _UNARY_OPERATORS[type(node.op)][1]
+            return lambda resolve: func(operand(resolve))
+
+        if isinstance(node, ast.BinOp):
+            left = self._compile(node.left)
+            right = self._compile(node.right)
+            func = _BINARY_OPERATORS[type(node.op)][1] or _divide
+            return lambda resolve: func(left(resolve), right(resolve))
+
+        # Validated calls only
+        args = [self._compile(arg) for arg in node.args]
+        func = _FUNCTIONS[node.func.id][1]
+        return lambda resolve: func(*(arg(resolve) for arg in args))
+
+    def _to_sql(self, node:ast.AST) -> str:
+        """ Translate the tree to SQL over municipal_finances columns """
+
+        if isinstance(node, ast.Constant):
+            return repr(float(node.value))
+
+        if isinstance(node, ast.Name):
+            # Names are validated against the model's columns
+            return f'"{node.id}"::float8'
+
+        if isinstance(node, ast.UnaryOp):
+            return f"({_UNARY_OPERATORS[type(node.op)][0]}{self._to_sql(node.operand)})"
+
+        if isinstance(node, ast.BinOp):
+            left, right = self._to_sql(node.left), self._to_sql(node.right)
+            if isinstance(node.op, ast.Div):
+                return f"({left} / NULLIF({right}, 0))"
+            if isinstance(node.op, ast.Pow):
+                # NULL where NumPy gives NaN instead of letting Postgres raise
+                return (
+                    f"(CASE WHEN {left} < 0 AND {right} <> trunc({right}) THEN NULL"
+                    f" WHEN {left} = 0 AND {right} < 0 THEN NULL"
+                    f" ELSE power({left}, {right}) END)"
+                )
+            return f"({left} {_BINARY_OPERATORS[type(node.op)][0]} {right})"
+
+        template = _FUNCTIONS[node.func.id][2]
+        return template.format(*(self._to_sql(arg) for arg in node.args))
+
+
+def _validate(node:ast.AST, depth:int = 0) -> ast.AST:
+    """ Check the tree only uses supported syntax and names, expanding derived metrics """
+
+    if depth > MAX_EXPRESSION_DEPTH:
+        raise ExpressionError("Expression is nested too deeply.")
+
+    if isinstance(node, ast.Constant):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise ExpressionError(f"Unsupported constant {node.value!r}.")
+        if not math.isfinite(node.value):
+            raise ExpressionError("Constants must be finite.")
+        return node
+
+    if isinstance(node, ast.Name):
+        if node.id in DERIVED_METRICS:
+            return _validate(_parse(DERIVED_METRICS[node.id]), depth + 1)
+        if node.id not in _FIELDS and node.id not in BOUNDARY_ATTRIBUTES:
+            raise ExpressionError(f"Unknown metric '{node.id}'.")
+        return node
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        node.operand = _validate(node.operand, depth + 1)
+        return node
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        node.left = _validate(node.left, depth + 1)
+        node.right = _validate(node.right, depth + 1)
+        return node
+
+    if isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in _FUNCTIONS:
+            raise ExpressionError("Unsupported function call.")
+        if node.keywords or len(node.args) != _FUNCTIONS[node.func.id][0]:
+            raise ExpressionError(
+                f"{node.func.id}() takes {_FUNCTIONS[node.func.id][0]} argument(s)."
+            )
+        node.args = [_validate(arg, depth + 1) for arg in node.args]
+        return node
+
+    raise ExpressionError(f"Unsupported syntax '{type(node).__name__}'.")
+
+def _parse(text:str) -> ast.AST:
+    """ Parse expression text into an AST body """
+
+    if len(text) > MAX_EXPRESSION_LENGTH:
+        raise ExpressionError("Expression is too long.")
+    try:
+        return ast.parse(text.strip().replace("^", "**"), mode="eval").body
+    except SyntaxError as e:
+        raise ExpressionError(f"Invalid expression: {e.msg}.") from e
+
+@functools.lru_cache(maxsize=256)
+def _compile_normalized(normalized:str) -> CompiledExpression:
+    return CompiledExpression(normalized, _validate(_parse(normalized)))
+
+def normalize_expression(text:str) -> str:
+    """ Canonical text of an expression (whitespace and redundant parentheses removed) """
+
+    return ast.unparse(_parse(text))
+
+def compile_expression(text:str) -> CompiledExpression:
+    """ Parse, validate and compile an expression, cached by normalized text
+
+    Args:
+        text (str): Expression text
+    Returns:
+        (CompiledExpression): Compiled expression
+    Raises:
+        ExpressionError: When the expression is invalid
+    """
+    if not text or not text.strip():
+        raise ExpressionError("Expression is empty.")
+    return _compile_normalized(normalize_expression(text))
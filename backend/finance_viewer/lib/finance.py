@@ -1,58 +1,46 @@
 """ Module for handling finance data queries """
 
-from django.db import connections
+import json
+import uuid
+from typing import Iterator
 
-from finance_viewer.models.municipal_finance import Municipalities, MunicipalFinances
-from finance_viewer.schemas import MunicipalityInfo, MunicipalityFinance
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
 
-def query_all_municipalities() -> list[MunicipalityInfo]:
-    """
-    Get list of all municipalities
-    
-    Returns:
-        (list) : List of all municipalities
-    """
-    qs = Municipalities.objects.using('municipal_finance').all().values(
-        'mid', 'name', 'state', 'county_fips'
-    )
-    data = []
-    for row in qs:
-        fips = row['county_fips'] or ''
-        data.append({
-            'mid': str(row['mid']),
-            'name': row['name'],
-            'state': row['state'],
-            'county_fips': fips
-        })
-    return data
+from finance_viewer.lib.cache_versions import bump_data_version
+from finance_viewer.lib.crosswalk import link_municipality_boundaries
+from finance_viewer.lib.directory import DIRECTORY_VERSION
+from finance_viewer.lib.metric_definitions import METRIC_FIELDS
+from finance_viewer.lib.resolver import resolve_mids
+from finance_viewer.models.municipal_finance import MunicipalFinances
+from finance_viewer.schemas import MunicipalityFinance
+
+# Most municipalities accepted by one batch request
+MAX_BATCH_MIDS = 500
+
+# Rows fetched per round trip while streaming
+BATCH_CHUNK_SIZE = 2000
 
 def query_mid(name, state_abbr:str, county_fips:str) -> str | None:
     """
     Query municipality mid
 
+    Exact, normalized and fuzzy name matches within the county are accepted
+    above the resolver's confidence threshold.
+
     Args:
         name (str): Municipality name
         state_abbr (str): State abbreviation
         county_fips (str): County 5-digit FIPS code
     Returns:
-        (Municipalities): Municipality info
+        (str): Municipality ID, None when no municipality matches
     """
 
     if not all([name, state_abbr, county_fips]):
         raise ValueError("")
 
-    with connections['municipal_finances'].cursor() as cursor:
-        # Check if municipality exists
-        cursor.execute("""
-            SELECT mid FROM municipalities
-            WHERE name = %s AND state = %s AND county_fips = %s
-        """, [name, state_abbr, county_fips])
-        row = cursor.fetchone()
-
-        if row:
-            return row[0]
-
-    return None
+    match = resolve_mids([(name, state_abbr, county_fips)])[0]
+    return match["mid"] if match else None
 
 def query_finances_for_municipality(mid:str) -> list[MunicipalityFinance]:
     """ Get financial data for municipality
@@ -68,18 +56,158 @@ def query_finances_for_municipality(mid:str) -> list[MunicipalityFinance]:
     qs = MunicipalFinances.objects.using('municipal_finance').filter(mid=mid).order_by('year')
     return list(qs.values()) #serialize('json', qs)
 
+def query_finance_columns(mid:str, fields:list[str] | None = None) -> dict:
+    """ Get financial data for municipality as one float array per field
+
+    Only the requested numeric fields are selected, cast to float in the
+    database so no Decimal conversion happens per value.
+
+    Args:
+        mid (str): Municipality ID
+        fields (list): Numeric field names, all numeric fields when None
+    Returns:
+        (dict): {"years": [...], "fields": {name: [float | None, ...]}}
+    """
+    if not mid or mid == '':
+        raise ValueError("Unable to get finances for municipality. No mid provided.")
+
+    fields = list(dict.fromkeys(fields)) if fields else METRIC_FIELDS
+    unknown = [name for name in fields if name not in METRIC_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}.")
+
+    # Names are validated against the model's columns
+    columns = ", ".join(f"{name}::float8" for name in fields)
+    with connections['municipal_finance'].cursor() as cursor:
+        cursor.execute(f"""
+            SELECT year, {columns}
+            FROM municipal_finances
+            WHERE mid = %s
+            ORDER BY year
+        """, [mid])
+        rows = cursor.fetchall()
+
+    columns = list(zip(*rows)) if rows else [()] * (len(fields) + 1)
+    return {
+        "years": list(columns[0]),
+        "fields": {name: list(values) for name, values in zip(fields, columns[1:])}
+    }
+
+def new_municipality_mid(municipality_name:str, state_abbr:str) -> str:
+    """ Deterministic mid for a municipality that is not in the database yet """
+
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, state_abbr + municipality_name))
+
 def add_municipality(mid:str, municipality_name:str, state_abbr:str, county_fips:str):
     """
     Add municipality information
-    
+
+    The boundary crosswalk and directory version are updated once the
+    municipal_finance transaction commits.
+
     Args:
         mid (str): Municipality ID
         municipality_name (str): Municipality name
         state_abbr (str): State abbreviation
         county_fips (str): 5-digit county FIPS code
     """
-    with connections['municipal_finances'].cursor() as cursor:
+    with connections['municipal_finance'].cursor() as cursor:
         cursor.execute("""
             INSERT INTO municipalities (mid, name, state, county_fips)
             VALUES (%s, %s, %s, %s)
         """, [mid, municipality_name, state_abbr, county_fips])
+
+    def on_commit():
+        link_municipality_boundaries([(mid, state_abbr, county_fips, municipality_name)])
+        bump_data_version(DIRECTORY_VERSION)
+
+    transaction.on_commit(on_commit, using='municipal_finance')
+
+def query_expression_values(sql:str, mids:list[str] | None = None,
+                            start_year:int | None = None, end_year:int | None = None) -> list[tuple]:
+    """ Evaluate a compiled metric expression in Postgres
+
+    Args:
+        sql (str): SQL expression over municipal_finances columns, from compile_expression
+        mids (list): Municipality ids, all when None
+        start_year (int): First year (inclusive)
+        end_year (int): Last year (inclusive)
+    Returns:
+        (list): (mid, year, value) rows ordered by mid and year, value None where undefined
+    """
+    where, params = finance_filters(mids, start_year, end_year)
+
+    with connections['municipal_finance'].cursor() as cursor:
+        cursor.execute(f"""
+            SELECT mid::text, year, {sql}
+            FROM municipal_finances
+            {where}
+            ORDER BY mid, year
+        """, params)
+        return cursor.fetchall()
+
+def query_finances_for_municipalities(mids:list[str], start_year:int | None = None,
+                                      end_year:int | None = None) -> Iterator[bytes]:
+    """ Stream financial data for many municipalities from one query
+
+    The output is a JSON object mapping each requested mid to its rows sorted
+    by year. Rows go through the same QuerySet.values() conversion and
+    DjangoJSONEncoder as query_finances_for_municipality's, so both endpoints
+    serialize every field identically. Mids without data map to an empty list.
+
+    Args:
+        mids (list): Municipality IDs
+        start_year (int): First year (inclusive)
+        end_year (int): Last year (inclusive)
+    Returns:
+        (Iterator): Encoded JSON chunks
+    """
+    qs = MunicipalFinances.objects.using('municipal_finance').filter(mid__in=mids)
+    if start_year is not None:
+        qs = qs.filter(year__gte=start_year)
+    if end_year is not None:
+        qs = qs.filter(year__lte=end_year)
+    rows = qs.order_by('mid', 'year').values().iterator(chunk_size=BATCH_CHUNK_SIZE)
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+
+    yield b"{"
+    seen = set()
+    current = None
+    parts = []
+
+    for row in rows:
+        mid = str(row["mid_id"])
+        if mid != current:
+            if current is not None:
+                parts.append("],")
+            parts.append(f"{json.dumps(mid)}:[")
+            current = mid
+            seen.add(mid)
+        else:
+            parts.append(",")
+        parts.append(encoder.encode(row))
+
+        if len(parts) >= BATCH_CHUNK_SIZE:
+            yield "".join(parts).encode("utf-8")
+            parts = []
+
+    tail = "".join(parts) + ("" if current is None else "]")
+    missing = [f"{json.dumps(mid)}:[]" for mid in mids if mid not in seen]
+    if missing:
+        tail += ("," if current is not None else "") + ",".join(missing)
+    yield (tail + "}").encode("utf-8")
+
+def finance_filters(mids:list[str] | None, start_year:int | None, end_year:int | None) -> tuple[str, list]:
+    """ WHERE clause and parameters selecting municipal_finances rows """
+
+    conditions, params = [], []
+    if mids is not None:
+        conditions.append("mid = ANY(%s::uuid[])")
+        params.append(list(mids))
+    if start_year is not None:
+        conditions.append("year >= %s")
+        params.append(start_year)
+    if end_year is not None:
+        conditions.append("year <= %s")
+        params.append(end_year)
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
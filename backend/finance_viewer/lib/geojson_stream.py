@@ -0,0 +1,104 @@
+""" Module for streaming GeoJSON straight from PostGIS """
+
+from typing import Iterable, Iterator
+
+from django.contrib.gis.db.models.functions import AsGeoJSON, Transform
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+GEOJSON_FORMAT = "geojson"
+NDJSON_FORMAT = "ndjson"
+STREAM_FORMATS = {
+    GEOJSON_FORMAT: "application/geo+json",
+    NDJSON_FORMAT: "application/x-ndjson",
+}
+
+# Rows fetched per round trip from the server-side cursor
+CURSOR_CHUNK_SIZE = 2000
+
+# Output is flushed to the client in blocks of roughly this size
+FLUSH_BYTES = 64 * 1024
+
+COLLECTION_HEADER = b'{"type":"FeatureCollection","crs":{"type":"name","properties":{"name":"EPSG:4326"}},"features":['
+COLLECTION_FOOTER = b']}'
+
+_encoder = DjangoJSONEncoder(separators=(",", ":"))
+
+
+def iter_features(qs, fields:list[str], geometry, precision:int | None = None) -> Iterator[bytes]:
+    """ Encode each row of a queryset as a GeoJSON Feature
+
+    Geometry is rendered by PostGIS (EPSG:4326) and spliced into the output
+    as-is, and rows are read through a server-side cursor so memory stays
+    flat regardless of the number of features.
+
+    Args:
+        qs (QuerySet): Boundary queryset
+        fields (list): Property field names
+        geometry (Expression): Geometry expression to render
+        precision (int): Decimal digits kept in coordinates, 8 when None
+    Returns:
+        (Iterator): Encoded Feature objects
+    """
+    options = {} if precision is None else {"precision": precision}
+    rows = qs.annotate(
+        geojson=AsGeoJSON(Transform(geometry, 4326), **options)
+    ).values_list('pk', *fields, 'geojson').iterator(chunk_size=CURSOR_CHUNK_SIZE)
+
+    for row in rows:
+        pk, values, geojson = row[0], row[1:-1], row[-1]
+        properties = dict(zip(fields, values))
+        properties['pk'] = str(pk)
+
+        yield b"".join((
+            b'{"type":"Feature","id":',
+            _encoder.encode(pk).encode("utf-8"),
+            b',"properties":',
+            _encoder.encode(properties).encode("utf-8"),
+            b',"geometry":',
+            geojson.encode("utf-8") if geojson else b"null",
+            b"}"
+        ))
+
+def feature_collection_chunks(features:Iterable[bytes], header:bytes = COLLECTION_HEADER) -> Iterator[bytes]:
+    """ Wrap encoded features in a FeatureCollection document """
+
+    def parts():
+        yield header
+        first = True
+        for feature in features:
+            yield feature if first else b"," + feature
+            first = False
+        yield COLLECTION_FOOTER
+
+    return _buffered(parts())
+
+def ndjson_chunks(features:Iterable[bytes]) -> Iterator[bytes]:
+    """ Emit encoded features as newline-delimited JSON """
+
+    return _buffered(feature + b"\n" for feature in features)
+
+def stream_response(features:Iterable[bytes], fmt:str = GEOJSON_FORMAT) -> StreamingHttpResponse:
+    """ Stream encoded features as a FeatureCollection or NDJSON
+
+    Args:
+        features (Iterable): Encoded Feature objects
+        fmt (str): geojson or ndjson
+    Returns:
+        (StreamingHttpResponse): Streaming response
+    """
+    chunks = ndjson_chunks(features) if fmt == NDJSON_FORMAT else feature_collection_chunks(features)
+    return StreamingHttpResponse(chunks, content_type=STREAM_FORMATS[fmt], status=200)
+
+def _buffered(parts:Iterable[bytes]) -> Iterator[bytes]:
+    """ Coalesce small byte strings into blocks of about FLUSH_BYTES """
+
+    buffer, size = [], 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= FLUSH_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
@@ -1,105 +1,151 @@
 """ Module for handling GIS data queries """
 
-import json
+import threading
+import time
+from typing import Iterator
 
-from django.core.serializers import serialize
-from django.db.models import Q
-from django.db.models.functions import Substr
+from django.db import connections
+from django.db.models import F, FilteredRelation, Q, TextField
+from django.db.models.functions import Cast, Coalesce
 
-from finance_viewer.models.municipal_finance import Municipalities
-from finance_viewer.models.gis_boundaries import MunicipalBoundaries
+from finance_viewer.lib.geojson_stream import iter_features
+from finance_viewer.models.gis_boundaries import MunicipalBoundaries, StateBoundaries
+
+# Precomputed simplification levels, tolerance in degrees (SRID 4269).
+# Requests are served the coarsest level whose max_zoom covers the map zoom.
+BOUNDARY_RESOLUTIONS = {
+    "low": {"level": 1, "tolerance": 0.01, "max_zoom": 5},
+    "medium": {"level": 2, "tolerance": 0.001, "max_zoom": 9},
+    "high": {"level": 3, "tolerance": 0.0001, "max_zoom": 12},
+}
+FULL_RESOLUTION = "full"
+
+# Seconds before a missing simplified table is looked up again, so that
+# build_simplified_boundaries takes effect without restarting workers
+SIMPLIFIED_TABLE_RECHECK_SECONDS = 60
+
+_simplified_lock = threading.Lock()
+_simplified_tables = {}
+
+STATE_BOUNDARY_FIELDS = [
+    "statefp",
+    "statens",
+    "geoidfq",
+    "geoid",
+    "stusps",
+    "name",
+    "lsad",
+    "aland",
+    "awater"
+]
+
+MUNICIPAL_BOUNDARY_FIELDS = [
+    "municipal_name",
+    "municipal_code",
+    "municipal_type",
+    "county_name",
+    "state",
+    "gnis_id",
+    "fips_code",
+    "fips_name",
+    "pop_1990",
+    "pop_2000",
+    "pop_2010",
+    "pop_2020",
+    "sq_mi"
+]
+
+def resolve_boundary_level(resolution:str | None = None, zoom:int | None = None) -> int | None:
+    """ Get the precomputed simplification level for a request
 
-def query_state_municipalities(state_abbr:str):
-    """ Get state's municipal boundaries
-    
     Args:
-        state_abbr (str): State abbreviation
+        resolution (str): Named resolution (low, medium, high or full)
+        zoom (int): Map zoom level, used when no resolution is given
     Returns:
-        Municipal Boundaries
+        (int): Simplification level, None for full resolution geometry
     """
-    return Municipalities.objects.using('municipal_finance').filter(
-        state=state_abbr.upper()
-    ).values_list('county_fips', 'name', 'mid')
+    if resolution:
+        if resolution == FULL_RESOLUTION:
+            return None
+        if resolution not in BOUNDARY_RESOLUTIONS:
+            raise ValueError(f"Unknown boundary resolution '{resolution}'.")
+        return BOUNDARY_RESOLUTIONS[resolution]["level"]
 
-def query_state_municipal_boundaries(state_abbr:str, state_municipalities) -> object:
-    """ Get state's municipal boundaries
-    
-    Args:
-        state_abbr (str): State abbreviation
-    Returns:
-        Municipal Boundaries
+    if zoom is not None:
+        for option in sorted(BOUNDARY_RESOLUTIONS.values(), key=lambda o: o["max_zoom"]):
+            if zoom <= option["max_zoom"]:
+                return option["level"]
+
+    return None
+
+def _simplified_table_exists(table:str) -> bool:
+    """ Check whether build_simplified_boundaries has created a table
+
+    A table once found is assumed to stay, a missing one is looked up again
+    after SIMPLIFIED_TABLE_RECHECK_SECONDS.
     """
+    now = time.monotonic()
+    with _simplified_lock:
+        checked = _simplified_tables.get(table)
+    if checked is True or (checked is not None and now - checked < SIMPLIFIED_TABLE_RECHECK_SECONDS):
+        return checked is True
+
+    with connections['gis_boundaries'].cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [table])
+        exists = cursor.fetchone()[0]
+
+    with _simplified_lock:
+        _simplified_tables[table] = True if exists else now
+    return exists
+
+def _boundary_geometry(qs, level:int | None):
+    """ Annotate a boundary queryset with the geometry for a simplification level
+
+    Falls back to the full resolution geometry for boundaries that have not
+    been simplified yet, or for every boundary when build_simplified_boundaries
+    has not been run.
+    """
+    if level is None:
+        return qs, F('geometry')
+
+    simplified = qs.model._meta.get_field('simplified').related_model
+    if not _simplified_table_exists(simplified._meta.db_table):
+        return qs, F('geometry')
+
+    qs = qs.annotate(
+        simplified_level=FilteredRelation('simplified', condition=Q(simplified__level=level))
+    )
+    return qs, Coalesce(F('simplified_level__geometry'), F('geometry'))
+
+def query_state_boundaries(level:int | None = None) -> Iterator[bytes]:
+    """ Get all state boundaries
 
-    # Create filter conditions
-    condition1 = Q(state=state_abbr.upper())
-    condition2 = Q()
-    for county_fips, name, _ in state_municipalities:
-        condition2 |= Q(county_fips5=county_fips, municipal_name=name)
-
-    # Query boundaries using combined conditions
-    qs = MunicipalBoundaries.objects.using('gis_boundaries').annotate(
-        county_fips5=Substr('fips_code', 1, 5)
-    ).filter(condition1 & condition2)
-
-    # Serialize boundaries
-    geojson = serialize("geojson", qs, geometry_field="geometry", fields=[
-        "id",
-        "municipal_name",
-        "municipal_code",
-        "municipal_type",
-        "county_name",
-        "state",
-        "gnis_id",
-        "fips_code",
-        "fips_name",
-        "pop_1990",
-        "pop_2000",
-        "pop_2010",
-        "pop_2020",
-        "sq_mi"
-    ])
-    return json.loads(geojson)
-
-def query_municipality_boundary(mid):
-    """ Get municipality boundary GeoJSON by mid 
-    
     Args:
-        mid (str): Municipal ID
+        level (int): Simplification level, None for full resolution
     Returns:
-        (object) : Municipal boundary spatial data
+        (Iterator): Encoded state boundary GeoJSON features
     """
+    qs, geometry = _boundary_geometry(StateBoundaries.objects.using('gis_boundaries').all(), level)
+    return iter_features(qs, STATE_BOUNDARY_FIELDS, geometry)
 
-    municipality = Municipalities.objects.using('municipal_finance').filter(mid=mid).first()
+def query_state_municipal_boundaries(state_abbr:str, level:int | None = None) -> Iterator[bytes]:
+    """ Get state's municipal boundaries
 
-    if not municipality:
-        return None
+    Only boundaries linked to a municipality through the crosswalk table are
+    returned, with the municipality mid attached as a property.
 
-    name = municipality.name
-    state_abbr = municipality.state
-    county_fips = municipality.county_fips
+    Args:
+        state_abbr (str): State abbreviation
+        level (int): Simplification level, None for full resolution
+    Returns:
+        (Iterator): Encoded municipal boundary GeoJSON features
+    """
 
-    qs = MunicipalBoundaries.objects.using('gis_boundaries').annotate(
-        county_fips5=Substr('fips_code', 1, 5)
-    ).filter(
-        state=state_abbr,
-        county_fips5=county_fips,
-        municipal_name=name
-    )
+    qs = MunicipalBoundaries.objects.using('gis_boundaries').filter(
+        state=state_abbr.upper()
+    ).annotate(
+        mid=Cast('crosswalk__mid', TextField())
+    ).filter(mid__isnull=False)
 
-    geojson = serialize("geojson", qs, geometry_field="geometry", fields=[
-        "id",
-        "municipal_name",
-        "municipal_code",
-        "municipal_type",
-        "county_name",
-        "state",
-        "gnis_id",
-        "fips_code",
-        "fips_name",
-        "pop_1990",
-        "pop_2000",
-        "pop_2010",
-        "pop_2020",
-        "sq_mi"
-    ])
-    return json.loads(geojson)
+    qs, geometry = _boundary_geometry(qs, level)
+    return iter_features(qs, MUNICIPAL_BOUNDARY_FIELDS + ["mid"], geometry)
@@ -0,0 +1,367 @@
+""" Module for bulk loading ACFR finance rows from CSV or Parquet files
+
+Rows are validated column by column with pandas, municipalities are
+resolved (or created) with one query per file, and the valid rows are
+copied into a temporary staging table and upserted into municipal_finances
+in a single statement. Rows that fail validation are left out and reported
+by row number (1-based, header excluded).
+"""
+
+import numpy as np
+import pandas as pd
+
+from django.db import connections, transaction
+from django.db.models import CharField, DecimalField, FloatField, IntegerField, TextField
+
+from finance_viewer.lib.cache_versions import bump_data_version
+from finance_viewer.lib.crosswalk import link_municipality_boundaries
+from finance_viewer.lib.derived_metrics import refresh_derived_metrics
+from finance_viewer.lib.directory import DIRECTORY_VERSION
+from finance_viewer.lib.finance import new_municipality_mid
+from finance_viewer.lib.metrics import FINANCE_VERSION
+from finance_viewer.lib.resolver import EXACT_MATCH, FUZZY_MATCH, NORMALIZED_MATCH, resolve_mids
+from finance_viewer.lib.state_utils import STATE_ABBREVIATIONS
+from finance_viewer.models.municipal_finance import Municipalities, MunicipalFinances
+
+# Columns identifying the municipality of rows without a mid
+IDENTITY_COLUMNS = ['municipality_name', 'state', 'county_fips']
+
+# municipal_finances columns set by the loader rather than the file
+MANAGED_COLUMNS = ['mid', 'year', 'created_at', 'modifier']
+
+_VALUE_FIELDS = [
+    field for field in MunicipalFinances._meta.concrete_fields if field.column not in MANAGED_COLUMNS
+]
+NUMERIC_COLUMNS = [f.column for f in _VALUE_FIELDS if isinstance(f, (DecimalField, FloatField))]
+INTEGER_COLUMNS = [f.column for f in _VALUE_FIELDS if isinstance(f, IntegerField)]
+TEXT_COLUMNS = [f.column for f in _VALUE_FIELDS if isinstance(f, (CharField, TextField))]
+VALUE_COLUMNS = [f.column for f in _VALUE_FIELDS]
+
+MIN_YEAR = 1900
+MAX_YEAR = 2100
+
+# Conflict policies for (mid, year) rows that already exist
+UPDATE = "update"
+SKIP = "skip"
+CONFLICT_POLICIES = [UPDATE, SKIP]
+
+BULK_MODIFIER = "bulk"
+MODIFIER_MAX_LENGTH = MunicipalFinances._meta.get_field('modifier').max_length
+NAME_MAX_LENGTH = Municipalities._meta.get_field('name').max_length
+
+# Rows encoded per COPY write
+COPY_BATCH_SIZE = 50000
+
+PARQUET_MAGIC = b"PAR1"
+
+_UUID_PATTERN = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+
+
+class IngestError(ValueError):
+    """ A finance file that cannot be loaded at all """
+
+
+def read_finance_file(source) -> pd.DataFrame:
+    """ Read a CSV or Parquet file of finance rows
+
+    CSV values are kept as strings so validation can report what was in the file.
+
+    Args:
+        source (str | file): Path or binary file object
+    Returns:
+        (DataFrame): Rows with lowercased column names
+    """
+    if hasattr(source, "read"):
+        magic = source.read(len(PARQUET_MAGIC))
+        source.seek(0)
+    else:
+        with open(source, "rb") as f:
+            magic = f.read(len(PARQUET_MAGIC))
+
+    try:
+        if magic == PARQUET_MAGIC:
+            frame = pd.read_parquet(source)
+        else:
+            frame = pd.read_csv(source, dtype=str, skipinitialspace=True)
+    except (ValueError, OSError, UnicodeDecodeError, pd.errors.ParserError) as e:
+        raise IngestError(f"Unreadable finance file: {e}") from e
+
+    frame.columns = [str(column).strip().lower() for column in frame.columns]
+    return frame
+
+def _row_errors(index, column:str, message:str) -> pd.DataFrame:
+    return pd.DataFrame({"row": np.asarray(index) + 1, "column": column, "error": message})
+
+def _strings(series:pd.Series) -> pd.Series:
+    """ Stripped strings, NA where empty """
+
+    values = series.astype("string").str.strip()
+    return values.mask(values == "")
+
+def _parse_numbers(series:pd.Series) -> tuple[pd.Series, pd.Series]:
+    """ Parse numbers written as 1234.5, "1,234.5", "$1,234" or "(1,234)"
+
+    Returns:
+        (tuple): Float values and a mask of non-empty values that did not parse
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        values = series.astype(float)
+        return values, pd.Series(False, index=series.index)
+
+    text = _strings(series)
+    cleaned = text.str.replace(r"[,$\s]", "", regex=True).str.replace(r"^\((.*)\)$", r"-\1", regex=True)
+    values = pd.to_numeric(cleaned, errors="coerce").astype(float)
+    invalid = text.notna() & ~np.isfinite(values)
+    return values.where(~invalid), invalid
+
+def validate_finance_rows(frame:pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """ Validate and convert finance rows column-wise
+
+    Args:
+        frame (DataFrame): Rows from read_finance_file
+    Returns:
+        (tuple): Valid rows (mid or identity columns, year and the value
+            columns present in the file) and a row, column, error frame
+    """
+    unknown = sorted(set(frame.columns) - set(VALUE_COLUMNS) - set(IDENTITY_COLUMNS) - {'mid', 'year'})
+    if unknown:
+        raise IngestError(f"Unknown column(s): {', '.join(unknown)}.")
+    if 'year' not in frame.columns:
+        raise IngestError("Missing column: year.")
+    if 'mid' not in frame.columns and not set(IDENTITY_COLUMNS) <= set(frame.columns):
+        raise IngestError(f"Rows need a mid column or all of: {', '.join(IDENTITY_COLUMNS)}.")
+
+    frame = frame.reset_index(drop=True)
+    rows = pd.DataFrame(index=frame.index)
+    errors = []
+
+    years, invalid = _parse_numbers(frame['year'])
+    invalid |= years.isna() | (years % 1 != 0) | (years < MIN_YEAR) | (years > MAX_YEAR)
+    errors.append(_row_errors(frame.index[invalid], 'year', f"year must be a whole number from {MIN_YEAR} to {MAX_YEAR}"))
+    rows['year'] = years.where(~invalid).astype("Int64")
+
+    rows['mid'] = _strings(frame['mid']).str.lower() if 'mid' in frame.columns else pd.Series(pd.NA, index=frame.index, dtype="string")
+    invalid = rows['mid'].notna() & ~rows['mid'].str.fullmatch(_UUID_PATTERN).fillna(False)
+    errors.append(_row_errors(frame.index[invalid], 'mid', "mid is not a UUID"))
+    rows.loc[invalid, 'mid'] = pd.NA
+
+    needs_identity = rows['mid'].isna()
+    if set(IDENTITY_COLUMNS) <= set(frame.columns):
+        rows['municipality_name'] = _strings(frame['municipality_name'])
+
+        # Full state names or two letter abbreviations
+        state = _strings(frame['state'])
+        abbreviations = set(STATE_ABBREVIATIONS.values())
+        rows['state'] = state.str.upper().where(
+            state.str.upper().isin(abbreviations), state.str.title().map(STATE_ABBREVIATIONS)
+        ).astype("string")
+
+        fips = _strings(frame['county_fips']).str.replace(r"\.0$", "", regex=True)
+        rows['county_fips'] = fips.where(fips.str.fullmatch(r"\d{1,5}").fillna(False)).str.zfill(5)
+
+        too_long = needs_identity & (rows['municipality_name'].str.len() > NAME_MAX_LENGTH).fillna(False)
+        errors.append(_row_errors(frame.index[too_long], 'municipality_name', f"municipality_name is longer than {NAME_MAX_LENGTH} characters"))
+
+        for column in IDENTITY_COLUMNS:
+            invalid = needs_identity & rows[column].isna()
+            errors.append(_row_errors(frame.index[invalid], column, f"{column} is missing or invalid"))
+    else:
+        errors.append(_row_errors(frame.index[needs_identity], 'mid', "mid is missing"))
+
+    for column in [c for c in NUMERIC_COLUMNS + INTEGER_COLUMNS if c in frame.columns]:
+        values, invalid = _parse_numbers(frame[column])
+        if column in INTEGER_COLUMNS:
+            fractional = values.notna() & (values % 1 != 0)
+            errors.append(_row_errors(frame.index[fractional], column, f"{column} must be a whole number"))
+            values = values.where(~fractional).astype("Int64")
+        errors.append(_row_errors(frame.index[invalid], column, f"{column} is not a number"))
+        rows[column] = values
+
+    for column in [c for c in TEXT_COLUMNS if c in frame.columns]:
+        rows[column] = _strings(frame[column])
+
+    errors = pd.concat(errors, ignore_index=True)
+    return rows.drop(index=(errors['row'] - 1).unique()), errors
+
+def resolve_municipalities(cursor, rows:pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame, dict, list[tuple]]:
+    """ Fill in the mid of rows identified by name, state and county, creating new municipalities
+
+    Names are matched through the resolver; only matches above its
+    confidence threshold are used, anything else becomes a new municipality.
+
+    Args:
+        cursor (CursorWrapper): municipal_finance cursor inside a transaction
+        rows (DataFrame): Valid rows from validate_finance_rows
+    Returns:
+        (tuple): Rows with a mid, row errors, counts of municipalities matched
+            (exact, normalized, fuzzy) and created, and the created
+            (mid, state, county_fips, name) tuples
+    """
+    errors = []
+    created = []
+
+    given = rows['mid'].dropna().unique().tolist()
+    if given:
+        cursor.execute("SELECT mid::text FROM municipalities WHERE mid = ANY(%s::uuid[])", [given])
+        known = {row[0] for row in cursor.fetchall()}
+        unknown = rows['mid'].notna() & ~rows['mid'].isin(known)
+        errors.append(_row_errors(rows.index[unknown], 'mid', "mid is not a known municipality"))
+        rows = rows[~unknown]
+
+    pending = rows['mid'].isna()
+    matches = dict.fromkeys([EXACT_MATCH, NORMALIZED_MATCH, FUZZY_MATCH, "created"], 0)
+    if pending.any():
+        keys = rows.loc[pending, IDENTITY_COLUMNS].drop_duplicates().reset_index(drop=True)
+        found = resolve_mids(list(keys.itertuples(index=False, name=None)))
+        keys['mid'] = pd.array([match["mid"] if match else pd.NA for match in found], dtype="string")
+        for match in found:
+            if match:
+                matches[match["match"]] += 1
+
+        new = keys['mid'].isna()
+        keys.loc[new, 'mid'] = [
+            new_municipality_mid(name, state) for name, state in zip(keys.loc[new, 'municipality_name'], keys.loc[new, 'state'])
+        ]
+
+        # New ids derive from state and name only, so they can clash with another county's municipality
+        cursor.execute(
+            "SELECT mid::text FROM municipalities WHERE mid = ANY(%s::uuid[])", [keys.loc[new, 'mid'].tolist()]
+        )
+        taken = [row[0] for row in cursor.fetchall()]
+        clash = new & (keys['mid'].isin(taken) | keys['mid'].duplicated(keep=False))
+        if clash.any():
+            clashed = rows[pending].reset_index().merge(keys[clash], on=IDENTITY_COLUMNS)['index']
+            errors.append(_row_errors(clashed, 'municipality_name', "new municipality's mid clashes with another municipality"))
+            keys = keys[~clash]
+            new = new[~clash]
+
+        created = list(keys.loc[new, ['mid', 'state', 'county_fips', 'municipality_name']].itertuples(index=False, name=None))
+        if created:
+            with cursor.copy("COPY municipalities (mid, state, county_fips, name) FROM STDIN") as copy:
+                for row in created:
+                    copy.write_row(row)
+            matches["created"] = len(created)
+
+        resolved = rows[pending].drop(columns='mid').reset_index().merge(keys, on=IDENTITY_COLUMNS).set_index('index')
+        resolved.index.name = None
+        rows = pd.concat([rows[~pending], resolved]).sort_index()
+
+    errors = pd.concat(errors, ignore_index=True) if errors else _row_errors([], 'mid', "")
+    return rows, errors, matches, created
+
+def drop_superseded_rows(rows:pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """ Keep the last row of each (mid, year) a file repeats
+
+    Args:
+        rows (DataFrame): Rows with a mid
+    Returns:
+        (tuple): Rows without repeats and a row, column, error frame for the dropped ones
+    """
+    duplicate = rows.duplicated(['mid', 'year'], keep='last')
+    errors = _row_errors(rows.index[duplicate], 'year', "superseded by a later row for the same mid and year")
+    return rows[~duplicate], errors
+
+def upsert_finances(cursor, rows:pd.DataFrame, on_conflict:str = UPDATE, modifier:str = BULK_MODIFIER) -> tuple[int, int]:
+    """ COPY rows into a staging table and upsert them into municipal_finances
+
+    Only the columns present in rows are written, so a file with a few
+    columns leaves the others of existing rows untouched.
+
+    Args:
+        cursor (CursorWrapper): municipal_finance cursor inside a transaction
+        rows (DataFrame): Rows with mid, year and value columns
+        on_conflict (str): update or skip existing (mid, year) rows
+        modifier (str): Modifier recorded on written rows
+    Returns:
+        (tuple): Inserted and updated row counts
+    """
+    columns = ['mid', 'year', *[c for c in VALUE_COLUMNS if c in rows.columns]]
+    column_list = ", ".join(columns)
+
+    cursor.execute(f"""
+        CREATE TEMP TABLE finance_staging ON COMMIT DROP AS
+        SELECT {column_list} FROM municipal_finances WITH NO DATA
+    """)
+    with cursor.copy(f"COPY finance_staging ({column_list}) FROM STDIN WITH (FORMAT csv)") as copy:
+        for start in range(0, len(rows), COPY_BATCH_SIZE):
+            copy.write(rows.iloc[start:start + COPY_BATCH_SIZE][columns].to_csv(header=False, index=False))
+
+    if on_conflict == SKIP:
+        conflict = "DO NOTHING"
+    else:
+        updates = [f"{column} = EXCLUDED.{column}" for column in columns[2:]] + ["modifier = EXCLUDED.modifier"]
+        conflict = f"DO UPDATE SET {', '.join(updates)}"
+
+    # xmax is 0 for freshly inserted tuples
+    cursor.execute(f"""
+        WITH written AS (
+            INSERT INTO municipal_finances ({column_list}, created_at, modifier)
+            SELECT {column_list}, now(), %s FROM finance_staging
+            ON CONFLICT (mid, year) {conflict}
+            RETURNING xmax = 0 AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM written
+    """, [modifier])
+    inserted, updated = cursor.fetchone()
+    return inserted, updated
+
+def ingest_finances(frame:pd.DataFrame, on_conflict:str = UPDATE, dry_run:bool = False,
+                    modifier:str = BULK_MODIFIER) -> dict:
+    """ Validate, resolve and load a file of finance rows
+
+    Invalid rows are reported and skipped, the rest load in one transaction.
+
+    Args:
+        frame (DataFrame): Rows from read_finance_file
+        on_conflict (str): update or skip existing (mid, year) rows
+        dry_run (bool): Validate and count without keeping any change
+        modifier (str): Modifier recorded on written rows
+    Returns:
+        (dict): Row counts and per-row errors
+    """
+    if on_conflict not in CONFLICT_POLICIES:
+        raise IngestError(f"Unsupported conflict policy '{on_conflict}'.")
+    if not modifier or len(modifier) > MODIFIER_MAX_LENGTH:
+        raise IngestError(f"Modifier must be 1 to {MODIFIER_MAX_LENGTH} characters.")
+
+    rows, errors = validate_finance_rows(frame)
+
+    inserted = updated = 0
+    matches, created = {}, []
+    with transaction.atomic(using='municipal_finance'):
+        with connections['municipal_finance'].cursor() as cursor:
+            if len(rows):
+                rows, resolve_errors, matches, created = resolve_municipalities(cursor, rows)
+                errors = pd.concat([errors, resolve_errors], ignore_index=True)
+
+            rows, duplicate_errors = drop_superseded_rows(rows)
+            errors = pd.concat([errors, duplicate_errors], ignore_index=True)
+
+            if len(rows):
+                inserted, updated = upsert_finances(cursor, rows, on_conflict, modifier)
+            if inserted or updated:
+                refresh_derived_metrics(rows['mid'].tolist(), rows['year'].tolist(), cursor)
+
+        if dry_run:
+            transaction.set_rollback(True, using='municipal_finance')
+
+    if not dry_run:
+        if created:
+            link_municipality_boundaries(created)
+            bump_data_version(DIRECTORY_VERSION)
+        if inserted or updated:
+            bump_data_version(FINANCE_VERSION)
+
+    errors = errors.sort_values(['row', 'column'], kind='stable')
+    return {
+        "success": True,
+        "dry_run": dry_run,
+        "rows": len(frame),
+        "inserted": inserted,
+        "updated": updated,
+        "skipped": len(rows) - inserted - updated,
+        "rejected": int(errors['row'].nunique()),
+        "municipalities_created": matches.get("created", 0),
+        "matches": matches,
+        "errors": errors.to_dict(orient='records'),
+    }
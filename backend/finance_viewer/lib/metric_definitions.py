@@ -0,0 +1,31 @@
+""" Metric names available to the finance metrics engine and expression language """
+
+from django.db.models import DecimalField, IntegerField
+
+from finance_viewer.models.municipal_finance import MunicipalFinances
+
+# Every numeric column of municipal_finances, in model order
+METRIC_FIELDS = [
+    field.column for field in MunicipalFinances._meta.concrete_fields
+    if isinstance(field, (DecimalField, IntegerField)) and field.column != 'year'
+]
+
+# Per-municipality attributes from municipal_boundaries (constant across years).
+# Maps the expression name to the SQL column expression on municipal_boundaries.
+BOUNDARY_ATTRIBUTES = {
+    "sq_mi": "sq_mi",
+    "acres": "sq_mi * 640",
+    "pop_2010": "pop_2010",
+    "pop_2020": "pop_2020",
+}
+
+# Standard derived ratios from the financial chart defaults
+DERIVED_METRICS = {
+    "net_financial_position": "current_assets - liabilities",
+    "assets_to_liabilities": "total_assets / liabilities",
+    "financial_assets_to_liabilities": "current_assets / liabilities",
+    "net_debt_to_revenues": "(liabilities - current_assets) / total_revenues",
+    "interest_to_revenues": "interest_charges / total_revenues",
+    "net_book_to_total_capital_assets": "net_book_total_capital_assets / capital_assets",
+    "transfers_to_revenues": "(operating_grants + capital_grants) / total_revenues",
+}
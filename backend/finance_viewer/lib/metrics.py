@@ -0,0 +1,247 @@
+""" Module for the columnar in-memory municipal finance metrics engine """
+
+import logging
+import threading
+
+import numpy as np
+
+from django.db import ProgrammingError, connections
+
+from finance_viewer.lib.cache_versions import get_data_version
+from finance_viewer.lib.expressions import compile_expression
+from finance_viewer.lib.metric_definitions import BOUNDARY_ATTRIBUTES, DERIVED_METRICS, METRIC_FIELDS
+
+# Version counter bumped whenever municipal_finances rows change
+FINANCE_VERSION = "municipal_finances"
+
+# Rows fetched per round trip while loading
+LOAD_CHUNK_SIZE = 10000
+
+logger = logging.getLogger(__name__)
+
+
+class FinanceCube:
+    """ municipal_finances as a dense float64 (municipality x year x metric) array
+
+    Missing rows and NULL values are NaN. The year axis is contiguous from the
+    first to the last fiscal year so gaps line up across municipalities.
+    """
+
+    def __init__(self, version:int, mids:np.ndarray, years:np.ndarray, values:np.ndarray,
+                 attributes:dict[str, np.ndarray]):
+        self.version = version
+        self.mids = mids
+        self.years = years
+        self.values = values
+        self.attributes = attributes
+        self.fields = list(METRIC_FIELDS)
+        self.mid_index = {mid: i for i, mid in enumerate(mids)}
+        self.field_index = {name: i for i, name in enumerate(self.fields)}
+
+    @property
+    def shape(self) -> tuple:
+        return self.values.shape
+
+    def field(self, name:str) -> np.ndarray:
+        """ (municipality, year) view of a raw metric """
+
+        if name not in self.field_index:
+            raise KeyError(f"Unknown metric '{name}'.")
+        return self.values[:, :, self.field_index[name]]
+
+    def resolve(self, name:str) -> np.ndarray:
+        """ Array for an expression name: (municipality, year) for fields,
+        (municipality, 1) for boundary attributes """
+
+        if name in self.attributes:
+            return self.attributes[name][:, np.newaxis]
+        return self.field(name)
+
+    def metric(self, expression:str) -> np.ndarray:
+        """ (municipality, year) array of a raw, derived or custom metric for every municipality """
+
+        values = compile_expression(expression).evaluate(self.resolve)
+        return np.broadcast_to(values, (len(self.mids), len(self.years)))
+
+    def year_position(self, year:int) -> int | None:
+        """ Position of a fiscal year on the year axis, None when out of range """
+
+        if len(self.years) == 0 or not self.years[0] <= year <= self.years[-1]:
+            return None
+        return int(year - self.years[0])
+
+    def rows_for(self, mids:list[str] | None = None) -> np.ndarray:
+        """ Row positions for mids (all rows when None), unknown mids are skipped """
+
+        if mids is None:
+            return np.arange(len(self.mids))
+        return np.array([self.mid_index[m] for m in mids if m in self.mid_index], dtype=np.intp)
+
+    def years_for(self, start_year:int | None = None, end_year:int | None = None) -> np.ndarray:
+        """ Year positions within an inclusive range """
+
+        mask = np.ones(len(self.years), dtype=bool)
+        if start_year is not None:
+            mask &= self.years >= start_year
+        if end_year is not None:
+            mask &= self.years <= end_year
+        return np.flatnonzero(mask)
+
+    def evaluate(self, expression:str, mids:list[str] | None = None,
+                 start_year:int | None = None, end_year:int | None = None) -> dict:
+        """ Evaluate a metric expression for a set of municipalities and years
+
+        Args:
+            expression (str): Field, derived metric or custom expression
+            mids (list): Municipality ids, all when None
+            start_year (int): First year (inclusive)
+            end_year (int): Last year (inclusive)
+        Returns:
+            (dict): mids, years and the (municipality, year) values
+        """
+        compiled = compile_expression(expression)
+        rows = self.rows_for(mids)
+        cols = self.years_for(start_year, end_year)
+        block = self.values[np.ix_(rows, cols)]
+
+        def resolve(name):
+            if name in self.attributes:
+                return self.attributes[name][rows, np.newaxis]
+            return block[:, :, self.field_index[name]]
+
+        return {
+            "mids": self.mids[rows],
+            "years": self.years[cols],
+            "values": np.broadcast_to(compiled.evaluate(resolve), (len(rows), len(cols)))
+        }
+
+    def derived(self, names:list[str] | None = None, mids:list[str] | None = None,
+                start_year:int | None = None, end_year:int | None = None) -> dict:
+        """ Compute derived ratios for a set of municipalities and years
+
+        Args:
+            names (list): Derived metric names, all when None
+            mids (list): Municipality ids, all when None
+            start_year (int): First year (inclusive)
+            end_year (int): Last year (inclusive)
+        Returns:
+            (dict): mids, years and {name: (municipality, year) array}
+        """
+        names = names or list(DERIVED_METRICS.keys())
+        unknown = [name for name in names if name not in DERIVED_METRICS]
+        if unknown:
+            raise KeyError(f"Unknown derived metric(s): {', '.join(unknown)}.")
+
+        results = {name: self.evaluate(name, mids, start_year, end_year) for name in names}
+        first = next(iter(results.values()))
+        return {
+            "mids": first["mids"],
+            "years": first["years"],
+            "metrics": {name: result["values"] for name, result in results.items()}
+        }
+
+
+def load_boundary_attributes(mids:np.ndarray) -> dict[str, np.ndarray]:
+    """ Load boundary attributes for mids through the boundary crosswalk
+
+    Args:
+        mids (ndarray): Municipality ids in cube order
+    Returns:
+        (dict): {attribute: float64 array aligned to mids}, NaN when unmatched
+            or when the crosswalk has not been built
+    """
+    attributes = {name: np.full(len(mids), np.nan) for name in BOUNDARY_ATTRIBUTES}
+    if len(mids) == 0:
+        return attributes
+
+    positions = {mid: i for i, mid in enumerate(mids)}
+    columns = ", ".join(f"COALESCE(({sql})::float8, 'NaN')" for sql in BOUNDARY_ATTRIBUTES.values())
+
+    try:
+        with connections['gis_boundaries'].cursor() as cursor:
+            cursor.execute(f"""
+                SELECT c.mid::text, {columns}
+                FROM municipal_boundary_crosswalk c
+                JOIN municipal_boundaries b ON b.id = c.boundary_id
+            """)
+            rows = [row for row in cursor.fetchall() if row[0] in positions]
+    except ProgrammingError:
+        # The crosswalk only exists once build_boundary_crosswalk has run
+        logger.warning("Boundary crosswalk unavailable, boundary attributes are left empty", exc_info=True)
+        return attributes
+
+    if rows:
+        index = np.array([positions[row[0]] for row in rows], dtype=np.intp)
+        values = np.array([row[1:] for row in rows], dtype=np.float64)
+        for i, name in enumerate(BOUNDARY_ATTRIBUTES):
+            attributes[name][index] = values[:, i]
+
+    return attributes
+
+def load_finance_cube(version:int) -> FinanceCube:
+    """ Load municipal_finances into a FinanceCube with one query
+
+    Args:
+        version (int): Data version the cube represents
+    Returns:
+        (FinanceCube): Loaded cube
+    """
+    columns = ", ".join(f"COALESCE({name}::float8, 'NaN')" for name in METRIC_FIELDS)
+    mids, years, chunks = [], [], []
+
+    with connections['municipal_finance'].cursor() as cursor:
+        cursor.execute(f"SELECT mid::text, year, {columns} FROM municipal_finances")
+        while True:
+            rows = cursor.fetchmany(LOAD_CHUNK_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                mids.append(row[0])
+                years.append(row[1])
+            chunks.append(np.array([row[2:] for row in rows], dtype=np.float64))
+
+    if not chunks:
+        return FinanceCube(
+            version,
+            np.array([], dtype=object),
+            np.array([], dtype=np.int32),
+            np.empty((0, 0, len(METRIC_FIELDS))),
+            load_boundary_attributes(np.array([], dtype=object))
+        )
+
+    unique_mids, mid_positions = np.unique(np.array(mids, dtype=object), return_inverse=True)
+    years = np.array(years, dtype=np.int32)
+    first_year = years.min()
+    all_years = np.arange(first_year, years.max() + 1, dtype=np.int32)
+
+    values = np.full((len(unique_mids), len(all_years), len(METRIC_FIELDS)), np.nan)
+    values[mid_positions, years - first_year] = np.concatenate(chunks)
+
+    return FinanceCube(version, unique_mids, all_years, values, load_boundary_attributes(unique_mids))
+
+
+_lock = threading.Lock()
+_local = {"cube": None}
+
+def get_finance_cube() -> FinanceCube:
+    """ Get this worker's finance cube, reloaded when the finance data version changes
+
+    Returns:
+        (FinanceCube): Finance cube
+    """
+    version = get_data_version(FINANCE_VERSION)
+    cube = _local["cube"]
+    if cube is not None and cube.version == version:
+        return cube
+
+    with _lock:
+        cube = _local["cube"]
+        if cube is None or cube.version != version:
+            cube = load_finance_cube(version)
+            _local["cube"] = cube
+        return cube
+
+def nan_to_none(values:np.ndarray) -> list:
+    """ Convert an array to nested lists with NaN and infinities as None for JSON output """
+
+    return np.where(np.isfinite(values), values, None).tolist()
@@ -0,0 +1,101 @@
+""" Module for normalizing municipality names for matching and search """
+
+import re
+import unicodedata
+
+# Common abbreviations in municipality names, expanded to a canonical token
+NAME_ABBREVIATIONS = {
+    "st": "saint",
+    "ste": "sainte",
+    "mt": "mount",
+    "mtn": "mountain",
+    "ft": "fort",
+    "pt": "point",
+    "twp": "township",
+    "tp": "township",
+    "vlg": "village",
+    "boro": "borough",
+    "bor": "borough",
+    "hts": "heights",
+    "spgs": "springs",
+    "n": "north",
+    "s": "south",
+    "e": "east",
+    "w": "west",
+}
+
+# Leading government-type phrases ("City of Austin" -> "austin")
+NAME_PREFIXES = (
+    ("city", "of"),
+    ("town", "of"),
+    ("village", "of"),
+    ("township", "of"),
+    ("borough", "of"),
+    ("municipality", "of"),
+    ("charter", "township", "of"),
+)
+
+_APOSTROPHES = re.compile(r"['’`]")
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def _split_name(name:str, expand_last:bool = True) -> tuple[tuple, list[str]]:
+    """ Leading government-type phrase and remaining normalized tokens of a name """
+
+    if not name:
+        return (), []
+
+    text = unicodedata.normalize("NFKD", name)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    text = text.replace("&", " and ")
+    text = _APOSTROPHES.sub("", text)
+    tokens = _NON_ALNUM.sub(" ", text).split()
+    expanded = len(tokens) if expand_last else len(tokens) - 1
+    tokens = [NAME_ABBREVIATIONS.get(t, t) for t in tokens[:expanded]] + tokens[expanded:]
+
+    for prefix in NAME_PREFIXES:
+        if len(tokens) > len(prefix) and tuple(tokens[:len(prefix)]) == prefix:
+            return prefix, tokens[len(prefix):]
+    return (), tokens
+
+def normalize_name(name:str, expand_last:bool = True) -> str:
+    """ Normalize a municipality name
+
+    Lowercases, strips accents and punctuation, expands abbreviations
+    ("St." -> "saint", "Twp" -> "township") and drops a leading
+    government-type phrase such as "City of".
+
+    Args:
+        name (str): Municipality name
+        expand_last (bool): Expand an abbreviation in the last token; typeahead
+            turns this off since a partly typed "st" may be "stamford"
+    Returns:
+        (str): Normalized name, tokens separated by single spaces
+    """
+    return " ".join(_split_name(name, expand_last)[1])
+
+def government_type(name:str) -> str | None:
+    """ Government type named by a leading phrase ("Village of Hempstead" -> "village")
+
+    Args:
+        name (str): Municipality name
+    Returns:
+        (str): Government type, None when the name has no such phrase
+    """
+    prefix = _split_name(name)[0]
+    return " ".join(prefix[:-1]) or None
+
+def name_trigrams(normalized:str) -> set[str]:
+    """ Get the padded trigrams of a normalized name (pg_trgm style)
+
+    Args:
+        normalized (str): Normalized name
+    Returns:
+        (set): Trigrams of every word, padded with two leading and one trailing space
+    """
+    trigrams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            trigrams.add(padded[i:i + 3])
+    return trigrams
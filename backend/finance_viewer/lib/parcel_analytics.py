@@ -0,0 +1,275 @@
+""" Module for parcel fiscal productivity analytics
+
+Value per acre is computed from equal-area parcel areas, parcels are
+classified into quantile or natural breaks (Jenks) classes and the results
+are aggregated to a hexagon grid and to the whole municipality.
+"""
+
+import math
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from finance_viewer.lib.parcels import EQUAL_AREA_CRS, PARCEL_COLUMNS
+
+try:
+    import mapclassify
+except ImportError:  # mapclassify is optional, a sampled Fisher-Jenks is used without it
+    mapclassify = None
+
+SQ_M_PER_ACRE = 4046.8564224
+
+QUANTILES = "quantiles"
+JENKS = "jenks"
+CLASSIFICATION_METHODS = [QUANTILES, JENKS]
+
+DEFAULT_CLASSES = 5
+MAX_CLASSES = 10
+
+# Hexagon circumradius in metres, about 65 ha per cell
+DEFAULT_HEX_SIZE = 500.0
+
+# Values sampled for the natural breaks optimization
+JENKS_SAMPLE_SIZE = 1000
+
+
+def parcel_values(gdf:gpd.GeoDataFrame) -> pd.DataFrame:
+    """ Numeric assessed value, acres and value per acre for each parcel
+
+    Args:
+        gdf (GeoDataFrame): Parcels from read_parcels (shape_area in equal-area m²)
+    Returns:
+        (DataFrame): assessed_value, acres and value_per_acre, NaN where unknown
+    """
+    column = PARCEL_COLUMNS['assessed_value']
+    if column in gdf.columns:
+        value = pd.to_numeric(gdf[column], errors='coerce').to_numpy(dtype=float)
+    else:
+        value = np.full(len(gdf), np.nan)
+
+    acres = gdf['shape_area'].to_numpy(dtype=float) / SQ_M_PER_ACRE
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_acre = np.where(acres > 0, value / acres, np.nan)
+
+    return pd.DataFrame({'assessed_value': value, 'acres': acres, 'value_per_acre': per_acre}, index=gdf.index)
+
+def _jenks_breaks(values:np.ndarray, classes:int) -> list[float]:
+    """ Fisher-Jenks optimal breaks on a sorted sample, vectorized per class """
+
+    if values.size > JENKS_SAMPLE_SIZE:
+        sample = np.quantile(values, np.linspace(0, 1, JENKS_SAMPLE_SIZE))
+    else:
+        sample = np.sort(values)
+    n = sample.size
+
+    sums = np.concatenate(([0.0], np.cumsum(sample)))
+    squares = np.concatenate(([0.0], np.cumsum(sample ** 2)))
+    start = np.arange(n)[:, np.newaxis]
+    end = np.arange(n)[np.newaxis, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        count = end - start + 1
+        total = sums[end + 1] - sums[start]
+        # Sum of squared deviations of sample[start:end + 1]
+        deviations = squares[end + 1] - squares[start] - total ** 2 / count
+    deviations[start > end] = np.inf
+
+    cost = deviations[0]
+    splits = []
+    for _ in range(1, classes):
+        previous = np.concatenate(([np.inf], cost[:-1]))
+        candidates = previous[:, np.newaxis] + deviations
+        splits.append(np.argmin(candidates, axis=0))
+        cost = candidates[splits[-1], np.arange(n)]
+
+    breaks = [sample[-1]]
+    end_index = n - 1
+    for split in reversed(splits):
+        end_index = split[end_index] - 1
+        breaks.append(sample[end_index])
+    breaks.append(sample[0])
+    return sorted(float(b) for b in breaks)
+
+def classification_breaks(values:np.ndarray, method:str = QUANTILES, classes:int = DEFAULT_CLASSES) -> list[float]:
+    """ Class breaks over the finite values
+
+    Args:
+        values (ndarray): Values, NaN ignored
+        method (str): quantiles or jenks
+        classes (int): Number of classes
+    Returns:
+        (list): classes + 1 ascending break values, empty when there is no data
+    """
+    if method not in CLASSIFICATION_METHODS:
+        raise ValueError(f"Unsupported classification '{method}'.")
+
+    finite = values[np.isfinite(values)]
+    classes = min(classes, np.unique(finite).size)
+    if classes <= 0:
+        return []
+
+    if method == QUANTILES or classes == 1:
+        return np.quantile(finite, np.linspace(0, 1, classes + 1)).tolist()
+
+    if mapclassify is not None:
+        bins = mapclassify.FisherJenksSampled(finite, k=classes).bins
+        return [float(finite.min())] + [float(b) for b in bins]
+    return _jenks_breaks(finite, classes)
+
+def assign_classes(values:np.ndarray, breaks:list[float]) -> np.ndarray:
+    """ Class index (0 lowest) for each value, -1 where missing """
+
+    if not breaks:
+        return np.full(len(values), -1, dtype=np.int8)
+    classes = np.searchsorted(np.asarray(breaks[1:-1]), values, side='right').astype(np.int8)
+    classes[~np.isfinite(values)] = -1
+    return classes
+
+def hex_grid_aggregate(gdf:gpd.GeoDataFrame, metrics:pd.DataFrame, size:float = DEFAULT_HEX_SIZE) -> dict:
+    """ Aggregate parcels into flat-topped hexagons by centroid
+
+    Args:
+        gdf (GeoDataFrame): Parcels
+        metrics (DataFrame): Output of parcel_values
+        size (float): Hexagon circumradius in metres (equal-area CRS)
+    Returns:
+        (dict): FeatureCollection of hexagons with parcel_count, total_value,
+            total_acres and value_per_acre
+    """
+    if len(gdf) == 0:
+        return {'type': 'FeatureCollection', 'features': []}
+
+    centroids = gpd.GeoSeries(shapely.centroid(gdf.geometry.values), crs=gdf.crs).to_crs(EQUAL_AREA_CRS)
+    x, y = centroids.x.to_numpy(), centroids.y.to_numpy()
+
+    # Axial coordinates, rounded through cube coordinates
+    q = (2 / 3 * x) / size
+    r = (-1 / 3 * x + math.sqrt(3) / 3 * y) / size
+    cube = np.stack([q, r, -q - r])
+    rounded = np.round(cube)
+    error = np.abs(rounded - cube)
+    largest = np.argmax(error, axis=0)
+    columns = np.arange(cube.shape[1])
+    rounded[largest, columns] = 0
+    rounded[largest, columns] = -rounded.sum(axis=0)[columns]
+
+    frame = metrics.assign(q=rounded[0].astype(np.int64), r=rounded[1].astype(np.int64))
+    valued = frame['assessed_value'].notna() & (frame['acres'] > 0)
+    stats = frame.groupby(['q', 'r']).agg(parcel_count=('acres', 'size'), total_acres=('acres', 'sum'))
+    stats = stats.join(
+        frame[valued].groupby(['q', 'r']).agg(total_value=('assessed_value', 'sum'), valued_acres=('acres', 'sum'))
+    ).reset_index()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stats['value_per_acre'] = stats['total_value'] / stats['valued_acres']
+
+    centers_x = size * 1.5 * stats['q'].to_numpy()
+    centers_y = size * math.sqrt(3) * (stats['r'].to_numpy() + stats['q'].to_numpy() / 2)
+    angles = np.radians(np.arange(0, 420, 60))
+    rings = np.stack([
+        centers_x[:, np.newaxis] + size * np.cos(angles),
+        centers_y[:, np.newaxis] + size * np.sin(angles),
+    ], axis=-1)
+
+    properties = stats[['parcel_count', 'total_value', 'total_acres', 'value_per_acre']]
+    hexes = gpd.GeoDataFrame(
+        properties.astype(object).where(properties.notna(), None),
+        geometry=shapely.polygons(rings),
+        crs=EQUAL_AREA_CRS
+    ).to_crs(gdf.crs)
+    return hexes.to_geo_dict(drop_id=True)
+
+def _finite(value) -> float | None:
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+def municipal_aggregate(metrics:pd.DataFrame, classes:np.ndarray, class_count:int,
+                        boundary_acres:float | None = None) -> dict:
+    """ Whole-municipality totals and the share of land and value in each class
+
+    Args:
+        metrics (DataFrame): Output of parcel_values
+        classes (ndarray): Class index per parcel, -1 when unclassified
+        class_count (int): Number of classes
+        boundary_acres (float): Equal-area acreage of the municipal boundary
+    Returns:
+        (dict): Aggregate figures
+    """
+    valued = metrics['assessed_value'].notna().to_numpy() & (metrics['acres'].to_numpy() > 0)
+    acres = metrics['acres'].to_numpy()
+    value = np.nan_to_num(metrics['assessed_value'].to_numpy())
+
+    total_acres = acres.sum()
+    valued_acres = acres[valued].sum()
+    total_value = value[valued].sum()
+
+    class_acres = np.bincount(classes[classes >= 0], weights=acres[classes >= 0], minlength=class_count)
+    class_value = np.bincount(classes[classes >= 0], weights=value[classes >= 0], minlength=class_count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        acre_share = class_acres / class_acres.sum()
+        value_share = class_value / class_value.sum()
+
+    return {
+        "parcel_count": int(len(metrics)),
+        "valued_parcel_count": int(valued.sum()),
+        "total_acres": _finite(total_acres),
+        "boundary_acres": _finite(boundary_acres) if boundary_acres is not None else None,
+        "parcel_coverage": _finite(total_acres / boundary_acres) if boundary_acres else None,
+        "total_value": _finite(total_value),
+        "value_per_acre": _finite(total_value / valued_acres) if valued_acres > 0 else None,
+        "median_value_per_acre": _finite(np.nanmedian(metrics['value_per_acre'])) if valued.any() else None,
+        "class_acre_share": [_finite(s) for s in acre_share],
+        "class_value_share": [_finite(s) for s in value_share],
+    }
+
+def classify_parcels(metrics:pd.DataFrame, method:str = QUANTILES, classes:int = DEFAULT_CLASSES,
+                     boundary_acres:float | None = None) -> tuple[np.ndarray, dict]:
+    """ Classify parcels by value per acre and summarize the classes for the municipality
+
+    Args:
+        metrics (DataFrame): Output of parcel_values
+        method (str): quantiles or jenks
+        classes (int): Number of classes
+        boundary_acres (float): Equal-area acreage of the municipal boundary
+    Returns:
+        (tuple): Class index per parcel, and the classification and municipality documents
+    """
+    classes = max(1, min(classes, MAX_CLASSES))
+    values = metrics['value_per_acre'].to_numpy()
+    breaks = classification_breaks(values, method, classes)
+    parcel_classes = assign_classes(values, breaks)
+    class_count = max(len(breaks) - 1, 0)
+
+    return parcel_classes, {
+        "classification": {"method": method, "classes": class_count, "breaks": breaks},
+        "municipality": municipal_aggregate(metrics, parcel_classes, class_count, boundary_acres),
+    }
+
+def analyze_parcels(gdf:gpd.GeoDataFrame, boundary_geom=None, method:str = QUANTILES,
+                    classes:int = DEFAULT_CLASSES, hex_size:float = DEFAULT_HEX_SIZE) -> dict:
+    """ Compute fiscal productivity analytics and add per-parcel columns
+
+    Adds acres, value_per_acre and productivity_class columns to gdf.
+
+    Args:
+        gdf (GeoDataFrame): Parcels from read_parcels
+        boundary_geom (Geometry): Municipal boundary in the parcels' CRS
+        method (str): quantiles or jenks
+        classes (int): Number of classes
+        hex_size (float): Hexagon circumradius in metres
+    Returns:
+        (dict): classification, municipality aggregate and hexagon FeatureCollection
+    """
+    metrics = parcel_values(gdf)
+
+    boundary_acres = None
+    if boundary_geom is not None:
+        boundary_acres = gpd.GeoSeries([boundary_geom], crs=gdf.crs).to_crs(EQUAL_AREA_CRS).area.iloc[0] / SQ_M_PER_ACRE
+
+    parcel_classes, summary = classify_parcels(metrics, method, classes, boundary_acres)
+
+    gdf['acres'] = metrics['acres']
+    gdf['value_per_acre'] = metrics['value_per_acre']
+    gdf['productivity_class'] = parcel_classes
+
+    return {**summary, "hexes": hex_grid_aggregate(gdf, metrics, hex_size)}
@@ -0,0 +1,149 @@
+""" Module for binary parcel result formats and content negotiation
+
+Stored parcels can be served as GeoJSON or NDJSON streamed from PostGIS, or
+as FlatGeobuf (with a packed R-tree so clients can stream and filter by
+bbox), GeoArrow IPC or GeoParquet. Binary encodings are written once per
+upload and format and served from disk afterwards, since stored uploads
+never change.
+"""
+
+import os
+import uuid
+
+import geopandas as gpd
+import pyarrow as pa
+import pyogrio
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from finance_viewer.lib.geojson_stream import GEOJSON_FORMAT, NDJSON_FORMAT, STREAM_FORMATS
+from finance_viewer.lib.parcel_store import load_stored_parcels
+
+FLATGEOBUF_FORMAT = "fgb"
+GEOARROW_FORMAT = "arrow"
+GEOPARQUET_FORMAT = "parquet"
+
+# Binary formats: content type and file extension
+EXPORT_FORMATS = {
+    FLATGEOBUF_FORMAT: ("application/flatgeobuf", ".fgb"),
+    GEOARROW_FORMAT: ("application/vnd.apache.arrow.stream", ".arrows"),
+    GEOPARQUET_FORMAT: ("application/vnd.apache.parquet", ".parquet"),
+}
+
+# Media types accepted in the Accept header, in server preference order
+# (GeoJSON first so */* keeps the previous behaviour)
+NEGOTIATED_TYPES = {
+    STREAM_FORMATS[GEOJSON_FORMAT]: GEOJSON_FORMAT,
+    "application/json": GEOJSON_FORMAT,
+    STREAM_FORMATS[NDJSON_FORMAT]: NDJSON_FORMAT,
+    **{content_type: fmt for fmt, (content_type, _) in EXPORT_FORMATS.items()},
+    "application/x-parquet": GEOPARQUET_FORMAT,
+}
+
+# Allowed range of GeoJSON coordinate decimal digits, 6 is about 0.1 m
+MIN_PRECISION = 0
+MAX_PRECISION = 15
+
+# Record batch size of the GeoArrow IPC stream
+ARROW_BATCH_SIZE = 65536
+
+EXPORT_CACHE_CONTROL = "private, max-age=86400"
+
+
+def negotiate_parcel_format(request, fmt:str | None = None) -> str | None:
+    """ Result format from the format parameter, falling back to the Accept header
+
+    Args:
+        request (HttpRequest): Incoming request
+        fmt (str): Explicit format, overrides the Accept header
+    Returns:
+        (str): Format name, None when nothing acceptable is available
+    """
+    if fmt:
+        return fmt if fmt in STREAM_FORMATS or fmt in EXPORT_FORMATS else None
+
+    preferred = request.get_preferred_type(list(NEGOTIATED_TYPES))
+    return NEGOTIATED_TYPES.get(preferred) if preferred else None
+
+def export_path(mid:str, content_hash:str, fmt:str) -> str:
+    """ Location of the encoded export of a stored upload """
+
+    return os.path.join(str(settings.PARCEL_JOB_ROOT), "exports", f"{mid}-{content_hash}{EXPORT_FORMATS[fmt][1]}")
+
+def write_flatgeobuf(gdf:gpd.GeoDataFrame, path:str):
+    """ FlatGeobuf with a packed Hilbert R-tree, so clients can fetch by bbox over range requests """
+
+    pyogrio.write_dataframe(gdf, path, driver="FlatGeobuf", SPATIAL_INDEX="YES")
+
+def write_geoarrow(gdf:gpd.GeoDataFrame, path:str):
+    """ Arrow IPC stream with native GeoArrow geometry columns """
+
+    table = pa.table(gdf.to_arrow(index=False, geometry_encoding="geoarrow"))
+    with pa.ipc.new_stream(path, table.schema) as writer:
+        writer.write_table(table, max_chunksize=ARROW_BATCH_SIZE)
+
+def write_geoparquet(gdf:gpd.GeoDataFrame, path:str):
+    """ zstd-compressed GeoParquet with a bbox covering column """
+
+    gdf.to_parquet(path, index=False, compression="zstd", write_covering_bbox=True)
+
+EXPORT_WRITERS = {
+    FLATGEOBUF_FORMAT: write_flatgeobuf,
+    GEOARROW_FORMAT: write_geoarrow,
+    GEOPARQUET_FORMAT: write_geoparquet,
+}
+
+def export_parcels(mid:str, content_hash:str, fmt:str) -> str:
+    """ Encode a stored upload in a binary format, reusing an earlier export
+
+    Args:
+        mid (str): Municipality ID
+        content_hash (str): sha256 of the uploaded file
+        fmt (str): fgb, arrow or parquet
+    Returns:
+        (str): Path of the export
+    """
+    path = export_path(mid, content_hash, fmt)
+    if os.path.exists(path):
+        return path
+
+    gdf = load_stored_parcels(mid, content_hash).to_crs(epsg=4326)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Concurrent first requests each write their own file and the last rename wins
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        EXPORT_WRITERS[fmt](gdf, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+def serve_parcel_export(request, mid:str, content_hash:str, fmt:str):
+    """ Serve a binary export, answering conditional requests with 304
+
+    Args:
+        request (HttpRequest): Incoming request
+        mid (str): Municipality ID
+        content_hash (str): sha256 of the uploaded file
+        fmt (str): fgb, arrow or parquet
+    Returns:
+        (HttpResponse): File or not-modified response
+    """
+    content_type, extension = EXPORT_FORMATS[fmt]
+
+    # Stored uploads are immutable, so the content hash is a strong validator
+    etag = f'"{content_hash}-{fmt}"'
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        path = export_parcels(mid, content_hash, fmt)
+        response = FileResponse(open(path, "rb"), content_type=content_type, filename=f"parcels-{mid}{extension}")
+
+    response["ETag"] = etag
+    response["Cache-Control"] = EXPORT_CACHE_CONTROL
+    response["Vary"] = "Accept"
+    return response
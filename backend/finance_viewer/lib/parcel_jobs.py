@@ -0,0 +1,268 @@
+""" Module for the database-backed parcel upload job queue
+
+Uploads are stored on disk and recorded as ParcelJob rows in the default
+database. The run_parcel_worker command claims queued jobs and processes
+them in a process pool, so request threads only hash and store the file.
+Processed parcels are loaded into PostGIS (see parcel_store), which results,
+analytics and tiles are served from, and the stored upload is deleted once
+its job has finished either way.
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable
+
+import django
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from finance_viewer.lib.boundary_cache import get_municipality_boundary
+from finance_viewer.lib.parcel_analytics import analyze_parcels
+from finance_viewer.lib.parcel_store import find_parcel_upload, store_parcels
+from finance_viewer.lib.parcels import PARCEL_FORMATS, ParcelException, detect_parcel_format, read_parcels
+from finance_viewer.models.parcel_jobs import ParcelJob
+
+# Jobs in these states are reused by identical uploads
+LIVE_STATUSES = [ParcelJob.QUEUED, ParcelJob.RUNNING, ParcelJob.SUCCEEDED]
+
+# Share of the progress bar reached once the file is read, clipped and analyzed,
+# the rest tracks the COPY into PostGIS
+READ_PROGRESS = 0.4
+
+# Seconds between queue polls when idle
+POLL_INTERVAL = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+def job_root() -> str:
+    """ Directory holding uploads and results """
+    return str(settings.PARCEL_JOB_ROOT)
+
+def store_upload(file) -> tuple[str, str]:
+    """ Move an upload into the job directory
+
+    Files spooled by HashingTemporaryFileUploadHandler are moved as they are;
+    anything else is copied in chunks and hashed on the way. Every upload gets
+    its own file, so a job can delete its upload without affecting others.
+
+    Args:
+        file (UploadedFile): Uploaded file
+    Returns:
+        (tuple): sha256 content hash and stored path
+    """
+    directory = os.path.join(job_root(), "uploads")
+    os.makedirs(directory, exist_ok=True)
+    name = uuid.uuid4().hex
+    tmp_path = os.path.join(directory, f"{name}.tmp")
+
+    content_hash = getattr(file, "content_hash", None)
+    if content_hash is not None and hasattr(file, "temporary_file_path"):
+        shutil.move(file.temporary_file_path(), tmp_path)
+    else:
+        digest = hashlib.sha256()
+        with open(tmp_path, "wb") as f:
+            for chunk in file.chunks():
+                digest.update(chunk)
+                f.write(chunk)
+        content_hash = digest.hexdigest()
+
+    try:
+        fmt = detect_parcel_format(tmp_path)
+    except ParcelException:
+        os.remove(tmp_path)
+        raise
+
+    path = os.path.join(directory, f"{name}{PARCEL_FORMATS[fmt][1]}")
+    os.replace(tmp_path, path)
+    return content_hash, path
+
+def remove_upload(path:str):
+    """ Delete a stored upload, ignoring one that is already gone """
+
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def submit_parcel_job(file, mid:str) -> tuple[ParcelJob, bool]:
+    """ Queue a parcel upload, reusing the live job for identical content
+
+    Content that is already stored in PostGIS gets a finished job straight away.
+
+    Args:
+        file (UploadedFile): Zipped shapefile, GeoPackage, FlatGeobuf or GeoParquet file
+        mid (str): Municipality ID whose boundary clips the parcels
+    Returns:
+        (tuple): Job and whether it was newly created
+    """
+    content_hash, path = store_upload(file)
+
+    live = ParcelJob.objects.filter(mid=mid, content_hash=content_hash, status__in=LIVE_STATUSES)
+    job = live.first()
+    if job is not None:
+        remove_upload(path)
+        return job, False
+
+    fields = {"mid": mid, "content_hash": content_hash, "upload_path": path}
+    stored = find_parcel_upload(mid, content_hash)
+    if stored is not None:
+        now = timezone.now()
+        fields.update(
+            status=ParcelJob.SUCCEEDED, progress=1.0, feature_count=stored.feature_count,
+            started_at=now, finished_at=now
+        )
+        remove_upload(path)
+
+    try:
+        with transaction.atomic():
+            return ParcelJob.objects.create(**fields), True
+    except IntegrityError:
+        # An identical upload was queued concurrently
+        remove_upload(path)
+        return live.get(), False
+
+def job_status(job:ParcelJob) -> dict:
+    """ Status fields of a job for API responses """
+
+    return {
+        "job_id": str(job.pk),
+        "mid": job.mid,
+        "status": job.status,
+        "progress": round(job.progress, 3),
+        "message": job.message,
+        "feature_count": job.feature_count,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+def claim_next_job() -> ParcelJob | None:
+    """ Mark the oldest queued job as running and return it, None when the queue is empty """
+
+    with transaction.atomic():
+        job = ParcelJob.objects.select_for_update(skip_locked=True).filter(
+            status=ParcelJob.QUEUED
+        ).order_by('created_at').first()
+        if job is None:
+            return None
+
+        job.status = ParcelJob.RUNNING
+        job.progress = 0.0
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'progress', 'started_at'])
+        return job
+
+def requeue_interrupted_jobs() -> int:
+    """ Return jobs left running by a stopped worker to the queue """
+
+    return ParcelJob.objects.filter(status=ParcelJob.RUNNING).update(
+        status=ParcelJob.QUEUED, progress=0.0, started_at=None
+    )
+
+def _set_progress(job_id:str, progress:float):
+    ParcelJob.objects.filter(pk=job_id).update(progress=min(progress, 1.0))
+
+def _fail_job(job_id:str, message:str):
+    ParcelJob.objects.filter(pk=job_id).update(
+        status=ParcelJob.FAILED, message=message, finished_at=timezone.now()
+    )
+
+def run_parcel_job(job_id:str):
+    """ Read, clip, analyze and load a job's upload into PostGIS
+
+    Runs in a worker process. Content already stored is not processed again.
+    The upload is deleted whether the job succeeds or fails.
+
+    Args:
+        job_id (str): ParcelJob id
+    """
+    job = ParcelJob.objects.get(pk=job_id)
+
+    try:
+        stored = find_parcel_upload(job.mid, job.content_hash)
+        if stored is not None:
+            feature_count = stored.feature_count
+        else:
+            boundary = get_municipality_boundary(job.mid)
+            boundary_geom = boundary.geometry if boundary is not None else None
+            gdf = read_parcels(job.upload_path, boundary_geom)
+
+            analytics = analyze_parcels(gdf, boundary_geom)
+            _set_progress(job_id, READ_PROGRESS)
+
+            feature_count = store_parcels(
+                job.mid, job.content_hash, gdf, analytics,
+                progress=lambda loaded: _set_progress(job_id, READ_PROGRESS + (1 - READ_PROGRESS) * loaded)
+            )
+    except ParcelException as e:
+        _fail_job(job_id, str(e))
+        return
+    except Exception:
+        logger.exception("Error processing parcel job %s", job_id)
+        _fail_job(job_id, "Error processing uploaded parcel shapefile.")
+        return
+    finally:
+        remove_upload(job.upload_path)
+
+    ParcelJob.objects.filter(pk=job_id).update(
+        status=ParcelJob.SUCCEEDED,
+        progress=1.0,
+        feature_count=feature_count,
+        finished_at=timezone.now()
+    )
+
+def run_worker(workers:int, poll_interval:float = POLL_INTERVAL, once:bool = False,
+               log:Callable[[str], None] = print):
+    """ Process queued jobs until stopped
+
+    Only one worker should run per database, since jobs left running are
+    requeued on start.
+
+    Args:
+        workers (int): Worker processes
+        poll_interval (float): Seconds between polls when idle
+        once (bool): Exit once the queue is drained
+        log (Callable): Progress message sink
+    """
+    requeued = requeue_interrupted_jobs()
+    if requeued:
+        log(f"Requeued {requeued} interrupted job(s)")
+
+    # Spawned workers set Django up fresh instead of sharing forked DB connections
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+        running = {}
+        while True:
+            while len(running) < workers:
+                job = claim_next_job()
+                if job is None:
+                    break
+                log(f"Started job {job.pk} ({job.mid})")
+                running[pool.submit(run_parcel_job, str(job.pk))] = str(job.pk)
+
+            if not running:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                job_id = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    # The worker process died or the job could not be loaded
+                    log(f"Job {job_id} crashed: {error}")
+                    _fail_job(job_id, "Error processing uploaded parcel shapefile.")
+                    job = ParcelJob.objects.filter(pk=job_id).first()
+                    if job is not None:
+                        remove_upload(job.upload_path)
+                else:
+                    log(f"Finished job {job_id}")
@@ -0,0 +1,193 @@
+""" Module for processed parcels persisted in PostGIS, keyed by mid and upload content hash """
+
+import json
+from typing import Callable, Iterator
+
+import geopandas as gpd
+import pandas as pd
+import shapely
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.db.models import F
+
+from finance_viewer.lib.geojson_stream import iter_features
+from finance_viewer.lib.parcels import parcel_properties
+from finance_viewer.models.gis_boundaries import MunicipalParcels, ParcelUploads
+
+# Columns of municipal_parcels besides mid, content_hash and geometry
+PARCEL_FIELDS = [
+    'objectid',
+    'taxpin',
+    'assessed_value',
+    'shape_area',
+    'address',
+    'acres',
+    'value_per_acre',
+    'productivity_class',
+]
+TEXT_FIELDS = ['objectid', 'taxpin', 'assessed_value', 'address']
+
+# Parcels encoded per COPY write
+COPY_BATCH_SIZE = 50000
+
+SCHEMA_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS parcel_uploads (
+        mid uuid NOT NULL,
+        content_hash text NOT NULL,
+        feature_count integer NOT NULL,
+        analytics jsonb,
+        loaded_at timestamptz NOT NULL DEFAULT now(),
+        PRIMARY KEY (mid, content_hash)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS municipal_parcels (
+        id bigserial PRIMARY KEY,
+        mid uuid NOT NULL,
+        content_hash text NOT NULL,
+        objectid text,
+        taxpin text,
+        assessed_value text,
+        shape_area double precision,
+        address text,
+        acres double precision,
+        value_per_acre double precision,
+        productivity_class smallint,
+        geometry geometry(Geometry, 4269) NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS municipal_parcels_upload_idx
+    ON municipal_parcels (mid, content_hash)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS municipal_parcels_geometry_idx
+    ON municipal_parcels USING gist (geometry)
+    """,
+]
+
+
+def find_parcel_upload(mid:str, content_hash:str) -> ParcelUploads | None:
+    """ Stored upload for a municipality and file content hash, None when not loaded """
+
+    return ParcelUploads.objects.using('gis_boundaries').filter(mid=mid, content_hash=content_hash).first()
+
+def store_parcels(mid:str, content_hash:str, gdf:gpd.GeoDataFrame, analytics:dict | None = None,
+                  progress:Callable[[float], None] | None = None) -> int:
+    """ Bulk load processed parcels with COPY
+
+    The upload row is written in the same transaction, so a stored upload is
+    always complete. Loading content that is already stored is a no-op.
+
+    Args:
+        mid (str): Municipality ID
+        content_hash (str): sha256 of the uploaded file
+        gdf (GeoDataFrame): Parcels in EPSG:4269, after analyze_parcels when analytics are given
+        analytics (dict): Analytics document kept with the upload
+        progress (Callable): Called with the loaded fraction after each batch
+    Returns:
+        (int): Stored feature count
+    """
+    properties = parcel_properties(gdf).reindex(columns=PARCEL_FIELDS)
+    geometries = shapely.to_wkb(shapely.set_srid(gdf.geometry.values, 4269), hex=True, include_srid=True)
+    total = len(gdf)
+
+    with transaction.atomic(using='gis_boundaries'):
+        with connections['gis_boundaries'].cursor() as cursor:
+            # Serialize concurrent loads of the same upload
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", [f"{mid}:{content_hash}"])
+            cursor.execute(
+                "SELECT feature_count FROM parcel_uploads WHERE mid = %s AND content_hash = %s",
+                [mid, content_hash]
+            )
+            row = cursor.fetchone()
+            if row:
+                return row[0]
+
+            columns = ", ".join(PARCEL_FIELDS)
+            with cursor.copy(f"""
+                COPY municipal_parcels (mid, content_hash, {columns}, geometry)
+                FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL ({', '.join(TEXT_FIELDS)}))
+            """) as copy:
+                for start in range(0, total, COPY_BATCH_SIZE):
+                    stop = min(start + COPY_BATCH_SIZE, total)
+                    batch = properties.iloc[start:stop].copy()
+                    batch.insert(0, 'content_hash', content_hash)
+                    batch.insert(0, 'mid', mid)
+                    batch['geometry'] = geometries[start:stop]
+                    copy.write(batch.to_csv(header=False, index=False))
+                    if progress:
+                        progress(stop / total)
+
+            cursor.execute("""
+                INSERT INTO parcel_uploads (mid, content_hash, feature_count, analytics)
+                VALUES (%s, %s, %s, %s)
+            """, [mid, content_hash, total, json.dumps(analytics, cls=DjangoJSONEncoder) if analytics else None])
+
+    return total
+
+def load_stored_parcels(mid:str, content_hash:str) -> gpd.GeoDataFrame:
+    """ Stored parcels of an upload as a GeoDataFrame in EPSG:4269
+
+    Geometry is fetched as WKB and decoded in one vectorized call.
+
+    Args:
+        mid (str): Municipality ID
+        content_hash (str): sha256 of the uploaded file
+    Returns:
+        (GeoDataFrame): Parcels with PARCEL_FIELDS columns
+    """
+    with connections['gis_boundaries'].cursor() as cursor:
+        cursor.execute(f"""
+            SELECT {', '.join(PARCEL_FIELDS)}, ST_AsBinary(geometry)
+            FROM municipal_parcels
+            WHERE mid = %s AND content_hash = %s
+            ORDER BY id
+        """, [mid, content_hash])
+        rows = cursor.fetchall()
+
+    frame = pd.DataFrame.from_records(rows, columns=[*PARCEL_FIELDS, 'wkb'])
+    geometry = shapely.from_wkb([bytes(wkb) for wkb in frame.pop('wkb')])
+    return gpd.GeoDataFrame(frame, geometry=geometry, crs='EPSG:4269')
+
+def load_parcel_metrics(mid:str, content_hash:str) -> pd.DataFrame:
+    """ Stored parcels of an upload as parcel_values columns, for reclassification
+
+    Args:
+        mid (str): Municipality ID
+        content_hash (str): sha256 of the uploaded file
+    Returns:
+        (DataFrame): assessed_value, acres and value_per_acre, NaN where unknown
+    """
+    with connections['gis_boundaries'].cursor() as cursor:
+        cursor.execute("""
+            SELECT assessed_value, acres, value_per_acre
+            FROM municipal_parcels
+            WHERE mid = %s AND content_hash = %s
+            ORDER BY id
+        """, [mid, content_hash])
+        rows = cursor.fetchall()
+
+    frame = pd.DataFrame.from_records(rows, columns=['assessed_value', 'acres', 'value_per_acre'])
+    return pd.DataFrame({
+        'assessed_value': pd.to_numeric(frame['assessed_value'], errors='coerce').astype(float),
+        'acres': frame['acres'].astype(float),
+        'value_per_acre': frame['value_per_acre'].astype(float),
+    })
+
+def iter_stored_parcel_features(mid:str, content_hash:str, precision:int | None = None) -> Iterator[bytes]:
+    """ Encoded GeoJSON Features of a stored upload, rendered by PostGIS
+
+    Args:
+        mid (str): Municipality ID
+        content_hash (str): sha256 of the uploaded file
+        precision (int): Decimal digits kept in coordinates, 8 when None
+    Returns:
+        (Iterator): Encoded Feature objects
+    """
+    qs = MunicipalParcels.objects.using('gis_boundaries').filter(
+        mid=mid, content_hash=content_hash
+    ).order_by('id')
+    return iter_features(qs, PARCEL_FIELDS, F('geometry'), precision)
@@ -1,65 +1,177 @@
 """ Module for handling parcel file processing """
 
-import math
-import zipfile
+import json
 
 import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pyogrio
+import shapely
 
-from shapely.geometry import shape
+# Output property name: source shapefile column
+PARCEL_COLUMNS = {
+    'objectid': 'OBJECTID',
+    'taxpin': 'TAXPIN',
+    'assessed_value': 'TOTAL_APPR',
+    'address': 'LOCATION1',
+}
 
-def handle_shapefile_upload(file, muni_boundary):
-    """ Handle uploading parcel shapefile """
+# Accepted upload formats: name, leading magic bytes and stored file extension
+ZIP_FORMAT = "zip"
+GPKG_FORMAT = "gpkg"
+FGB_FORMAT = "fgb"
+PARQUET_FORMAT = "parquet"
+PARCEL_FORMATS = {
+    ZIP_FORMAT: (b"PK\x03\x04", ".zip"),
+    GPKG_FORMAT: (b"SQLite format 3\x00", ".gpkg"),
+    FGB_FORMAT: (b"fgb\x03", ".fgb"),
+    PARQUET_FORMAT: (b"PAR1", ".parquet"),
+}
 
-    file.seek(0)  # Reset file pointer
-    if zipfile.is_zipfile(file):
-        file.seek(0)  # Reset again
-        gdf = gpd.read_file(file)
+# CONUS Albers equal-area, used for parcel areas
+EQUAL_AREA_CRS = 'EPSG:5070'
+
+# Per-parcel analytics columns included in the output when present
+ANALYTICS_COLUMNS = ['acres', 'value_per_acre', 'productivity_class']
+
+
+def detect_parcel_format(path:str) -> str:
+    """ Identify an uploaded parcel file from its leading bytes
+
+    Args:
+        path (str): File path
+    Returns:
+        (str): One of PARCEL_FORMATS
+    """
+    with open(path, "rb") as f:
+        head = f.read(16)
+    for name, (magic, _) in PARCEL_FORMATS.items():
+        if head.startswith(magic):
+            return name
+    raise ParcelException(
+        "Unsupported file type. Upload a zipped shapefile, GeoPackage, FlatGeobuf or GeoParquet file."
+    )
+
+def _parquet_geometry_metadata(path:str) -> tuple:
+    """ CRS of the primary geometry column and whether a bbox covering column exists """
+
+    metadata = pq.read_schema(path).metadata or {}
+    geo = json.loads(metadata.get(b"geo", b"{}"))
+    column = geo.get("columns", {}).get(geo.get("primary_column", "geometry"), {})
+    # GeoParquet defaults to OGC:CRS84 when the crs key is absent
+    return column.get("crs", "OGC:CRS84"), "covering" in column
+
+def _read_parcel_frame(path:str, fmt:str, boundary_geom) -> gpd.GeoDataFrame:
+    """ Read a parcel file through Arrow, pushing the boundary's bbox into the read """
+
+    if fmt == PARQUET_FORMAT:
+        crs, has_covering = _parquet_geometry_metadata(path)
     else:
-        raise ParcelException("Uploaded file is not a zip file.")
-    try:
-
-        # Filter out invalid geometries
-        gdf = gdf[gdf.geometry.notna()]
-
-        # Check and convert CRS to NAD83 (EPSG:4269)
-        if gdf.crs != 'EPSG:4269':
-            print("Converting CRS...")
-            gdf = gdf.to_crs('EPSG:4269')
-
-        # Clip parcels to municipality boundary if provided
-        if muni_boundary:
-            boundary_geom = shape(muni_boundary['features'][0]['geometry'])
-            gdf = gdf[gdf.intersects(boundary_geom)]
-
-        # Compute shape area in a projected CRS to get correct values
-        gdf_projected = gdf.to_crs('EPSG:3857')  # Web Mercator, meters
-        gdf['shape_area'] = gdf_projected.geometry.area
-
-        # Extract as GeoJSON FeatureCollection
-        extracted = {'type': 'FeatureCollection', 'features': []}
-        for _, row in gdf.iterrows():
-            if row.geometry is None:
-                continue
-
-            properties = {
-                'objectid': str(row.get('OBJECTID', '')),
-                'taxpin': str(row.get('TAXPIN', '')),
-                'assessed_value': str(row.get('TOTAL_APPR', '')),
-                'shape_area': float(row['shape_area']) if not math.isnan(row['shape_area']) else 0.0,
-                'address': str(row.get('LOCATION1', ''))
-            }
-
-            feature = {
-                'type': 'Feature',
-                'geometry': row.geometry.__geo_interface__,
-                'properties': properties
-            }
-            extracted['features'].append(feature)
-
-        return extracted
-    except Exception as e:
-        print(e)
-        raise ParcelException("Error processing uploaded parcel shapefile.")
+        crs, has_covering = pyogrio.read_info(path)["crs"], True
+
+    bbox = None
+    if boundary_geom is not None and crs is not None and has_covering:
+        # Filter in the file's own CRS so the reader can skip features
+        bbox = tuple(gpd.GeoSeries([boundary_geom], crs='EPSG:4269').to_crs(crs).total_bounds)
+
+    if fmt == PARQUET_FORMAT:
+        return gpd.read_parquet(path, bbox=bbox)
+    return pyogrio.read_dataframe(path, bbox=bbox, use_arrow=True)
+
+def read_parcels(path:str, boundary_geom=None) -> gpd.GeoDataFrame:
+    """ Read, reproject and clip an uploaded parcel file
+
+    Zipped shapefiles, GeoPackage, FlatGeobuf and GeoParquet are accepted.
+    With a boundary, only features whose envelope meets the boundary's
+    bounding box are read from the file.
+
+    Args:
+        path (str): Uploaded file path
+        boundary_geom (Geometry): Municipal boundary in EPSG:4269, or None
+    Returns:
+        (GeoDataFrame): Parcels in EPSG:4269 with a shape_area column (m²)
+    """
+    fmt = detect_parcel_format(path)
+    gdf = _read_parcel_frame(path, fmt, boundary_geom)
+
+    # Filter out invalid geometries
+    gdf = gdf[gdf.geometry.notna()]
+
+    # Check and convert CRS to NAD83 (EPSG:4269)
+    if gdf.crs != 'EPSG:4269':
+        gdf = gdf.to_crs('EPSG:4269')
+
+    # Clip parcels to municipality boundary if provided
+    if boundary_geom is not None:
+        gdf = gdf[clip_mask(gdf.geometry.values, boundary_geom)]
+
+    # Compute shape area in an equal-area CRS to get correct values
+    gdf = gdf.copy()
+    gdf['shape_area'] = gdf.geometry.to_crs(EQUAL_AREA_CRS).area  # square meters
+    return gdf
+
+def clip_mask(geometries, boundary_geom) -> np.ndarray:
+    """ Which geometries intersect the boundary
+
+    Parcels whose envelope crosses no boundary segment's envelope lie wholly
+    inside or outside, so one point-in-polygon test of an envelope corner
+    settles them. Only parcels near the boundary line (found through an
+    STRtree) get the exact predicate against the prepared boundary.
+
+    Args:
+        geometries (GeometryArray | ndarray): Parcel geometries
+        boundary_geom (Geometry): Municipal boundary
+    Returns:
+        (ndarray): Boolean mask
+    """
+    geometries = np.asarray(geometries)
+    mask = np.zeros(len(geometries), dtype=bool)
+    if len(geometries) == 0:
+        return mask
+
+    shapely.prepare(boundary_geom)
+
+    # Boundary rings split into segments, so each query envelope is small
+    segments = []
+    for ring in shapely.get_parts(shapely.boundary(boundary_geom)):
+        coords = shapely.get_coordinates(ring)
+        segments.append(shapely.linestrings(np.stack([coords[:-1], coords[1:]], axis=1)))
+    segments = np.concatenate(segments) if segments else np.empty(0, dtype=object)
+
+    tree = shapely.STRtree(geometries)
+    border = np.unique(tree.query(segments)[1])
+
+    bounds = shapely.bounds(geometries)
+    mask[:] = shapely.contains_xy(boundary_geom, bounds[:, 0], bounds[:, 1])
+    mask[border] = shapely.intersects(boundary_geom, geometries[border])
+    return mask
+
+def parcel_properties(gdf:gpd.GeoDataFrame) -> pd.DataFrame:
+    """ Rename and clean the output property columns in bulk
+
+    Missing columns and values become empty strings, a missing area 0.0.
+    Analytics columns are passed through when analyze_parcels added them.
+
+    Args:
+        gdf (GeoDataFrame): Parcels with a shape_area column
+    Returns:
+        (DataFrame): objectid, taxpin, assessed_value, shape_area and address
+            columns, then any analytics columns
+    """
+    properties = pd.DataFrame(index=gdf.index)
+    for name, column in PARCEL_COLUMNS.items():
+        if column in gdf.columns:
+            values = gdf[column].astype(object)
+            properties[name] = values.where(values.notna(), '').astype(str)
+        else:
+            properties[name] = ''
+    properties['shape_area'] = gdf['shape_area'].astype(float).fillna(0.0)
+    analytics = [column for column in ANALYTICS_COLUMNS if column in gdf.columns]
+    return pd.concat(
+        [properties[['objectid', 'taxpin', 'assessed_value', 'shape_area', 'address']], gdf[analytics]],
+        axis=1
+    )
 
 class ParcelException(Exception):
     """ Exception for parcel file error handling """
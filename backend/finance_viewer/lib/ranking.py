@@ -0,0 +1,217 @@
+""" Module for peer percentile ranks of municipal finance metrics
+
+Ranks are computed for every municipality and year of a metric at once
+with one lexsort over (year, peer group, value), then cached per metric and
+data version, so looking up a municipality is plain array indexing.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from finance_viewer.lib.directory import MunicipalityDirectory, get_municipality_directory
+from finance_viewer.lib.expressions import normalize_expression
+from finance_viewer.lib.metrics import FinanceCube, nan_to_none
+
+NATIONAL = "national"
+STATE = "state"
+POPULATION = "population"
+PEER_GROUPS = [NATIONAL, STATE, POPULATION]
+
+# Upper edges of the population bands, the last band is open-ended
+POPULATION_BANDS = [2500, 10000, 50000, 250000, 1000000]
+
+# Metric rankings kept per worker, oldest evicted first. Each holds a float32
+# and an int32 (municipality, year) array per peer group.
+CACHE_SIZE = 64
+
+
+def percentile_ranks(values:np.ndarray, groups:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """ Percentile of each value among the finite values of its group in the same year
+
+    The percentile is the share of peers with a lower value, counting ties
+    as half, so the median lands on 50.
+
+    Args:
+        values (ndarray): (municipality, year) values, NaN where missing
+        groups (ndarray): Peer group code per municipality, -1 for none
+    Returns:
+        (tuple): float32 percentiles (NaN where unranked) and int32 peer counts
+    """
+    percentiles = np.full(values.shape, np.nan, dtype=np.float32)
+    counts = np.zeros(values.shape, dtype=np.int32)
+
+    rows, cols = np.nonzero(np.isfinite(values) & (groups >= 0)[:, np.newaxis])
+    if rows.size == 0:
+        return percentiles, counts
+
+    keys = cols.astype(np.int64) * (int(groups.max()) + 1) + groups[rows]
+    ranked = values[rows, cols]
+    order = np.lexsort((ranked, keys))
+    keys, ranked, rows, cols = keys[order], ranked[order], rows[order], cols[order]
+    n = keys.size
+
+    # Start of each (year, group) block and of each run of equal values within it
+    new_key = np.concatenate(([True], keys[1:] != keys[:-1]))
+    new_run = new_key | np.concatenate(([True], ranked[1:] != ranked[:-1]))
+    key_start = np.flatnonzero(new_key)
+    key_id = np.cumsum(new_key) - 1
+    run_start = np.flatnonzero(new_run)
+    run_id = np.cumsum(new_run) - 1
+
+    size = np.diff(np.append(key_start, n))[key_id]
+    below = run_start[run_id] - key_start[key_id]
+    ties = np.diff(np.append(run_start, n))[run_id]
+
+    percentiles[rows, cols] = 100 * (below + 0.5 * ties) / size
+    counts[rows, cols] = size
+    return percentiles, counts
+
+def population_band_labels() -> list[str]:
+    """ Display label of each population band """
+
+    edges = [0, *POPULATION_BANDS]
+    labels = [f"{low:,}-{high - 1:,}" for low, high in zip(edges[:-1], edges[1:])]
+    return labels + [f"{POPULATION_BANDS[-1]:,}+"]
+
+
+class PeerGroups:
+    """ State and population band codes for every municipality of a cube """
+
+    def __init__(self, cube:FinanceCube, directory:MunicipalityDirectory):
+        self.key = (cube.version, directory.version)
+
+        states = {row[0]: row[2] for row in directory.rows}
+        self.state_names = sorted({state for state in states.values() if state})
+        state_codes = {state: code for code, state in enumerate(self.state_names)}
+        self.states = np.array([state_codes.get(states.get(mid), -1) for mid in cube.mids], dtype=np.int64)
+
+        # Boundary pop_2020, else the latest population reported in the finances
+        population = cube.attributes.get("pop_2020", np.full(len(cube.mids), np.nan)).copy()
+        reported = cube.field("population") if "population" in cube.field_index else np.full((len(cube.mids), 0), np.nan)
+        if reported.shape[1]:
+            finite = np.isfinite(reported)
+            last = reported.shape[1] - 1 - np.argmax(finite[:, ::-1], axis=1)
+            latest = np.where(finite.any(axis=1), reported[np.arange(len(cube.mids)), last], np.nan)
+            population = np.where(np.isfinite(population), population, latest)
+        self.population = population
+        self.bands = np.where(
+            np.isfinite(population), np.searchsorted(POPULATION_BANDS, population, side='right'), -1
+        ).astype(np.int64)
+
+    def codes(self, group:str) -> np.ndarray:
+        """ Group code per municipality for a peer group name """
+
+        if group == STATE:
+            return self.states
+        if group == POPULATION:
+            return self.bands
+        return np.zeros(len(self.states), dtype=np.int64)
+
+
+class MetricRanking:
+    """ Percentiles and peer counts of one metric for every peer group """
+
+    def __init__(self, metric:str, version:int, values:np.ndarray, peers:PeerGroups):
+        self.metric = metric
+        self.version = version
+        self.ranks = {group: percentile_ranks(values, peers.codes(group)) for group in PEER_GROUPS}
+
+
+_lock = threading.Lock()
+_rankings = OrderedDict()
+_local = {"peers": None}
+
+def get_peer_groups(cube:FinanceCube) -> PeerGroups:
+    """ Get this worker's peer groups for a cube and the current directory """
+
+    directory = get_municipality_directory()
+    key = (cube.version, directory.version)
+    peers = _local["peers"]
+    if peers is not None and peers.key == key:
+        return peers
+
+    with _lock:
+        peers = _local["peers"]
+        if peers is None or peers.key != key:
+            peers = PeerGroups(cube, directory)
+            _local["peers"] = peers
+        return peers
+
+def get_metric_ranking(cube:FinanceCube, metric:str) -> MetricRanking:
+    """ Get the cached ranking of a metric for the cube's data version
+
+    Args:
+        cube (FinanceCube): Finance cube
+        metric (str): Raw, derived or custom metric expression
+    Returns:
+        (MetricRanking): Ranking
+    """
+    metric = normalize_expression(metric)
+    peers = get_peer_groups(cube)
+    key = (metric, peers.key)
+
+    with _lock:
+        ranking = _rankings.get(key)
+        if ranking is not None:
+            _rankings.move_to_end(key)
+            return ranking
+
+    ranking = MetricRanking(metric, cube.version, cube.metric(metric), peers)
+
+    with _lock:
+        _rankings[key] = ranking
+        while len(_rankings) > CACHE_SIZE:
+            _rankings.popitem(last=False)
+    return ranking
+
+def rank_municipality(cube:FinanceCube, mid:str, metrics:list[str], groups:list[str] | None = None,
+                      start_year:int | None = None, end_year:int | None = None) -> dict | None:
+    """ Percentile ranks of one municipality for several metrics
+
+    Args:
+        cube (FinanceCube): Finance cube
+        mid (str): Municipality ID
+        metrics (list): Raw, derived or custom metric expressions
+        groups (list): Peer groups (national, state, population), all when None
+        start_year (int): First year (inclusive)
+        end_year (int): Last year (inclusive)
+    Returns:
+        (dict): Years, peer group labels and per metric values, percentiles
+            and peer counts per group; None when the municipality has no finances
+    """
+    row = cube.mid_index.get(mid)
+    if row is None:
+        return None
+
+    groups = groups or PEER_GROUPS
+    unknown = [group for group in groups if group not in PEER_GROUPS]
+    if unknown:
+        raise KeyError(f"Unknown peer group(s): {', '.join(unknown)}.")
+
+    peers = get_peer_groups(cube)
+    cols = cube.years_for(start_year, end_year)
+    band = int(peers.bands[row])
+
+    result = {
+        "mid": mid,
+        "years": cube.years[cols].tolist(),
+        "state": peers.state_names[peers.states[row]] if peers.states[row] >= 0 else None,
+        "population": float(peers.population[row]) if np.isfinite(peers.population[row]) else None,
+        "population_band": population_band_labels()[band] if band >= 0 else None,
+        "metrics": {},
+    }
+    for metric in metrics:
+        ranking = get_metric_ranking(cube, metric)
+        result["metrics"][metric] = {
+            "values": nan_to_none(cube.evaluate(metric, [mid], start_year, end_year)["values"][0]),
+            **{
+                group: {
+                    "percentile": nan_to_none(np.round(ranking.ranks[group][0][row, cols].astype(np.float64), 2)),
+                    "peers": ranking.ranks[group][1][row, cols].tolist(),
+                }
+                for group in groups
+            }
+        }
+    return result
@@ -0,0 +1,149 @@
+""" Module for resolving municipality names to mids in bulk
+
+Names are matched within their state and county, first exactly, then on
+the normalized name ("City of St. Paul" -> "saint paul"), then by trigram
+similarity. Every match carries a confidence, and callers accept matches
+above a threshold. A normalized or fuzzy match never pairs names whose
+government types differ ("Village of Hempstead" and "Town of Hempstead").
+"""
+
+import threading
+
+from finance_viewer.lib.directory import get_municipality_directory
+from finance_viewer.lib.names import government_type, name_trigrams, normalize_name
+
+EXACT_MATCH = "exact"
+NORMALIZED_MATCH = "normalized"
+FUZZY_MATCH = "fuzzy"
+
+# Confidence of each match kind; fuzzy matches scale with trigram (Dice) similarity
+EXACT_CONFIDENCE = 1.0
+NORMALIZED_CONFIDENCE = 0.95
+FUZZY_CONFIDENCE = 0.9
+
+# Several municipalities sharing a normalized name in one county ("Town of X" and "Village of X")
+AMBIGUOUS_CONFIDENCE = 0.5
+
+# Least trigram similarity considered for a fuzzy match
+MIN_SIMILARITY = 0.5
+
+# Confidence required to treat a match as the same municipality
+ACCEPT_CONFIDENCE = 0.8
+
+_lock = threading.Lock()
+_local = {"resolver": None}
+
+
+class MunicipalityResolver:
+    """ Exact and normalized name lookups plus per-county trigram sets over the directory """
+
+    def __init__(self, version:int, rows:list[list]):
+        self.version = version
+        self.rows = rows
+
+        self._exact = {}
+        self._normalized = {}
+        self._counties = {}
+        self._trigrams = []
+        self._types = []
+        for i, (_, name, state, county_fips) in enumerate(rows):
+            normalized = normalize_name(name)
+            self._types.append(government_type(name))
+            self._exact.setdefault((state, county_fips, name), i)
+            self._normalized.setdefault((state, county_fips, normalized), []).append(i)
+            self._counties.setdefault((state, county_fips), []).append(i)
+            self._trigrams.append(name_trigrams(normalized))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def resolve(self, queries:list[tuple[str, str, str]]) -> list[dict | None]:
+        """ Resolve (name, state abbreviation, county FIPS) tuples
+
+        Repeated tuples are resolved once.
+
+        Args:
+            queries (list): (name, state, county_fips) tuples
+        Returns:
+            (list): Best match per query (mid, name, match, confidence), None when nothing is similar enough
+        """
+        resolved = {query: self._resolve_one(*query) for query in dict.fromkeys(queries)}
+        return [resolved[query] for query in queries]
+
+    def _resolve_one(self, name:str, state:str, county_fips:str) -> dict | None:
+        if not name or not state:
+            return None
+        county_fips = county_fips or ''
+
+        i = self._exact.get((state, county_fips, name))
+        if i is not None:
+            return self._match(i, EXACT_MATCH, EXACT_CONFIDENCE)
+
+        normalized = normalize_name(name)
+        kind = government_type(name)
+        candidates = [
+            i for i in self._normalized.get((state, county_fips, normalized), []) if self._same_type(kind, i)
+        ]
+        if candidates:
+            confidence = NORMALIZED_CONFIDENCE if len(candidates) == 1 else AMBIGUOUS_CONFIDENCE
+            return self._match(candidates[0], NORMALIZED_MATCH, confidence)
+
+        trigrams = name_trigrams(normalized)
+        best, best_similarity = None, 0.0
+        for i in self._counties.get((state, county_fips), []):
+            if not self._same_type(kind, i):
+                continue
+            shared = len(trigrams & self._trigrams[i])
+            similarity = 2 * shared / (len(trigrams) + len(self._trigrams[i])) if shared else 0.0
+            if similarity > best_similarity:
+                best, best_similarity = i, similarity
+        if best is None or best_similarity < MIN_SIMILARITY:
+            return None
+        return self._match(best, FUZZY_MATCH, FUZZY_CONFIDENCE * best_similarity)
+
+    def _same_type(self, kind:str | None, i:int) -> bool:
+        """ Whether a name of this government type may be the municipality at row i """
+
+        return kind is None or self._types[i] is None or kind == self._types[i]
+
+    def _match(self, i:int, kind:str, confidence:float) -> dict:
+        return {
+            "mid": self.rows[i][0],
+            "name": self.rows[i][1],
+            "match": kind,
+            "confidence": round(confidence, 4),
+        }
+
+
+def get_resolver() -> MunicipalityResolver:
+    """ Get this worker's resolver, rebuilt when the directory version changes
+
+    Returns:
+        (MunicipalityResolver): Resolver
+    """
+    directory = get_municipality_directory()
+    resolver = _local["resolver"]
+    if resolver is not None and resolver.version == directory.version:
+        return resolver
+
+    with _lock:
+        resolver = _local["resolver"]
+        if resolver is None or resolver.version != directory.version:
+            resolver = MunicipalityResolver(directory.version, directory.rows)
+            _local["resolver"] = resolver
+        return resolver
+
+def resolve_mids(queries:list[tuple[str, str, str]],
+              min_confidence:float = ACCEPT_CONFIDENCE) -> list[dict | None]:
+    """ Resolve (name, state abbreviation, county FIPS) tuples to accepted matches
+
+    Args:
+        queries (list): (name, state, county_fips) tuples
+        min_confidence (float): Least confidence of an accepted match
+    Returns:
+        (list): Match per query, None when no match reaches min_confidence
+    """
+    return [
+        match if match is not None and match["confidence"] >= min_confidence else None
+        for match in get_resolver().resolve(queries)
+    ]
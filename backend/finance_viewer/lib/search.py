@@ -0,0 +1,170 @@
+""" Module for the in-memory municipality typeahead search index """
+
+import bisect
+import threading
+
+import numpy as np
+
+from finance_viewer.lib.directory import get_municipality_directory
+from finance_viewer.lib.names import name_trigrams, normalize_name
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# Minimum trigram (Dice) similarity for fuzzy-only matches
+MIN_SIMILARITY = 0.3
+
+# Score boosts on top of trigram similarity
+EXACT_BOOST = 3.0
+PREFIX_BOOST = 2.0
+TOKEN_PREFIX_BOOST = 1.0
+
+_lock = threading.Lock()
+_local = {"index": None}
+
+
+class MunicipalitySearchIndex:
+    """ Prefix and trigram index over municipality name, state and county """
+
+    def __init__(self, version:int, rows:list[list]):
+        self.version = version
+        self.rows = rows
+
+        self.normalized = [normalize_name(row[1]) for row in rows]
+
+        states = sorted({row[2] for row in rows})
+        self._state_codes = {state: code for code, state in enumerate(states)}
+        self.states = np.array([self._state_codes[row[2]] for row in rows], dtype=np.int16)
+        self.counties = np.array([row[3] or "" for row in rows])
+
+        # Sorted keys with their row ids for prefix lookups on the full name and on each word
+        names = sorted((name, i) for i, name in enumerate(self.normalized))
+        self._name_keys = [name for name, _ in names]
+        self._name_rows = np.array([i for _, i in names], dtype=np.int32)
+        tokens = sorted(
+            (token, i) for i, name in enumerate(self.normalized) for token in set(name.split())
+        )
+        self._token_keys = [token for token, _ in tokens]
+        self._token_rows = np.array([i for _, i in tokens], dtype=np.int32)
+
+        # Trigram postings as int32 arrays so candidate counting is a bincount
+        postings = {}
+        trigram_counts = np.zeros(len(rows), dtype=np.float32)
+        for i, name in enumerate(self.normalized):
+            trigrams = name_trigrams(name)
+            trigram_counts[i] = len(trigrams)
+            for trigram in trigrams:
+                postings.setdefault(trigram, []).append(i)
+        self._postings = {t: np.array(ids, dtype=np.int32) for t, ids in postings.items()}
+        self._trigram_counts = trigram_counts
+
+    def __len__(self):
+        return len(self.rows)
+
+    def search(self, query:str, limit:int = DEFAULT_LIMIT, state:str | None = None,
+               county_fips:str | None = None) -> list[dict]:
+        """ Rank municipalities against a typeahead query
+
+        Every query token is matched as part of the name, a state filter only
+        applies when state is given ("saint pa" is a partly typed "saint paul",
+        not a search in Pennsylvania).
+
+        Args:
+            query (str): Search text
+            limit (int): Maximum number of matches
+            state (str): Optional state abbreviation filter
+            county_fips (str): Optional 5-digit county FIPS filter
+        Returns:
+            (list): Matches ordered by descending score
+        """
+        normalized = normalize_name(query)
+        if not normalized or len(self.rows) == 0:
+            return []
+
+        scores = self._trigram_similarity(normalized)
+        scores[scores < MIN_SIMILARITY] = 0
+
+        # The last token may be partly typed ("st" for "stamford"), so its raw form prefix-matches too
+        boosts = self._prefix_boosts(normalized)
+        partial = normalize_name(query, expand_last=False)
+        if partial != normalized:
+            boosts = np.maximum(boosts, self._prefix_boosts(partial))
+        scores += boosts
+
+        if state:
+            code = self._state_codes.get(state.upper())
+            if code is None:
+                return []
+            scores[self.states != code] = 0
+        if county_fips:
+            scores[self.counties != county_fips] = 0
+
+        limit = max(1, min(limit, MAX_LIMIT))
+        matched = np.flatnonzero(scores)
+        if matched.size > limit:
+            matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+
+        ranked = sorted(matched, key=lambda i: (-scores[i], len(self.normalized[i]), self.normalized[i]))
+        return [
+            {
+                "mid": self.rows[i][0],
+                "name": self.rows[i][1],
+                "state": self.rows[i][2],
+                "county_fips": self.rows[i][3],
+                "score": round(float(scores[i]), 4)
+            }
+            for i in ranked
+        ]
+
+    def _prefix_boosts(self, normalized:str) -> np.ndarray:
+        """ Exact, name prefix and word prefix boosts of every name for a normalized query """
+
+        boosts = np.zeros(len(self.rows), dtype=np.float32)
+        start, exact_end, end = self._prefix_range(self._name_keys, normalized)
+        boosts[self._name_rows[start:exact_end]] += EXACT_BOOST
+        boosts[self._name_rows[exact_end:end]] += PREFIX_BOOST
+
+        query_tokens = set(normalized.split())
+        for token in query_tokens:
+            start, _, end = self._prefix_range(self._token_keys, token)
+            boosts[self._token_rows[start:end]] += TOKEN_PREFIX_BOOST / len(query_tokens)
+        return boosts
+
+    def _trigram_similarity(self, normalized:str) -> np.ndarray:
+        """ Dice similarity between the query and every name """
+
+        trigrams = name_trigrams(normalized)
+        postings = [self._postings[t] for t in trigrams if t in self._postings]
+        if not postings:
+            return np.zeros(len(self.rows), dtype=np.float32)
+
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.rows)).astype(np.float32)
+        return 2 * shared / (self._trigram_counts + len(trigrams))
+
+    @staticmethod
+    def _prefix_range(keys:list[str], prefix:str) -> tuple[int, int, int]:
+        """ Positions in sorted keys: [start, exact_end) equal prefix, [start, end) start with it """
+
+        start = bisect.bisect_left(keys, prefix)
+        exact_end = bisect.bisect_right(keys, prefix, lo=start)
+        end = bisect.bisect_left(keys, prefix + "\uffff", lo=exact_end)
+        return start, exact_end, end
+
+
+def get_search_index() -> MunicipalitySearchIndex:
+    """ Get this worker's search index, rebuilt when the directory version changes
+
+    Returns:
+        (MunicipalitySearchIndex): Search index
+    """
+    directory = get_municipality_directory()
+    index = _local["index"]
+    if index is not None and index.version == directory.version:
+        return index
+
+    with _lock:
+        index = _local["index"]
+        if index is None or index.version != directory.version:
+            index = MunicipalitySearchIndex(directory.version, directory.rows)
+            _local["index"] = index
+        return index
@@ -0,0 +1,158 @@
+""" Module for building Mapbox Vector Tiles of municipal boundaries """
+
+from django.db import connections
+
+# Layer names exposed to the map client
+TILE_LAYER = "municipalities"
+PARCEL_TILE_LAYER = "parcels"
+
+# Tile coordinate space and clipping buffer (in tile units)
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+MAX_ZOOM = 22
+
+# Web Mercator world width in meters
+WORLD_EXTENT_M = 40075016.68557849
+
+# Geometry is simplified to this many tile units before quantization
+SIMPLIFY_TILE_UNITS = 4
+
+
+def is_valid_tile(z:int, x:int, y:int) -> bool:
+    """ Check that tile coordinates address an existing XYZ tile
+
+    Args:
+        z (int): Zoom level
+        x (int): Tile column
+        y (int): Tile row
+    Returns:
+        (bool): True when the tile exists at the zoom level
+    """
+    if z < 0 or z > MAX_ZOOM:
+        return False
+    limit = 2 ** z
+    return 0 <= x < limit and 0 <= y < limit
+
+def simplify_tolerance(z:int) -> float:
+    """ Simplification tolerance in Web Mercator meters for a zoom level
+
+    Args:
+        z (int): Zoom level
+    Returns:
+        (float): Tolerance in meters
+    """
+    return WORLD_EXTENT_M / (TILE_EXTENT * 2 ** z) * SIMPLIFY_TILE_UNITS
+
+def build_municipal_tile(z:int, x:int, y:int) -> bytes:
+    """ Build a Mapbox Vector Tile of municipal boundaries
+
+    Geometry is transformed to Web Mercator, simplified for the zoom level
+    and clipped to the tile envelope by PostGIS.
+
+    Args:
+        z (int): Zoom level
+        x (int): Tile column
+        y (int): Tile row
+    Returns:
+        (bytes): Encoded tile, empty when no municipality intersects it
+    """
+    with connections['gis_boundaries'].cursor() as cursor:
+        cursor.execute("""
+            WITH bounds AS (
+                SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom
+            ),
+            features AS (
+                SELECT
+                    c.mid::text AS mid,
+                    b.id,
+                    b.municipal_name,
+                    b.municipal_type,
+                    b.county_name,
+                    b.state,
+                    b.pop_2020,
+                    b.sq_mi,
+                    ST_AsMVTGeom(
+                        ST_Simplify(ST_Transform(b.geometry, 3857), %(tolerance)s, true),
+                        bounds.geom,
+                        %(extent)s,
+                        %(buffer)s,
+                        true
+                    ) AS geom
+                FROM municipal_boundaries b
+                JOIN municipal_boundary_crosswalk c ON c.boundary_id = b.id
+                CROSS JOIN bounds
+                WHERE b.geometry && ST_Transform(bounds.geom, 4269)
+            )
+            SELECT ST_AsMVT(features, %(layer)s, %(extent)s, 'geom')
+            FROM features
+            WHERE geom IS NOT NULL
+        """, {
+            "z": z,
+            "x": x,
+            "y": y,
+            "tolerance": simplify_tolerance(z),
+            "extent": TILE_EXTENT,
+            "buffer": TILE_BUFFER,
+            "layer": TILE_LAYER,
+        })
+        row = cursor.fetchone()
+
+    return bytes(row[0]) if row and row[0] else b""
+
+def build_parcel_tile(mid:str, content_hash:str, z:int, x:int, y:int) -> bytes:
+    """ Build a Mapbox Vector Tile of a stored parcel upload
+
+    Args:
+        mid (str): Municipality ID
+        content_hash (str): sha256 of the uploaded file
+        z (int): Zoom level
+        x (int): Tile column
+        y (int): Tile row
+    Returns:
+        (bytes): Encoded tile, empty when no parcel intersects it
+    """
+    with connections['gis_boundaries'].cursor() as cursor:
+        cursor.execute("""
+            WITH bounds AS (
+                SELECT ST_TileEnvelope(%(z)s, %(x)s, %(y)s) AS geom
+            ),
+            features AS (
+                SELECT
+                    p.id,
+                    p.objectid,
+                    p.taxpin,
+                    p.assessed_value,
+                    p.address,
+                    p.acres,
+                    p.value_per_acre,
+                    p.productivity_class,
+                    ST_AsMVTGeom(
+                        ST_Simplify(ST_Transform(p.geometry, 3857), %(tolerance)s, true),
+                        bounds.geom,
+                        %(extent)s,
+                        %(buffer)s,
+                        true
+                    ) AS geom
+                FROM municipal_parcels p
+                CROSS JOIN bounds
+                WHERE p.mid = %(mid)s
+                    AND p.content_hash = %(content_hash)s
+                    AND p.geometry && ST_Transform(bounds.geom, 4269)
+            )
+            SELECT ST_AsMVT(features, %(layer)s, %(extent)s, 'geom')
+            FROM features
+            WHERE geom IS NOT NULL
+        """, {
+            "mid": mid,
+            "content_hash": content_hash,
+            "z": z,
+            "x": x,
+            "y": y,
+            "tolerance": simplify_tolerance(z),
+            "extent": TILE_EXTENT,
+            "buffer": TILE_BUFFER,
+            "layer": PARCEL_TILE_LAYER,
+        })
+        row = cursor.fetchone()
+
+    return bytes(row[0]) if row and row[0] else b""
@@ -0,0 +1,183 @@
+""" Module for year-over-year, CAGR and rolling window trends of finance metrics
+
+Trends are computed for every municipality at once over the cube's
+contiguous year axis, where a missing fiscal year is NaN. Changes are never
+taken across a gap: year-over-year needs both adjacent years, and CAGR
+measures from the first reported year inside the window over the actual
+number of years elapsed.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from finance_viewer.lib.expressions import normalize_expression
+from finance_viewer.lib.metrics import FinanceCube, nan_to_none
+
+DEFAULT_WINDOW = 3
+MAX_WINDOW = 20
+
+TREND_SERIES = ["values", "yoy", "cagr", "rolling_mean", "volatility"]
+
+# Trend layers kept per worker, oldest evicted first
+CACHE_SIZE = 32
+
+
+def year_over_year(values:np.ndarray) -> np.ndarray:
+    """ Relative change from the previous fiscal year, NaN across gaps or from zero """
+
+    change = np.full(values.shape, np.nan)
+    previous, current = values[:, :-1], values[:, 1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change[:, 1:] = (current - previous) / np.abs(previous)
+    change[~np.isfinite(change)] = np.nan
+    return change
+
+def compound_growth(values:np.ndarray, window:int) -> np.ndarray:
+    """ Compound annual growth rate over the trailing window
+
+    Growth runs from the first reported year in [t - window, t) to year t,
+    over the years actually elapsed. Both ends must be positive.
+    """
+    years = values.shape[1]
+    positions = np.arange(years)
+
+    # Position of the next reported year at or after each position, `years` when none
+    reported = np.where(np.isfinite(values), positions, years)
+    next_reported = np.minimum.accumulate(reported[:, ::-1], axis=1)[:, ::-1]
+
+    start = next_reported[:, np.clip(positions - window, 0, None)]
+    span = positions - start
+    start_values = np.take_along_axis(values, np.clip(start, 0, years - 1), axis=1)
+
+    valid = (positions >= window) & (span > 0) & (values > 0) & (start_values > 0)
+    growth = np.full(values.shape, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth[valid] = (values[valid] / start_values[valid]) ** (1 / span[valid]) - 1
+    return growth
+
+def _rolling_sums(values:np.ndarray, window:int) -> tuple[np.ndarray, np.ndarray]:
+    """ Count and sum of the finite values in each trailing window """
+
+    finite = np.isfinite(values)
+    filled = np.where(finite, values, 0.0)
+
+    def windowed(array):
+        totals = np.concatenate((np.zeros((array.shape[0], 1)), np.cumsum(array, axis=1)), axis=1)
+        end = np.arange(1, array.shape[1] + 1)
+        return totals[:, end] - totals[:, np.maximum(end - window, 0)]
+
+    return windowed(finite.astype(np.float64)), windowed(filled)
+
+def rolling_mean(values:np.ndarray, window:int) -> np.ndarray:
+    """ Mean of the reported years in each trailing window, needing at least half of them """
+
+    count, total = _rolling_sums(values, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(count >= (window + 1) // 2, total / count, np.nan)
+
+def rolling_volatility(values:np.ndarray, window:int) -> np.ndarray:
+    """ Sample standard deviation of year-over-year changes in each trailing window
+
+    Computed from values centered on each window's mean, like np.nanstd(ddof=1),
+    rather than from running sums of squares, which cancel for similar values.
+    """
+    changes = year_over_year(values)
+    if changes.shape[1] == 0:
+        return changes
+    padded = np.concatenate((np.full((changes.shape[0], window - 1), np.nan), changes), axis=1)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=1)
+
+    count = np.isfinite(windows).sum(axis=2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.nansum(windows, axis=2) / count
+        squares = np.nansum((windows - mean[:, :, np.newaxis]) ** 2, axis=2)
+        return np.where(count >= 2, np.sqrt(squares / (count - 1)), np.nan)
+
+
+class TrendLayer:
+    """ Every trend series of one metric and window for every municipality of a cube """
+
+    def __init__(self, metric:str, window:int, version:int, values:np.ndarray):
+        self.metric = metric
+        self.window = window
+        self.version = version
+        self.series = {
+            "values": values,
+            "yoy": year_over_year(values),
+            "cagr": compound_growth(values, window),
+            "rolling_mean": rolling_mean(values, window),
+            "volatility": rolling_volatility(values, window),
+        }
+
+
+def build_trends(cube:FinanceCube, metric:str, window:int = DEFAULT_WINDOW) -> TrendLayer:
+    """ Compute the trend series of a metric from the finance cube
+
+    Args:
+        cube (FinanceCube): Finance cube
+        metric (str): Raw, derived or custom metric expression
+        window (int): Trailing window in years for CAGR, rolling mean and volatility
+    Returns:
+        (TrendLayer): Layer
+    """
+    values = np.array(cube.metric(metric), dtype=np.float64)
+    return TrendLayer(metric, window, cube.version, values)
+
+
+_lock = threading.Lock()
+_layers = OrderedDict()
+
+def get_trends(cube:FinanceCube, metric:str, window:int = DEFAULT_WINDOW) -> TrendLayer:
+    """ Get a cached trend layer for (metric, window, data version)
+
+    Args:
+        cube (FinanceCube): Finance cube
+        metric (str): Raw, derived or custom metric expression
+        window (int): Trailing window in years
+    Returns:
+        (TrendLayer): Layer
+    """
+    window = max(1, min(window, MAX_WINDOW))
+    metric = normalize_expression(metric)
+    key = (metric, window, cube.version)
+
+    with _lock:
+        layer = _layers.get(key)
+        if layer is not None:
+            _layers.move_to_end(key)
+            return layer
+
+    layer = build_trends(cube, metric, window)
+
+    with _lock:
+        _layers[key] = layer
+        while len(_layers) > CACHE_SIZE:
+            _layers.popitem(last=False)
+    return layer
+
+def trend_payload(cube:FinanceCube, layer:TrendLayer, mids:list[str] | None = None,
+                  start_year:int | None = None, end_year:int | None = None) -> dict:
+    """ Slice a trend layer for a set of municipalities and years
+
+    Args:
+        cube (FinanceCube): Cube the layer was built from
+        layer (TrendLayer): Trend layer
+        mids (list): Municipality ids, all when None
+        start_year (int): First year (inclusive)
+        end_year (int): Last year (inclusive)
+    Returns:
+        (dict): metric, window, version, mids, years and one
+            (municipality, year) list per trend series
+    """
+    rows = cube.rows_for(mids)
+    cols = cube.years_for(start_year, end_year)
+    return {
+        "metric": layer.metric,
+        "window": layer.window,
+        "version": layer.version,
+        "mids": cube.mids[rows].tolist(),
+        "years": cube.years[cols].tolist(),
+        **{name: nan_to_none(layer.series[name][np.ix_(rows, cols)]) for name in TREND_SERIES},
+    }
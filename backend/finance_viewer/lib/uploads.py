@@ -0,0 +1,63 @@
+""" Module for memory-bounded upload handling
+
+Uploaded files are always spooled to a temporary file in chunks, hashed as
+they stream in and cut off once they pass UPLOAD_MAX_BYTES, so no upload is
+ever held in memory whole.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+
+# Request attribute set when an upload is stopped for exceeding the limit
+LIMIT_EXCEEDED_ATTR = "upload_limit_exceeded"
+
+
+class HashingTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """ Spool uploads to disk while computing their sha256 and enforcing the size limit
+
+    The finished file carries the hex digest as ``content_hash``.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.digest = None
+        self.received = 0
+        self.declared_too_large = False
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Refuse at the first file when the declared body is already too large
+        self.declared_too_large = bool(content_length and content_length > settings.UPLOAD_MAX_BYTES)
+        return super().handle_raw_input(input_data, META, content_length, boundary, encoding)
+
+    def new_file(self, *args, **kwargs):
+        if self.declared_too_large:
+            self._limit_exceeded()
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_MAX_BYTES:
+            # The parser closes (and so deletes) the partial temporary file
+            self._limit_exceeded()
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        uploaded.content_hash = self.digest.hexdigest()
+        return uploaded
+
+    def _limit_exceeded(self):
+        if self.request is not None:
+            setattr(self.request, LIMIT_EXCEEDED_ATTR, True)
+        raise StopUpload(connection_reset=True)
+
+
+def upload_limit_exceeded(request) -> bool:
+    """ Whether an upload on this request was stopped for exceeding UPLOAD_MAX_BYTES """
+
+    return getattr(request, LIMIT_EXCEEDED_ATTR, False)
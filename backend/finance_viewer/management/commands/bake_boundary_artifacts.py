@@ -0,0 +1,64 @@
+""" Management command to bake precompressed boundary GeoJSON artifacts """
+
+from django.core.management.base import BaseCommand
+
+from finance_viewer.lib.artifacts import (
+    artifact_key,
+    load_manifest,
+    remove_stale_artifacts,
+    write_artifact,
+    write_manifest
+)
+from finance_viewer.lib.geojson_stream import feature_collection_chunks
+from finance_viewer.lib.gis import (
+    BOUNDARY_RESOLUTIONS,
+    query_state_boundaries,
+    query_state_municipal_boundaries
+)
+from finance_viewer.models.municipal_finance import Municipalities
+
+
+class Command(BaseCommand):
+    help = "Write content-hashed, precompressed GeoJSON artifacts for state and municipal boundaries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--state",
+            action="append",
+            help="State abbreviation to bake municipal boundaries for (repeatable, defaults to all)"
+        )
+        parser.add_argument(
+            "--skip-states",
+            action="store_true",
+            help="Do not rebuild the nationwide state boundaries artifacts"
+        )
+
+    def handle(self, *args, **options):
+        levels = [None] + [option["level"] for option in BOUNDARY_RESOLUTIONS.values()]
+        manifest = dict(load_manifest())
+
+        if not options["skip_states"]:
+            for level in levels:
+                key = artifact_key("states", level)
+                manifest[key] = write_artifact(key, self._encode(query_state_boundaries(level)))
+                self.stdout.write(f"{key}: {manifest[key]['file']}")
+
+        states = options["state"] or sorted(
+            Municipalities.objects.using('municipal_finance').values_list('state', flat=True).distinct()
+        )
+        for state in states:
+            for level in levels:
+                key = artifact_key("municipalities", level, state)
+                manifest[key] = write_artifact(
+                    key, self._encode(query_state_municipal_boundaries(state, level))
+                )
+                self.stdout.write(f"{key}: {manifest[key]['file']}")
+
+        write_manifest(manifest)
+        remove_stale_artifacts(manifest)
+
+        self.stdout.write(self.style.SUCCESS(f"Baked {len(manifest)} boundary artifacts."))
+
+    def _encode(self, features) -> bytes:
+        """ Assemble encoded features into a FeatureCollection document """
+        return b"".join(feature_collection_chunks(features))
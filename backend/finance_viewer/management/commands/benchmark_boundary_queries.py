@@ -0,0 +1,86 @@
+""" Management command comparing the legacy OR-filter boundary query with the crosswalk join """
+
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.serializers import serialize
+from django.db.models import Q
+from django.db.models.functions import Substr
+
+from finance_viewer.lib.geojson_stream import feature_collection_chunks
+from finance_viewer.lib.gis import MUNICIPAL_BOUNDARY_FIELDS, query_state_municipal_boundaries
+from finance_viewer.models.municipal_finance import Municipalities
+from finance_viewer.models.gis_boundaries import MunicipalBoundaries
+
+DEFAULT_STATES = ["TX", "PA", "IL", "OH", "MN"]
+
+
+def legacy_state_municipal_boundaries(state_abbr:str) -> int:
+    """ Previous implementation: one OR clause per municipality, serializer
+    round trip and mids rematched in Python """
+
+    state_municipalities = Municipalities.objects.using('municipal_finance').filter(
+        state=state_abbr
+    ).values_list('county_fips', 'name', 'mid')
+    muni_lookup = {(county_fips, name): mid for county_fips, name, mid in state_municipalities}
+
+    condition = Q()
+    for county_fips, name, _ in state_municipalities:
+        condition |= Q(legacy_fips5=county_fips, municipal_name=name)
+
+    qs = MunicipalBoundaries.objects.using('gis_boundaries').annotate(
+        legacy_fips5=Substr('fips_code', 1, 5)
+    ).filter(Q(state=state_abbr) & condition)
+
+    data = json.loads(serialize("geojson", qs, geometry_field="geometry", fields=MUNICIPAL_BOUNDARY_FIELDS))
+    for feature in data['features']:
+        props = feature['properties']
+        props['mid'] = muni_lookup.get(((props.get('fips_code') or '')[:5], props['municipal_name']))
+    json.dumps(data, default=str)
+    return len(data['features'])
+
+def crosswalk_state_municipal_boundaries(state_abbr:str) -> int:
+    """ Current implementation: crosswalk join streamed as encoded GeoJSON """
+
+    features = list(query_state_municipal_boundaries(state_abbr))
+    for _ in feature_collection_chunks(features):
+        pass
+    return len(features)
+
+
+class Command(BaseCommand):
+    help = "Benchmark state municipal boundary queries before and after the crosswalk"
+
+    def add_arguments(self, parser):
+        parser.add_argument("states", nargs="*", default=DEFAULT_STATES, help="State abbreviations")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per state and query")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'state':<6}{'features':>10}{'legacy (s)':>14}{'crosswalk (s)':>16}{'speedup':>10}")
+
+        for state in options["states"]:
+            state = state.upper()
+            legacy_time, legacy_count = self._time(legacy_state_municipal_boundaries, state, options["repeat"])
+            crosswalk_time, crosswalk_count = self._time(crosswalk_state_municipal_boundaries, state, options["repeat"])
+
+            if legacy_count != crosswalk_count:
+                self.stderr.write(
+                    f"{state}: legacy returned {legacy_count} features, crosswalk returned {crosswalk_count}"
+                )
+
+            speedup = legacy_time / crosswalk_time if crosswalk_time else float("inf")
+            self.stdout.write(
+                f"{state:<6}{crosswalk_count:>10}{legacy_time:>14.3f}{crosswalk_time:>16.3f}{speedup:>9.1f}x"
+            )
+
+    def _time(self, query, state:str, repeat:int) -> tuple[float, int]:
+        """ Best wall time over several runs and the feature count """
+
+        best = float("inf")
+        count = 0
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            count = query(state)
+            best = min(best, time.perf_counter() - start)
+        return best, count
@@ -0,0 +1,92 @@
+""" Management command benchmarking the municipality typeahead index on the national list """
+
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from finance_viewer.lib.directory import query_directory_rows
+from finance_viewer.lib.search import MunicipalitySearchIndex
+
+SAMPLE_QUERIES = [
+    "spr",
+    "springfield",
+    "springfeild",
+    "st louis",
+    "saint louis mo",
+    "ft worth",
+    "city of austin",
+    "pittsburg",
+    "mt pleasant",
+    "new",
+]
+
+
+def misspell(name:str, rng:random.Random) -> str:
+    """ Drop, swap or duplicate one character of a name """
+
+    if len(name) < 4:
+        return name
+    i = rng.randrange(1, len(name) - 1)
+    edit = rng.choice(("drop", "swap", "double"))
+    if edit == "drop":
+        return name[:i] + name[i + 1:]
+    if edit == "swap":
+        return name[:i - 1] + name[i] + name[i - 1] + name[i + 1:]
+    return name[:i] + name[i] + name[i:]
+
+
+class Command(BaseCommand):
+    help = "Benchmark municipality search index build time and query latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=1000, help="Random queries to run")
+        parser.add_argument("--limit", type=int, default=10, help="Matches returned per query")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed for sampled queries")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+
+        start = time.perf_counter()
+        rows = query_directory_rows()
+        load_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = MunicipalitySearchIndex(0, rows)
+        build_time = time.perf_counter() - start
+
+        self.stdout.write(f"Municipalities: {len(index)}")
+        self.stdout.write(f"Directory load: {load_time * 1000:.1f} ms, index build: {build_time * 1000:.1f} ms")
+
+        for query in SAMPLE_QUERIES:
+            matches = index.search(query, limit=3)
+            top = ", ".join(f"{m['name']} {m['state']} ({m['score']})" for m in matches)
+            self.stdout.write(f"  {query!r:<22} -> {top}")
+
+        queries = []
+        for _ in range(options["queries"]):
+            name = rng.choice(rows)[1]
+            kind = rng.random()
+            if kind < 0.4:
+                queries.append(name[:rng.randint(2, max(2, len(name)))])
+            elif kind < 0.8:
+                queries.append(misspell(name, rng))
+            else:
+                queries.append(name)
+
+        hits = 0
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            matches = index.search(query, limit=options["limit"])
+            timings.append((time.perf_counter() - start) * 1000)
+            hits += bool(matches)
+
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1] if timings else 0
+        self.stdout.write(
+            f"{len(queries)} queries: mean {statistics.fmean(timings):.3f} ms, "
+            f"median {statistics.median(timings):.3f} ms, p95 {p95:.3f} ms, "
+            f"max {timings[-1]:.3f} ms, {hits} with matches"
+        )
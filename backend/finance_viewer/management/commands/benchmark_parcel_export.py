@@ -0,0 +1,189 @@
+""" Management command comparing the legacy iterrows parcel export with the stored parcel stream """
+
+import json
+import math
+import tempfile
+import time
+import uuid
+import zipfile
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from shapely.geometry import Point
+
+from finance_viewer.lib.parcel_analytics import JENKS, analyze_parcels
+from finance_viewer.lib.geojson_stream import feature_collection_chunks
+from finance_viewer.lib.parcel_exports import EXPORT_FORMATS, EXPORT_WRITERS
+from finance_viewer.lib.parcel_store import iter_stored_parcel_features, store_parcels
+from finance_viewer.lib.parcels import clip_mask, read_parcels
+
+# Parcel grid origin (EPSG:4269) and cell size in degrees, roughly 30 m
+ORIGIN = (-97.9, 30.1)
+CELL_SIZE = 0.0003
+
+
+def synthetic_parcels(count:int, seed:int) -> gpd.GeoDataFrame:
+    """ Square parcels on a grid with shapefile-style attribute columns """
+
+    rng = np.random.default_rng(seed)
+    side = math.ceil(math.sqrt(count))
+    index = np.arange(count)
+    xmin = ORIGIN[0] + (index % side) * CELL_SIZE
+    ymin = ORIGIN[1] + (index // side) * CELL_SIZE
+    geometry = shapely.box(xmin, ymin, xmin + CELL_SIZE * 0.95, ymin + CELL_SIZE * 0.95)
+
+    return gpd.GeoDataFrame({
+        'OBJECTID': index + 1,
+        'TAXPIN': [f"{i:010d}" for i in rng.integers(0, 10**10, count)],
+        'TOTAL_APPR': rng.lognormal(12, 1, count).round(2),
+        'LOCATION1': [f"{n} MAIN ST" for n in rng.integers(1, 9999, count)],
+    }, geometry=geometry, crs='EPSG:4269')
+
+def write_formats(gdf:gpd.GeoDataFrame, directory:Path) -> dict[str, Path]:
+    """ Write a GeoDataFrame in every accepted upload format """
+
+    shapefile = directory / "shp"
+    shapefile.mkdir()
+    gdf.to_file(shapefile / "parcels.shp")
+    paths = {"zip": directory / "parcels.zip"}
+    with zipfile.ZipFile(paths["zip"], "w") as archive:
+        for path in shapefile.glob("parcels.*"):
+            archive.write(path, path.name)
+
+    paths["gpkg"] = directory / "parcels.gpkg"
+    gdf.to_file(paths["gpkg"], driver="GPKG")
+    paths["fgb"] = directory / "parcels.fgb"
+    gdf.to_file(paths["fgb"], driver="FlatGeobuf")
+    paths["parquet"] = directory / "parcels.parquet"
+    gdf.to_parquet(paths["parquet"], write_covering_bbox=True)
+    return paths
+
+def legacy_export(gdf:gpd.GeoDataFrame) -> bytes:
+    """ Previous implementation: a Series and __geo_interface__ per parcel """
+
+    extracted = {'type': 'FeatureCollection', 'features': []}
+    for _, row in gdf.iterrows():
+        properties = {
+            'objectid': str(row.get('OBJECTID', '')),
+            'taxpin': str(row.get('TAXPIN', '')),
+            'assessed_value': str(row.get('TOTAL_APPR', '')),
+            'shape_area': float(row['shape_area']) if not math.isnan(row['shape_area']) else 0.0,
+            'address': str(row.get('LOCATION1', ''))
+        }
+        extracted['features'].append({
+            'type': 'Feature',
+            'geometry': row.geometry.__geo_interface__,
+            'properties': properties
+        })
+    return json.dumps(extracted).encode("utf-8")
+
+
+class Command(BaseCommand):
+    help = "Benchmark parcel reading, clipping, analytics and GeoJSON export on synthetic parcels"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--parcels", type=int, default=500000, help="Synthetic parcel count")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed for attributes")
+        parser.add_argument("--skip-legacy", action="store_true", help="Only time the stored parcel stream")
+        parser.add_argument(
+            "--skip-store",
+            action="store_true",
+            help="Do not load into municipal_parcels (created by build_parcel_tables)"
+        )
+
+    def handle(self, *args, **options):
+        gdf = synthetic_parcels(options["parcels"], options["seed"])
+
+        # Dense circular boundary inside the grid so clipping does real work
+        xmin, ymin, xmax, ymax = gdf.total_bounds
+        center = Point((xmin + xmax) / 2, (ymin + ymax) / 2)
+        boundary_geom = center.buffer((xmax - xmin) * 0.4, quad_segs=512)
+
+        start = time.perf_counter()
+        legacy_kept = int(gdf.intersects(boundary_geom).sum())
+        legacy_clip = time.perf_counter() - start
+        start = time.perf_counter()
+        kept = int(clip_mask(gdf.geometry.values, boundary_geom).sum())
+        self.stdout.write(
+            f"Clip: unprepared intersects {legacy_clip:.2f} s ({legacy_kept} kept), "
+            f"indexed clip {time.perf_counter() - start:.2f} s ({kept} kept)"
+        )
+
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            paths = write_formats(gdf, Path(directory))
+            self.stdout.write(f"Wrote {len(gdf)} parcels in {len(paths)} formats in {time.perf_counter() - start:.1f} s")
+
+            read_times = {}
+            for fmt, path in paths.items():
+                start = time.perf_counter()
+                clipped = read_parcels(str(path), boundary_geom)
+                read_times[fmt] = time.perf_counter() - start
+                self.stdout.write(
+                    f"Read and clip {fmt} ({path.stat().st_size / 1e6:.1f} MB): "
+                    f"{read_times[fmt]:.2f} s, {len(clipped)} parcels kept"
+                )
+
+            for method in ("quantiles", JENKS):
+                analyzed = clipped.copy()
+                start = time.perf_counter()
+                analytics = analyze_parcels(analyzed, boundary_geom, method=method)
+                self.stdout.write(
+                    f"Analytics ({method}): {time.perf_counter() - start:.2f} s, "
+                    f"{len(analytics['hexes']['features'])} hexagons, breaks {analytics['classification']['breaks']}"
+                )
+
+            size = None
+            if not options["skip_store"]:
+                size = self._benchmark_store(analyzed, analytics)
+
+            exported = clipped.to_crs(epsg=4326)
+            for fmt, (_, extension) in EXPORT_FORMATS.items():
+                path = Path(directory) / f"export{extension}"
+                start = time.perf_counter()
+                EXPORT_WRITERS[fmt](exported, str(path))
+                relative = f" ({path.stat().st_size / size:.0%} of GeoJSON)" if size else ""
+                self.stdout.write(
+                    f"Export {fmt}: {time.perf_counter() - start:.2f} s, {path.stat().st_size / 1e6:.1f} MB{relative}"
+                )
+
+        if not options["skip_legacy"]:
+            start = time.perf_counter()
+            legacy = legacy_export(clipped)
+            self.stdout.write(f"Legacy iterrows: {time.perf_counter() - start:.2f} s encoding, {len(legacy) / 1e6:.1f} MB")
+
+    def _benchmark_store(self, gdf:gpd.GeoDataFrame, analytics:dict) -> int:
+        """ Time store_parcels and the GeoJSON stream served from it, then remove the rows
+
+        Returns:
+            (int): Encoded FeatureCollection size in bytes
+        """
+        mid, content_hash = str(uuid.uuid4()), "benchmark"
+
+        start = time.perf_counter()
+        stored = store_parcels(mid, content_hash, gdf, analytics)
+        self.stdout.write(f"Store: {time.perf_counter() - start:.2f} s, {stored} parcels")
+
+        try:
+            start = time.perf_counter()
+            first_chunk = None
+            size = 0
+            for chunk in feature_collection_chunks(iter_stored_parcel_features(mid, content_hash)):
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - start
+                size += len(chunk)
+            self.stdout.write(
+                f"Stored stream: {time.perf_counter() - start:.2f} s total, "
+                f"first chunk after {first_chunk:.2f} s, {size / 1e6:.1f} MB"
+            )
+        finally:
+            with transaction.atomic(using='gis_boundaries'):
+                with connections['gis_boundaries'].cursor() as cursor:
+                    cursor.execute("DELETE FROM municipal_parcels WHERE mid = %s", [mid])
+                    cursor.execute("DELETE FROM parcel_uploads WHERE mid = %s", [mid])
+        return size
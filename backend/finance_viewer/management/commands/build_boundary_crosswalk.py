@@ -0,0 +1,39 @@
+""" Management command to build the municipality mid to boundary crosswalk """
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from finance_viewer.lib.boundary_cache import BOUNDARY_VERSION
+from finance_viewer.lib.cache_versions import bump_data_version
+from finance_viewer.lib.crosswalk import CROSSWALK_TABLE, SCHEMA_SQL, match_boundaries
+from finance_viewer.models.municipal_finance import Municipalities
+
+
+class Command(BaseCommand):
+    help = "Build or refresh the crosswalk from municipality mid to municipal boundary id"
+
+    def handle(self, *args, **options):
+        municipalities = list(
+            Municipalities.objects.using('municipal_finance').values_list(
+                'mid', 'state', 'county_fips', 'name'
+            )
+        )
+
+        with transaction.atomic(using='gis_boundaries'):
+            with connections['gis_boundaries'].cursor() as cursor:
+                for statement in SCHEMA_SQL:
+                    cursor.execute(statement)
+
+                cursor.execute(f"DELETE FROM {CROSSWALK_TABLE}")
+                matched = match_boundaries(cursor, municipalities)
+
+        with connections['gis_boundaries'].cursor() as cursor:
+            cursor.execute(f"ANALYZE {CROSSWALK_TABLE}")
+
+        # Workers drop their cached boundaries on the next lookup
+        bump_data_version(BOUNDARY_VERSION)
+
+        self.stdout.write(
+            f"Matched {matched} of {len(municipalities)} municipalities to boundaries."
+        )
+        self.stdout.write(self.style.SUCCESS("Boundary crosswalk rebuilt."))
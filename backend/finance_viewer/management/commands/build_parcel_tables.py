@@ -0,0 +1,18 @@
+""" Management command to create the PostGIS tables holding processed parcel uploads """
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from finance_viewer.lib.parcel_store import SCHEMA_SQL
+
+
+class Command(BaseCommand):
+    help = "Create the parcel_uploads and municipal_parcels tables and their indexes"
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using='gis_boundaries'):
+            with connections['gis_boundaries'].cursor() as cursor:
+                for statement in SCHEMA_SQL:
+                    cursor.execute(statement)
+
+        self.stdout.write(self.style.SUCCESS("Parcel tables ready."))
@@ -0,0 +1,86 @@
+""" Management command to precompute simplified state and municipal boundaries """
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from finance_viewer.lib.gis import BOUNDARY_RESOLUTIONS
+
+# (source table, simplified table, coverage partition column)
+BOUNDARY_TABLES = [
+    ("state_boundaries", "state_boundaries_simplified", None),
+    ("municipal_boundaries", "municipal_boundaries_simplified", "state"),
+]
+
+
+class Command(BaseCommand):
+    help = "Precompute topology-preserving simplified boundaries for each resolution level"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--resolution",
+            action="append",
+            choices=list(BOUNDARY_RESOLUTIONS.keys()),
+            help="Resolution to rebuild (repeatable, defaults to all)"
+        )
+        parser.add_argument(
+            "--coverage",
+            action="store_true",
+            help="Simplify shared edges consistently with ST_CoverageSimplify (PostGIS 3.4+)"
+        )
+
+    def handle(self, *args, **options):
+        resolutions = options["resolution"] or list(BOUNDARY_RESOLUTIONS.keys())
+
+        with transaction.atomic(using="gis_boundaries"):
+            with connections["gis_boundaries"].cursor() as cursor:
+                for source, target, partition in BOUNDARY_TABLES:
+                    self._create_table(cursor, target)
+
+                    for resolution in resolutions:
+                        level = BOUNDARY_RESOLUTIONS[resolution]["level"]
+                        tolerance = BOUNDARY_RESOLUTIONS[resolution]["tolerance"]
+
+                        cursor.execute(f"DELETE FROM {target} WHERE level = %s", [level])
+                        cursor.execute(
+                            self._simplify_sql(source, target, partition, options["coverage"]),
+                            [level, tolerance, tolerance]
+                        )
+                        self.stdout.write(
+                            f"{target}: {cursor.rowcount} boundaries at '{resolution}' (tolerance {tolerance})"
+                        )
+
+        with connections["gis_boundaries"].cursor() as cursor:
+            for _, target, _ in BOUNDARY_TABLES:
+                cursor.execute(f"ANALYZE {target}")
+
+        self.stdout.write(self.style.SUCCESS("Simplified boundaries rebuilt."))
+
+    def _create_table(self, cursor, target:str):
+        """ Create simplified boundary table if missing """
+
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {target} (
+                boundary_id bigint NOT NULL,
+                level smallint NOT NULL,
+                tolerance double precision NOT NULL,
+                geometry geometry(Geometry, 4269),
+                PRIMARY KEY (boundary_id, level)
+            )
+        """)
+
+    def _simplify_sql(self, source:str, target:str, partition:str | None, coverage:bool) -> str:
+        """ Build the INSERT statement for one simplification level """
+
+        if coverage:
+            # Window function keeps shared edges between neighbours identical
+            over = f"PARTITION BY {partition}" if partition else ""
+            geometry = f"ST_CoverageSimplify(geometry, %s) OVER ({over})"
+        else:
+            geometry = "ST_SimplifyPreserveTopology(geometry, %s)"
+
+        return f"""
+            INSERT INTO {target} (boundary_id, level, tolerance, geometry)
+            SELECT id, %s, %s, {geometry}
+            FROM {source}
+            WHERE geometry IS NOT NULL
+        """
@@ -0,0 +1,56 @@
+""" Management command bulk loading ACFR finance rows from CSV or Parquet files """
+
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from finance_viewer.lib.ingest import BULK_MODIFIER, CONFLICT_POLICIES, UPDATE, IngestError, ingest_finances, read_finance_file
+
+
+class Command(BaseCommand):
+    help = "Validate and upsert finance rows from CSV or Parquet files into municipal_finances"
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="CSV or Parquet files")
+        parser.add_argument("--on-conflict", choices=CONFLICT_POLICIES, default=UPDATE,
+                            help="Update or skip rows whose mid and year already exist")
+        parser.add_argument("--dry-run", action="store_true", help="Validate and count without writing")
+        parser.add_argument("--modifier", default=BULK_MODIFIER, help="Modifier recorded on written rows")
+        parser.add_argument("--errors", help="Write rejected rows to this CSV file")
+
+    def handle(self, *args, **options):
+        rejected = []
+        for path in options["paths"]:
+            start = time.perf_counter()
+            try:
+                report = ingest_finances(
+                    read_finance_file(path),
+                    on_conflict=options["on_conflict"],
+                    dry_run=options["dry_run"],
+                    modifier=options["modifier"]
+                )
+            except IngestError as e:
+                raise CommandError(f"{path}: {e}") from e
+
+            self.stdout.write(
+                f"{path}: {report['rows']} rows in {time.perf_counter() - start:.1f} s, "
+                f"{report['inserted']} inserted, {report['updated']} updated, {report['skipped']} skipped, "
+                f"{report['rejected']} rejected, {report['municipalities_created']} municipalities created"
+                + (" (dry run)" if report["dry_run"] else "")
+            )
+            rejected.extend({"file": path, **error} for error in report["errors"])
+
+        if options["errors"] and rejected:
+            with open(options["errors"], "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=["file", "row", "column", "error"])
+                writer.writeheader()
+                writer.writerows(rejected)
+            self.stdout.write(f"Wrote {len(rejected)} row errors to {options['errors']}")
+        elif rejected:
+            for error in rejected[:20]:
+                self.stdout.write(f"{error['file']} row {error['row']}: {error['error']}")
+            if len(rejected) > 20:
+                self.stdout.write(f"... {len(rejected) - 20} more, use --errors to write them all")
+
+        self.stdout.write(self.style.SUCCESS("Finance load finished."))
@@ -0,0 +1,20 @@
+""" Management command rebuilding the precomputed derived metrics table """
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from finance_viewer.lib.derived_metrics import DERIVED_TABLE, rebuild_derived_metrics
+
+
+class Command(BaseCommand):
+    help = "Create municipal_derived_metrics if needed and recompute it from municipal_finances"
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using='municipal_finance'):
+            with connections['municipal_finance'].cursor() as cursor:
+                rows = rebuild_derived_metrics(cursor)
+
+        with connections['municipal_finance'].cursor() as cursor:
+            cursor.execute(f"ANALYZE {DERIVED_TABLE}")
+
+        self.stdout.write(self.style.SUCCESS(f"Derived metrics rebuilt for {rows} municipality-years."))
@@ -0,0 +1,24 @@
+""" Management command running the parcel upload job worker """
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from finance_viewer.lib.parcel_jobs import POLL_INTERVAL, run_worker
+
+
+class Command(BaseCommand):
+    help = "Process queued parcel uploads in a pool of worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.PARCEL_JOB_WORKERS, help="Worker processes")
+        parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL, help="Seconds between queue polls")
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Parcel worker started with {options['workers']} process(es)")
+        run_worker(
+            options["workers"],
+            poll_interval=options["poll_interval"],
+            once=options["once"],
+            log=self.stdout.write
+        )
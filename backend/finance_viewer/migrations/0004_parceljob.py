@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:00
+
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance_viewer', '0003_municipalboundaries_municipalfinances_municipalities_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParcelJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('mid', models.CharField(max_length=36)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('upload_path', models.TextField()),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('progress', models.FloatField(default=0.0)),
+                ('message', models.TextField(blank=True, default='')),
+                ('feature_count', models.IntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'parcel_jobs',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='parcel_jobs_queue_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['queued', 'running', 'succeeded'])), fields=('mid', 'content_hash'), name='parcel_jobs_live_upload_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:00
+
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance_viewer', '0004_parceljob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MunicipalBoundariesSimplified',
+            fields=[
+                ('pk', models.CompositePrimaryKey('boundary', 'level', blank=True, editable=False, primary_key=True, serialize=False)),
+                ('level', models.SmallIntegerField()),
+                ('tolerance', models.FloatField()),
+                ('geometry', django.contrib.gis.db.models.fields.GeometryField(blank=True, null=True, srid=4269)),
+                ('boundary', models.ForeignKey(db_column='boundary_id', on_delete=django.db.models.deletion.DO_NOTHING, related_name='simplified', to='finance_viewer.municipalboundaries')),
+            ],
+            options={
+                'db_table': 'municipal_boundaries_simplified',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='StateBoundariesSimplified',
+            fields=[
+                ('pk', models.CompositePrimaryKey('boundary', 'level', blank=True, editable=False, primary_key=True, serialize=False)),
+                ('level', models.SmallIntegerField()),
+                ('tolerance', models.FloatField()),
+                ('geometry', django.contrib.gis.db.models.fields.GeometryField(blank=True, null=True, srid=4269)),
+                ('boundary', models.ForeignKey(db_column='boundary_id', on_delete=django.db.models.deletion.DO_NOTHING, related_name='simplified', to='finance_viewer.stateboundaries')),
+            ],
+            options={
+                'db_table': 'state_boundaries_simplified',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:00
+
+import django.db.models.deletion
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance_viewer', '0005_municipalboundariessimplified_stateboundariessimplified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='municipalboundaries',
+            name='county_fips5',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Substr('fips_code', 1, 5), output_field=models.TextField()),
+        ),
+        migrations.CreateModel(
+            name='MunicipalBoundaryCrosswalk',
+            fields=[
+                ('mid', models.UUIDField(primary_key=True, serialize=False)),
+                ('boundary', models.ForeignKey(db_column='boundary_id', on_delete=django.db.models.deletion.DO_NOTHING, related_name='crosswalk', to='finance_viewer.municipalboundaries')),
+            ],
+            options={
+                'db_table': 'municipal_boundary_crosswalk',
+                'managed': False,
+            },
+        ),
+    ]
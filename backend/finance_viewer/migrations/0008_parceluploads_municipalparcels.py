@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:00
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance_viewer', '0007_dataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MunicipalParcels',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('mid', models.UUIDField()),
+                ('content_hash', models.TextField()),
+                ('objectid', models.TextField(blank=True, null=True)),
+                ('taxpin', models.TextField(blank=True, null=True)),
+                ('assessed_value', models.TextField(blank=True, null=True)),
+                ('shape_area', models.FloatField(blank=True, null=True)),
+                ('address', models.TextField(blank=True, null=True)),
+                ('acres', models.FloatField(blank=True, null=True)),
+                ('value_per_acre', models.FloatField(blank=True, null=True)),
+                ('productivity_class', models.SmallIntegerField(blank=True, null=True)),
+                ('geometry', django.contrib.gis.db.models.fields.GeometryField(srid=4269)),
+            ],
+            options={
+                'db_table': 'municipal_parcels',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ParcelUploads',
+            fields=[
+                ('pk', models.CompositePrimaryKey('mid', 'content_hash', blank=True, editable=False, primary_key=True, serialize=False)),
+                ('mid', models.UUIDField()),
+                ('content_hash', models.TextField()),
+                ('feature_count', models.IntegerField()),
+                ('analytics', models.JSONField(blank=True, null=True)),
+                ('loaded_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'parcel_uploads',
+                'managed': False,
+            },
+        ),
+    ]
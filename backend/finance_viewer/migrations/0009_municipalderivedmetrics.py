@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance_viewer', '0008_parceluploads_municipalparcels'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MunicipalDerivedMetrics',
+            fields=[
+                ('pk', models.CompositePrimaryKey('mid', 'year', blank=True, editable=False, primary_key=True, serialize=False)),
+                ('year', models.IntegerField()),
+                ('net_financial_position', models.FloatField(blank=True, null=True)),
+                ('assets_to_liabilities', models.FloatField(blank=True, null=True)),
+                ('financial_assets_to_liabilities', models.FloatField(blank=True, null=True)),
+                ('net_debt_to_revenues', models.FloatField(blank=True, null=True)),
+                ('interest_to_revenues', models.FloatField(blank=True, null=True)),
+                ('net_book_to_total_capital_assets', models.FloatField(blank=True, null=True)),
+                ('transfers_to_revenues', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField()),
+                ('mid', models.ForeignKey(db_column='mid', on_delete=django.db.models.deletion.DO_NOTHING, to='finance_viewer.municipalities')),
+            ],
+            options={
+                'db_table': 'municipal_derived_metrics',
+                'managed': False,
+            },
+        ),
+    ]
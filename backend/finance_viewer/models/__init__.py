@@ -0,0 +1,2 @@
+from .data_versions import DataVersion
+from .parcel_jobs import ParcelJob
@@ -0,0 +1,13 @@
+""" Models for shared data version counters (default database) """
+
+from django.db import models
+
+
+class DataVersion(models.Model):
+    """ Version counter of a dataset cached by every worker, see lib.cache_versions """
+
+    name = models.CharField(max_length=64, primary_key=True)
+    version = models.BigIntegerField(default=1)
+
+    class Meta:
+        db_table = "data_versions"
@@ -6,6 +6,7 @@
 #   * Remove `managed = False` lines if you wish to allow Django to create, modify, and delete the table
 # Feel free to rename the models, but don't rename db_table values or field names.
 from django.contrib.gis.db import models
+from django.db.models.functions import Substr
 
 class MunicipalBoundaries(models.Model):
     id = models.BigIntegerField(primary_key=True, blank=True, null=False)
@@ -17,6 +18,7 @@ class MunicipalBoundaries(models.Model):
     gnis_id = models.TextField(blank=True, null=True)
     fips_code = models.TextField(blank=True, null=True)
     fips_name = models.TextField(blank=True, null=True)
+    county_fips5 = models.GeneratedField(expression=Substr('fips_code', 1, 5), output_field=models.TextField(), db_persist=True)
     pop_1990 = models.TextField(blank=True, null=True)
     pop_2000 = models.TextField(blank=True, null=True)
     pop_2010 = models.FloatField(blank=True, null=True)
@@ -29,6 +31,15 @@ class MunicipalBoundaries(models.Model):
         db_table = 'municipal_boundaries'
 
 
+class MunicipalBoundaryCrosswalk(models.Model):
+    mid = models.UUIDField(primary_key=True)
+    boundary = models.ForeignKey(MunicipalBoundaries, models.DO_NOTHING, db_column='boundary_id', related_name='crosswalk')
+
+    class Meta:
+        managed = False
+        db_table = 'municipal_boundary_crosswalk'
+
+
 class StateBoundaries(models.Model):
     id = models.BigIntegerField(primary_key=True, blank=True, null=False)
     statefp = models.TextField(blank=True, null=False)
@@ -45,3 +56,59 @@ class StateBoundaries(models.Model):
     class Meta:
         managed = False
         db_table = 'state_boundaries'
+
+
+class MunicipalBoundariesSimplified(models.Model):
+    pk = models.CompositePrimaryKey('boundary', 'level')
+    boundary = models.ForeignKey(MunicipalBoundaries, models.DO_NOTHING, db_column='boundary_id', related_name='simplified')
+    level = models.SmallIntegerField()
+    tolerance = models.FloatField()
+    geometry = models.GeometryField(srid=4269, blank=True, null=True)
+
+    class Meta:
+        managed = False
+        db_table = 'municipal_boundaries_simplified'
+
+
+class StateBoundariesSimplified(models.Model):
+    pk = models.CompositePrimaryKey('boundary', 'level')
+    boundary = models.ForeignKey(StateBoundaries, models.DO_NOTHING, db_column='boundary_id', related_name='simplified')
+    level = models.SmallIntegerField()
+    tolerance = models.FloatField()
+    geometry = models.GeometryField(srid=4269, blank=True, null=True)
+
+    class Meta:
+        managed = False
+        db_table = 'state_boundaries_simplified'
+
+
+class ParcelUploads(models.Model):
+    pk = models.CompositePrimaryKey('mid', 'content_hash')
+    mid = models.UUIDField()
+    content_hash = models.TextField()
+    feature_count = models.IntegerField()
+    analytics = models.JSONField(blank=True, null=True)
+    loaded_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'parcel_uploads'
+
+
+class MunicipalParcels(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    mid = models.UUIDField()
+    content_hash = models.TextField()
+    objectid = models.TextField(blank=True, null=True)
+    taxpin = models.TextField(blank=True, null=True)
+    assessed_value = models.TextField(blank=True, null=True)
+    shape_area = models.FloatField(blank=True, null=True)
+    address = models.TextField(blank=True, null=True)
+    acres = models.FloatField(blank=True, null=True)
+    value_per_acre = models.FloatField(blank=True, null=True)
+    productivity_class = models.SmallIntegerField(blank=True, null=True)
+    geometry = models.GeometryField(srid=4269)
+
+    class Meta:
+        managed = False
+        db_table = 'municipal_parcels'
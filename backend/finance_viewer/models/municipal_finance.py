@@ -83,3 +83,21 @@ class Municipalities(models.Model):
     class Meta:
         managed = False
         db_table = 'municipalities'
+
+
+class MunicipalDerivedMetrics(models.Model):
+    pk = models.CompositePrimaryKey('mid', 'year')
+    mid = models.ForeignKey('Municipalities', models.DO_NOTHING, db_column='mid')
+    year = models.IntegerField()
+    net_financial_position = models.FloatField(blank=True, null=True)
+    assets_to_liabilities = models.FloatField(blank=True, null=True)
+    financial_assets_to_liabilities = models.FloatField(blank=True, null=True)
+    net_debt_to_revenues = models.FloatField(blank=True, null=True)
+    interest_to_revenues = models.FloatField(blank=True, null=True)
+    net_book_to_total_capital_assets = models.FloatField(blank=True, null=True)
+    transfers_to_revenues = models.FloatField(blank=True, null=True)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'municipal_derived_metrics'
@@ -0,0 +1,46 @@
+""" Models for the parcel upload job queue (default database) """
+
+import uuid
+
+from django.db import models
+
+
+class ParcelJob(models.Model):
+    """ Parcel upload processed in the background by the run_parcel_worker command """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    mid = models.CharField(max_length=36)
+    content_hash = models.CharField(max_length=64)
+    upload_path = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    progress = models.FloatField(default=0.0)
+    message = models.TextField(blank=True, default="")
+    feature_count = models.IntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'parcel_jobs'
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='parcel_jobs_queue_idx'),
+        ]
+        constraints = [
+            # One live job per upload; identical concurrent uploads share it
+            models.UniqueConstraint(
+                fields=['mid', 'content_hash'],
+                condition=models.Q(status__in=['queued', 'running', 'succeeded']),
+                name='parcel_jobs_live_upload_unique',
+            ),
+        ]
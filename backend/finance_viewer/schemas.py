@@ -114,18 +114,34 @@ class MunicipalityFinance(Schema):
     created_at: datetime.datetime
 
 
+class MunicipalityFinanceBatchRequest(Schema):
+    mids: List[str]
+    start_year: Optional[int] = None
+    end_year: Optional[int] = None
+
+
 class MunicipalityInfo(Schema):
     mid: str
     name: str
     state: str
     county_fips: Optional[str]
 
+class MunicipalitySearchResult(Schema):
+    mid: str
+    name: str
+    state: str
+    county_fips: Optional[str]
+    score: float
+
 class ParcelFeatureProperties(Schema):
     objectid: str
     taxpin: str
     assessed_value: str
     shape_area: float
     address: str
+    acres: Optional[float] = None
+    value_per_acre: Optional[float] = None
+    productivity_class: Optional[int] = None
 
 class ParcelFeature(Schema):
     type: str
@@ -135,3 +151,13 @@ class ParcelFeature(Schema):
 class ParcelUploadResponse(Schema):
     type: str
     features: List[ParcelFeature]
+
+class ParcelJobResponse(Schema):
+    job_id: str
+    mid: str
+    status: str
+    progress: float
+    message: str
+    feature_count: Optional[int]
+    created_at: datetime.datetime
+    finished_at: Optional[datetime.datetime]
@@ -1,3 +1,669 @@
-from django.test import TestCase
+import hashlib
+import os
+import sqlite3
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from django.core.files.uploadhandler import StopUpload
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from finance_viewer.lib import boundary_cache
+from finance_viewer.lib.artifacts import choose_encoding, parse_accept_encoding
+from finance_viewer.lib.directory import MunicipalityDirectory
+from finance_viewer.lib.expressions import ExpressionError, _compile_normalized, compile_expression
+from finance_viewer.lib.ingest import (
+    MODIFIER_MAX_LENGTH,
+    IngestError,
+    drop_superseded_rows,
+    ingest_finances,
+    validate_finance_rows
+)
+from finance_viewer.lib.metric_definitions import METRIC_FIELDS
+from finance_viewer.lib.metrics import FinanceCube
+from finance_viewer.lib.parcel_analytics import (
+    JENKS,
+    QUANTILES,
+    assign_classes,
+    classification_breaks,
+    hex_grid_aggregate
+)
+from finance_viewer.lib.parcel_exports import negotiate_parcel_format
+from finance_viewer.lib.parcels import EQUAL_AREA_CRS, ParcelException, clip_mask, detect_parcel_format
+from finance_viewer.lib.ranking import PeerGroups, percentile_ranks
+from finance_viewer.lib.resolver import ACCEPT_CONFIDENCE, MunicipalityResolver
+from finance_viewer.lib.search import MunicipalitySearchIndex
+from finance_viewer.lib.trends import compound_growth, rolling_volatility, year_over_year
+from finance_viewer.lib.uploads import HashingTemporaryFileUploadHandler, upload_limit_exceeded
+
+MID = "0b7c3f52-3c55-4d6e-9d7f-2f1c6a0e8b11"
+
+
+class ValidateFinanceRowsTests(SimpleTestCase):
+    """ Column-wise validation of bulk finance files """
+
+    def validate(self, **columns):
+        return validate_finance_rows(pd.DataFrame(columns, dtype=object))
+
+    def errors_for(self, errors, column):
+        return errors.loc[errors['column'] == column, 'row'].tolist()
+
+    def test_parses_formatted_numbers(self):
+        rows, errors = self.validate(
+            mid=[MID] * 5,
+            year=["2019", "2020", "2021", "2022", "2023"],
+            total_revenues=["$1,234", "(1,234)", "1,234.5", " 42 ", ""],
+        )
+
+        self.assertTrue(errors.empty)
+        self.assertEqual(rows['total_revenues'].iloc[:4].tolist(), [1234.0, -1234.0, 1234.5, 42.0])
+        self.assertTrue(pd.isna(rows['total_revenues'].iloc[4]))
+
+    def test_rejects_unparseable_numbers(self):
+        rows, errors = self.validate(mid=[MID, MID], year=["2020", "2021"], total_revenues=["12", "n/a"])
+
+        self.assertEqual(self.errors_for(errors, 'total_revenues'), [2])
+        self.assertEqual(rows['year'].tolist(), [2020])
+
+    def test_rejects_fractional_integers(self):
+        _, errors = self.validate(mid=[MID, MID], year=["2020", "2021"], parks=["3", "3.5"])
+
+        self.assertEqual(self.errors_for(errors, 'parks'), [2])
+
+    def test_rejects_invalid_years(self):
+        _, errors = self.validate(mid=[MID] * 4, year=["2020", "1899", "2020.5", ""])
+
+        self.assertEqual(self.errors_for(errors, 'year'), [2, 3, 4])
+
+    def test_lowercases_and_checks_mids(self):
+        rows, errors = self.validate(mid=[MID.upper(), "not-a-uuid"], year=["2020", "2020"])
+
+        self.assertEqual(rows['mid'].tolist(), [MID])
+        self.assertEqual(errors['row'].unique().tolist(), [2])
+        self.assertIn("mid is not a UUID", errors['error'].tolist())
+
+    def test_pads_county_fips(self):
+        rows, errors = self.validate(
+            municipality_name=["Autauga", "Baldwin", "Clarke"],
+            state=["AL", "AL", "AL"],
+            county_fips=["1001", "1003.0", "01025"],
+            year=["2020", "2020", "2020"],
+        )
+
+        self.assertTrue(errors.empty)
+        self.assertEqual(rows['county_fips'].tolist(), ["01001", "01003", "01025"])
+
+    def test_accepts_state_names_and_abbreviations(self):
+        rows, errors = self.validate(
+            municipality_name=["Austin", "Dallas", "Springfield", "Nowhere"],
+            state=["texas", "tx", "Illinois", "Atlantis"],
+            county_fips=["48453", "48113", "17167", "99999"],
+            year=["2020"] * 4,
+        )
+
+        self.assertEqual(rows['state'].tolist(), ["TX", "TX", "IL"])
+        self.assertEqual(self.errors_for(errors, 'state'), [4])
+
+    def test_mid_makes_identity_optional(self):
+        rows, errors = self.validate(
+            mid=[MID, ""],
+            municipality_name=["", ""],
+            state=["", "TX"],
+            county_fips=["", "48453"],
+            year=["2020", "2020"],
+        )
+
+        self.assertEqual(rows['mid'].tolist(), [MID])
+        self.assertEqual(self.errors_for(errors, 'municipality_name'), [2])
+
+    def test_rejects_malformed_files(self):
+        with self.assertRaises(IngestError):
+            self.validate(mid=[MID], year=["2020"], revenue=["1"])
+        with self.assertRaises(IngestError):
+            self.validate(mid=[MID])
+        with self.assertRaises(IngestError):
+            self.validate(municipality_name=["Austin"], year=["2020"])
+
+    def test_last_repeated_row_wins(self):
+        rows, _ = self.validate(
+            mid=[MID, MID, MID], year=["2020", "2021", "2020"], total_revenues=["1", "2", "3"]
+        )
+        rows, errors = drop_superseded_rows(rows)
+
+        self.assertEqual(rows['total_revenues'].tolist(), [2.0, 3.0])
+        self.assertEqual(errors['row'].tolist(), [1])
+
+    def test_rejects_long_modifier(self):
+        with self.assertRaises(IngestError):
+            ingest_finances(pd.DataFrame({"mid": [MID], "year": ["2020"]}), modifier="x" * (MODIFIER_MAX_LENGTH + 1))
+
+
+class CustomExpressionTests(SimpleTestCase):
+    """ Validation and NumPy / SQL compilation of custom metric expressions """
+
+    def test_rejects_unsupported_syntax(self):
+        for text in [
+            "total_revenues.real",
+            "(1).__class__",
+            "__import__('os')",
+            "open('x')",
+            "total_revenues[0]",
+            "abs(debt, 1)",
+            "abs(x=debt)",
+            "revenue / debt",
+            "lambda: 1",
+            "debt if debt else 1",
+            "'debt'",
+            "",
+        ]:
+            with self.subTest(text=text), self.assertRaises(ExpressionError):
+                compile_expression(text)
+
+    def test_sql_translation(self):
+        self.assertEqual(
+            compile_expression("debt / total_revenues").sql,
+            '("debt"::float8 / NULLIF("total_revenues"::float8, 0))'
+        )
+        self.assertEqual(
+            compile_expression("min(debt, liabilities) - max(debt, 0)").sql,
+            '(LEAST("debt"::float8, "liabilities"::float8) - GREATEST("debt"::float8, 0.0))'
+        )
+        self.assertEqual(
+            compile_expression("debt ^ 0.5").sql,
+            '(CASE WHEN "debt"::float8 < 0 AND 0.5 <> trunc(0.5) THEN NULL'
+            ' WHEN "debt"::float8 = 0 AND 0.5 < 0 THEN NULL'
+            ' ELSE power("debt"::float8, 0.5) END)'
+        )
+        self.assertEqual(
+            compile_expression("net_financial_position").sql,
+            '("current_assets"::float8 - "liabilities"::float8)'
+        )
+        self.assertIsNone(compile_expression("total_revenues / acres").sql)
+
+    def test_numpy_and_sql_agree_on_zero_and_missing(self):
+        text = "(operating_grants + capital_grants) / total_revenues - debt / liabilities"
+        columns = ["operating_grants", "capital_grants", "total_revenues", "debt", "liabilities"]
+        rows = [
+            [1.0, 2.0, 3.0, 4.0, 5.0],
+            [1.0, 1.0, 0.0, 4.0, 5.0],
+            [np.nan, 1.0, 2.0, 3.0, 4.0],
+            [1.0, 1.0, 2.0, 3.0, 0.0],
+            [0.0, 0.0, 0.0, 0.0, 0.0],
+        ]
+        expression = compile_expression(text)
+        data = np.array(rows)
+        expected = expression.evaluate(lambda name: data[:, columns.index(name)])
+
+        # Same SQL in SQLite, which has no ::float8 casts but the same NULL semantics
+        with sqlite3.connect(":memory:") as connection:
+            connection.execute(f"CREATE TABLE municipal_finances ({', '.join(f'{c} REAL' for c in columns)})")
+            connection.executemany(
+                f"INSERT INTO municipal_finances VALUES ({', '.join('?' * len(columns))})",
+                [[None if np.isnan(v) else v for v in row] for row in rows]
+            )
+            sql = expression.sql.replace("::float8", "")
+            actual = [value for (value,) in connection.execute(f"SELECT {sql} FROM municipal_finances")]
+
+        self.assertEqual([value is None for value in actual], [False, True, True, True, True])
+        self.assertTrue(np.isnan(expected[1:]).all())
+        self.assertAlmostEqual(actual[0], 0.2)
+        self.assertAlmostEqual(expected[0], 0.2)
+
+    def test_equivalent_spellings_share_a_compiled_expression(self):
+        _compile_normalized.cache_clear()
+        first = compile_expression("debt/total_revenues")
+        second = compile_expression(" ( debt ) /  total_revenues ")
+
+        self.assertIs(first, second)
+        self.assertEqual(_compile_normalized.cache_info().hits, 1)
+
+
+class MunicipalityResolverTests(SimpleTestCase):
+    """ Name matching within a county """
+
+    TOWN = "1c8b7d1e-5f0a-4a52-8d0e-0c3f3b8c2a01"
+    VILLAGE = "1c8b7d1e-5f0a-4a52-8d0e-0c3f3b8c2a02"
+
+    def resolve(self, rows, name):
+        return MunicipalityResolver(1, rows).resolve([(name, "NY", "36059")])[0]
+
+    def test_normalized_match(self):
+        match = self.resolve([[self.TOWN, "Town of Hempstead", "NY", "36059"]], "TOWN OF HEMPSTEAD")
+
+        self.assertEqual(match["mid"], self.TOWN)
+        self.assertGreaterEqual(match["confidence"], ACCEPT_CONFIDENCE)
+
+    def test_government_types_must_agree(self):
+        match = self.resolve([[self.TOWN, "Town of Hempstead", "NY", "36059"]], "Village of Hempstead")
+
+        self.assertTrue(match is None or match["confidence"] < ACCEPT_CONFIDENCE)
+
+    def test_picks_the_matching_government_type(self):
+        rows = [
+            [self.TOWN, "Town of Hempstead", "NY", "36059"],
+            [self.VILLAGE, "Village of Hempstead", "NY", "36059"],
+        ]
+
+        self.assertEqual(self.resolve(rows, "Vlg of Hempstead")["mid"], self.VILLAGE)
+        self.assertLess(self.resolve(rows, "Hempstead")["confidence"], ACCEPT_CONFIDENCE)
+
+
+class MunicipalitySearchIndexTests(SimpleTestCase):
+    """ Typeahead prefix matching, filters and ranking """
+
+    ROWS = [
+        ["m1", "Saint Paul", "MN", "27123"],
+        ["m2", "St. Petersburg", "FL", "12103"],
+        ["m3", "Stamford", "CT", "09001"],
+        ["m4", "Pittsburgh", "PA", "42003"],
+        ["m5", "New Orleans", "LA", "22071"],
+        ["m6", "Portland", "OR", "41051"],
+        ["m7", "Springfield", "IL", "17167"],
+        ["m8", "Springfield", "MO", "29077"],
+        ["m9", "Springfield Township", "OH", "39057"],
+        ["m10", "Springdale", "AR", "05143"],
+    ]
+
+    def search(self, query, **kwargs):
+        return MunicipalitySearchIndex(1, self.ROWS).search(query, **kwargs)
+
+    def names(self, results):
+        return [result["name"] for result in results]
+
+    def test_partly_typed_word_is_not_a_state(self):
+        self.assertEqual(self.search("saint pa")[0]["name"], "Saint Paul")
+        self.assertEqual(self.search("new or")[0]["name"], "New Orleans")
+
+    def test_partly_typed_abbreviation_matches_both_forms(self):
+        names = self.names(self.search("st"))
+
+        self.assertIn("Stamford", names)
+        self.assertIn("Saint Paul", names)
+        self.assertIn("St. Petersburg", names)
+
+    def test_explicit_state_filter(self):
+        results = self.search("springfield", state="mo")
+
+        self.assertEqual([result["mid"] for result in results], ["m8"])
+        self.assertEqual(self.search("springfield", state="ZZ"), [])
+
+    def test_county_filter(self):
+        results = self.search("springfield", county_fips="17167")
+
+        self.assertEqual([result["mid"] for result in results], ["m7"])
+
+    def test_exact_before_prefix_before_fuzzy(self):
+        results = self.search("springfield")
+        scores = [result["score"] for result in results]
+
+        self.assertEqual(self.names(results), ["Springfield", "Springfield", "Springfield Township", "Springdale"])
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertGreater(scores[1], scores[2])
+        self.assertGreater(scores[2], scores[3])
+
+    def test_limit(self):
+        self.assertEqual(len(self.search("spring", limit=2)), 2)
+        self.assertEqual(self.search("   "), [])
+
+
+class PercentileRankTests(SimpleTestCase):
+    """ Peer percentiles per (year, group) block """
+
+    def test_ties_count_half(self):
+        values = np.array([[10.0], [20.0], [20.0], [30.0], [np.nan]])
+        percentiles, counts = percentile_ranks(values, np.zeros(5, dtype=np.int64))
+
+        np.testing.assert_allclose(percentiles[:4, 0], [12.5, 50.0, 50.0, 87.5])
+        self.assertTrue(np.isnan(percentiles[4, 0]))
+        self.assertEqual(counts[:, 0].tolist(), [4, 4, 4, 4, 0])
+
+    def test_ranks_within_group_and_year(self):
+        values = np.array([
+            [1.0, 4.0],
+            [2.0, np.nan],
+            [9.0, 3.0],
+            [5.0, 1.0],
+        ])
+        groups = np.array([0, 0, 1, -1])
+        percentiles, counts = percentile_ranks(values, groups)
+
+        np.testing.assert_allclose(percentiles[:3, 0], [25.0, 75.0, 50.0])
+        np.testing.assert_allclose(percentiles[[0, 2], 1], [50.0, 50.0])
+        self.assertTrue(np.isnan(percentiles[1, 1]))
+        self.assertTrue(np.isnan(percentiles[3]).all())
+        self.assertEqual(counts.tolist(), [[2, 1], [2, 0], [1, 1], [0, 0]])
+
+    def test_peer_groups_fall_back_to_latest_reported_population(self):
+        mids = np.array(["a", "b", "c", "d"], dtype=object)
+        values = np.full((4, 3, len(METRIC_FIELDS)), np.nan)
+        cube = FinanceCube(1, mids, np.array([2019, 2020, 2021], dtype=np.int32), values,
+                           {"pop_2020": np.array([20000.0, np.nan, np.nan, np.nan])})
+        cube.field("population")[:] = [
+            [1000, np.nan, np.nan],
+            [np.nan, 3000, 60000],
+            [5000, np.nan, np.nan],
+            [np.nan, np.nan, np.nan],
+        ]
+        directory = MunicipalityDirectory(1, [["a", "A", "TX", None], ["b", "B", "TX", None], ["c", "C", "IL", None]])
+
+        peers = PeerGroups(cube, directory)
+
+        np.testing.assert_array_equal(peers.population[:3], [20000, 60000, 5000])
+        self.assertTrue(np.isnan(peers.population[3]))
+        self.assertEqual(peers.bands.tolist(), [2, 3, 1, -1])
+        self.assertEqual(peers.state_names, ["IL", "TX"])
+        self.assertEqual(peers.states.tolist(), [1, 1, 0, -1])
+
+
+class TrendTests(SimpleTestCase):
+    """ Gap handling of year-over-year, CAGR and volatility """
+
+    def test_year_over_year_skips_gaps(self):
+        changes = year_over_year(np.array([[100.0, np.nan, 110.0, 121.0, 0.0, 5.0]]))
+
+        self.assertTrue(np.isnan(changes[0, :3]).all())
+        self.assertAlmostEqual(changes[0, 3], 0.1)
+        self.assertAlmostEqual(changes[0, 4], -1.0)
+        self.assertTrue(np.isnan(changes[0, 5]))
+
+    def test_compound_growth_spans_elapsed_years(self):
+        values = np.array([[100.0, np.nan, 121.0, 133.1]])
+
+        np.testing.assert_allclose(compound_growth(values, 2)[0], [np.nan, np.nan, 0.1, 0.1])
+        np.testing.assert_allclose(compound_growth(values, 3)[0], [np.nan, np.nan, np.nan, 0.1])
+
+    def test_compound_growth_starts_at_first_reported_year_in_window(self):
+        values = np.array([[np.nan, 100.0, np.nan, 121.0], [50.0, np.nan, np.nan, np.nan]])
+        growth = compound_growth(values, 3)
+
+        self.assertAlmostEqual(growth[0, 3], 0.1)
+        self.assertTrue(np.isnan(growth[1]).all())
+
+    def test_rolling_volatility_matches_nanstd(self):
+        values = 1e9 * np.cumprod(1 + np.array([[0.01, 0.03, -0.02, 0.02, 0.05, 0.04, 0.01]]), axis=1)
+        values[0, 3] = np.nan
+        volatility = rolling_volatility(values, 3)
+        changes = year_over_year(values)
+
+        for end in range(values.shape[1]):
+            window = changes[0, max(0, end - 2):end + 1]
+            if np.isfinite(window).sum() >= 2:
+                self.assertAlmostEqual(volatility[0, end], np.nanstd(window, ddof=1), places=12)
+            else:
+                self.assertTrue(np.isnan(volatility[0, end]))
+
+    def test_rolling_volatility_of_constant_growth_is_zero(self):
+        values = 1e12 * 1.1 ** np.arange(6, dtype=np.float64)[np.newaxis, :]
+
+        np.testing.assert_allclose(rolling_volatility(values, 4)[0, 2:], 0.0, atol=1e-12)
+
+
+class AcceptEncodingTests(SimpleTestCase):
+    """ Picking the precompressed boundary artifact variant """
+
+    def test_parses_q_values(self):
+        self.assertEqual(
+            parse_accept_encoding("gzip, br;q=0.5, deflate;q=0, identity;q=x, ,"),
+            {"gzip": 1.0, "br": 0.5, "deflate": 0.0, "identity": 0.0},
+        )
+
+    def test_prefers_br_over_gzip(self):
+        self.assertEqual(choose_encoding({"br", "gzip"}, "gzip, deflate, br"), "br")
+        self.assertEqual(choose_encoding({"gzip"}, "gzip, br"), "gzip")
+
+    def test_higher_q_wins(self):
+        self.assertEqual(choose_encoding({"br", "gzip"}, "br;q=0.5, gzip"), "gzip")
+
+    def test_q_zero_refuses_a_coding(self):
+        self.assertEqual(choose_encoding({"br", "gzip"}, "br;q=0, gzip"), "gzip")
+        self.assertIsNone(choose_encoding({"br", "gzip"}, "br;q=0, gzip;q=0"))
+        self.assertIsNone(choose_encoding({"gzip"}, ""))
+
+    def test_wildcard_covers_unlisted_codings(self):
+        self.assertEqual(choose_encoding({"br", "gzip"}, "*"), "br")
+        self.assertEqual(choose_encoding({"br", "gzip"}, "br;q=0, *;q=0.1"), "gzip")
+        self.assertIsNone(choose_encoding({"br", "gzip"}, "identity, *;q=0"))
+
+
+class ClipMaskTests(SimpleTestCase):
+    """ Indexed clipping of parcels to a municipal boundary """
+
+    BOUNDARY = shapely.Polygon(
+        [(0, 0), (10, 0), (10, 10), (0, 10)],
+        holes=[[(4, 4), (6, 4), (6, 6), (4, 6)]]
+    )
+
+    def test_interior_border_and_outside_parcels(self):
+        parcels = np.array([
+            shapely.box(1, 1, 2, 2),            # interior
+            shapely.box(9, 9, 11, 11),          # crosses the outer ring
+            shapely.box(3.5, 3.5, 4.5, 4.5),    # crosses the hole
+            shapely.box(10, 1, 11, 2),          # touches the outer ring
+            shapely.box(20, 20, 21, 21),        # outside
+            shapely.box(4.5, 4.5, 5.5, 5.5),    # inside the hole
+        ])
+
+        self.assertEqual(
+            clip_mask(parcels, self.BOUNDARY).tolist(),
+            [True, True, True, True, False, False]
+        )
+
+    def test_matches_exact_intersects(self):
+        x, y = np.meshgrid(np.arange(-2, 12, 0.7), np.arange(-2, 12, 0.7))
+        parcels = shapely.box(x.ravel(), y.ravel(), x.ravel() + 0.5, y.ravel() + 0.5)
+        boundary = shapely.Point(5, 5).buffer(4.3, quad_segs=64).difference(self.BOUNDARY.interiors[0].envelope)
+
+        np.testing.assert_array_equal(clip_mask(parcels, boundary), shapely.intersects(boundary, parcels))
+
+    def test_no_parcels(self):
+        self.assertEqual(clip_mask(np.empty(0, dtype=object), self.BOUNDARY).size, 0)
+
+
+class ParcelClassificationTests(SimpleTestCase):
+    """ Value per acre class breaks and hexagon aggregation """
+
+    CLUSTERS = np.array([1.0, 2.0, 3.0, 100.0, 101.0, 102.0, 1000.0, 1001.0, np.nan])
+
+    def test_quantile_breaks_ignore_missing(self):
+        breaks = classification_breaks(self.CLUSTERS, QUANTILES, 4)
+
+        np.testing.assert_allclose(breaks, np.quantile(self.CLUSTERS[:-1], [0, 0.25, 0.5, 0.75, 1]))
+
+    def test_jenks_breaks_split_clusters(self):
+        with mock.patch("finance_viewer.lib.parcel_analytics.mapclassify", None):
+            breaks = classification_breaks(self.CLUSTERS, JENKS, 3)
+
+        self.assertEqual(breaks, [1.0, 3.0, 102.0, 1001.0])
+
+    def test_classes_capped_by_distinct_values(self):
+        self.assertEqual(classification_breaks(np.array([5.0, 5.0, 5.0]), JENKS, 4), [5.0, 5.0])
+        self.assertEqual(classification_breaks(np.array([np.nan]), QUANTILES, 4), [])
+        with self.assertRaises(ValueError):
+            classification_breaks(self.CLUSTERS, "equal", 4)
+
+    def test_assign_classes(self):
+        classes = assign_classes(np.array([0.0, 5.0, 10.0, 25.0, 30.0, np.nan]), [0.0, 10.0, 20.0, 30.0])
+
+        self.assertEqual(classes.tolist(), [0, 0, 1, 2, 2, -1])
+        self.assertEqual(assign_classes(np.array([1.0]), []).tolist(), [-1])
+
+    def test_hex_grid_bins_by_centroid(self):
+        centers = [(0, 0), (120, -80), (3000, 0)]
+        parcels = gpd.GeoDataFrame(
+            geometry=[shapely.box(x - 10, y - 10, x + 10, y + 10) for x, y in centers], crs=EQUAL_AREA_CRS
+        )
+        metrics = pd.DataFrame({
+            'assessed_value': [100.0, 300.0, np.nan],
+            'acres': [1.0, 1.0, 2.0],
+            'value_per_acre': [100.0, 300.0, np.nan],
+        })
+
+        features = hex_grid_aggregate(parcels, metrics, size=500.0)['features']
+        by_count = {feature['properties']['parcel_count']: feature for feature in features}
+
+        self.assertEqual(sorted(by_count), [1, 2])
+        self.assertEqual(by_count[2]['properties']['total_value'], 400.0)
+        self.assertEqual(by_count[2]['properties']['value_per_acre'], 200.0)
+        self.assertIsNone(by_count[1]['properties']['value_per_acre'])
+        self.assertEqual(by_count[1]['properties']['total_acres'], 2.0)
+        for count, points in [(2, centers[:2]), (1, centers[2:])]:
+            hexagon = shapely.geometry.shape(by_count[count]['geometry'])
+            self.assertTrue(all(hexagon.contains(shapely.Point(point)) for point in points))
+
+    def test_hex_grid_of_no_parcels(self):
+        parcels = gpd.GeoDataFrame(geometry=[], crs=EQUAL_AREA_CRS)
+        empty = pd.DataFrame({'assessed_value': [], 'acres': [], 'value_per_acre': []})
+
+        self.assertEqual(hex_grid_aggregate(parcels, empty)['features'], [])
+
+
+class DetectParcelFormatTests(SimpleTestCase):
+    """ Upload format detection from leading bytes """
+
+    def detect(self, head):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(head)
+        self.addCleanup(os.remove, f.name)
+        return detect_parcel_format(f.name)
+
+    def test_magic_bytes(self):
+        self.assertEqual(self.detect(b"PK\x03\x04rest of zip"), "zip")
+        self.assertEqual(self.detect(b"SQLite format 3\x00\x10\x00"), "gpkg")
+        self.assertEqual(self.detect(b"fgb\x03fgb\x00"), "fgb")
+        self.assertEqual(self.detect(b"PAR1\x15\x04"), "parquet")
+
+    def test_rejects_other_files(self):
+        for head in [b"", b"PK\x05\x06", b"SQLite format 2", b'{"type":"FeatureCollection"}']:
+            with self.subTest(head=head), self.assertRaises(ParcelException):
+                self.detect(head)
+
+
+@override_settings(UPLOAD_MAX_BYTES=10)
+class HashingUploadHandlerTests(SimpleTestCase):
+    """ Spooled uploads with a digest and a streaming size limit """
+
+    def setUp(self):
+        self.request = RequestFactory().post("/")
+        self.handler = HashingTemporaryFileUploadHandler(self.request)
+
+    def start(self, content_length):
+        self.handler.handle_raw_input(None, {}, content_length, b"boundary")
+        self.handler.new_file("file", "parcels.zip", "application/zip", None)
+        self.addCleanup(self.handler.file.close)
+
+    def test_digest_of_chunked_upload(self):
+        self.start(10)
+        self.handler.receive_data_chunk(b"parce", 0)
+        self.handler.receive_data_chunk(b"ls.zi", 5)
+        uploaded = self.handler.file_complete(10)
+
+        self.assertEqual(uploaded.content_hash, hashlib.sha256(b"parcels.zi").hexdigest())
+        self.assertEqual(uploaded.read(), b"parcels.zi")
+        self.assertFalse(upload_limit_exceeded(self.request))
+
+    def test_stops_once_received_bytes_pass_the_limit(self):
+        self.start(None)
+        self.handler.receive_data_chunk(b"123456", 0)
+        with self.assertRaises(StopUpload):
+            self.handler.receive_data_chunk(b"78901", 6)
+
+        self.assertTrue(upload_limit_exceeded(self.request))
+
+    def test_refuses_a_declared_oversized_body(self):
+        self.handler.handle_raw_input(None, {}, 11, b"boundary")
+        with self.assertRaises(StopUpload):
+            self.handler.new_file("file", "parcels.zip", "application/zip", None)
+
+        self.assertTrue(upload_limit_exceeded(self.request))
+
+
+class NegotiateParcelFormatTests(SimpleTestCase):
+    """ Parcel result format from the format parameter or the Accept header """
+
+    def negotiate(self, accept=None, fmt=None):
+        headers = {} if accept is None else {"HTTP_ACCEPT": accept}
+        return negotiate_parcel_format(RequestFactory().get("/", **headers), fmt)
+
+    def test_format_parameter_overrides_accept(self):
+        self.assertEqual(self.negotiate("application/flatgeobuf", "ndjson"), "ndjson")
+        self.assertEqual(self.negotiate(None, "parquet"), "parquet")
+        self.assertIsNone(self.negotiate("application/geo+json", "shp"))
+
+    def test_geojson_by_default(self):
+        self.assertEqual(self.negotiate(None), "geojson")
+        self.assertEqual(self.negotiate("*/*"), "geojson")
+        self.assertEqual(self.negotiate("application/json"), "geojson")
+
+    def test_binary_media_types(self):
+        self.assertEqual(self.negotiate("application/flatgeobuf"), "fgb")
+        self.assertEqual(self.negotiate("application/vnd.apache.arrow.stream"), "arrow")
+        self.assertEqual(self.negotiate("application/vnd.apache.parquet"), "parquet")
+        self.assertEqual(self.negotiate("application/x-parquet"), "parquet")
+        self.assertEqual(self.negotiate("application/x-ndjson"), "ndjson")
+
+    def test_quality_values(self):
+        self.assertEqual(self.negotiate("application/geo+json;q=0.5, application/flatgeobuf"), "fgb")
+        self.assertEqual(self.negotiate("application/flatgeobuf;q=0.2, */*;q=0.8"), "geojson")
+
+    def test_nothing_acceptable(self):
+        self.assertIsNone(self.negotiate("text/html"))
+
+
+class BoundaryCacheTests(SimpleTestCase):
+    """ Per-worker LRU of prepared boundaries, bounded by coordinates held """
+
+    def setUp(self):
+        boundary_cache._boundaries.clear()
+        boundary_cache._local.update(version=None, size=0)
+        self.addCleanup(boundary_cache._boundaries.clear)
+        self.addCleanup(boundary_cache._local.update, version=None, size=0)
+
+        self.version = 1
+        self.loaded = []
+        patches = [
+            mock.patch.object(boundary_cache, "get_data_version", lambda name: self.version),
+            mock.patch.object(boundary_cache, "load_boundary", self.load),
+            # Each square boundary holds 5 coordinates
+            mock.patch.object(boundary_cache, "MAX_CACHED_COORDINATES", 12),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def load(self, mid):
+        self.loaded.append(mid)
+        if mid == "none":
+            return None
+        return boundary_cache.CachedBoundary(mid, shapely.box(0, 0, 1, 1), {})
+
+    def test_evicts_least_recently_used(self):
+        for mid in ["a", "b", "a", "c", "a", "b"]:
+            boundary_cache.get_municipality_boundary(mid)
+
+        self.assertEqual(self.loaded, ["a", "b", "c", "b"])
+        self.assertEqual(list(boundary_cache._boundaries), ["a", "b"])
+        self.assertEqual(boundary_cache._local["size"], 10)
+
+    def test_caches_missing_boundaries(self):
+        self.assertIsNone(boundary_cache.get_municipality_boundary("none"))
+        self.assertIsNone(boundary_cache.get_municipality_boundary("none"))
+
+        self.assertEqual(self.loaded, ["none"])
+
+    def test_version_bump_empties_the_cache(self):
+        boundary = boundary_cache.get_municipality_boundary("a")
+        self.assertIs(boundary_cache.get_municipality_boundary("a"), boundary)
+
+        self.version = 2
+        self.assertIsNot(boundary_cache.get_municipality_boundary("a"), boundary)
+        self.assertEqual(self.loaded, ["a", "a"])
+        self.assertEqual(boundary_cache._local["size"], 5)
+
+    def test_contains(self):
+        boundary = boundary_cache.get_municipality_boundary("a")
+
+        self.assertTrue(boundary.contains(0.5, 0.5))
+        self.assertFalse(boundary.contains(1.5, 0.5))
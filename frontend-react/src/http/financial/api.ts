@@ -12,8 +12,7 @@ export const financialApi = {
   },
   getStateBoundaries: async () => {
     const response = await apiClient.get(`/financial/gis/states`);
-    const geojsonObj = JSON.parse(response.data);
-    const stateBoundaries: StateBoundary[] = geojsonObj.features.map((feature: any) => feature.properties);
+    const stateBoundaries: StateBoundary[] = response.data.features.map((feature: any) => feature.properties);
     return stateBoundaries;
   },
   getMunicipalBoundaries: async (name:string, abbr:string, code:string) => {
@@ -1,6 +1,6 @@
 import { apiClient } from '@/composables/api/apiClient';
 import type { ErrorResponse } from '~/types/http/common';
-import type { MunicipalFeature, StateBoundary, ParcelUploadResponse } from '~/types/http/gis';
+import type { MunicipalFeature, StateBoundary, ParcelJobResponse, ParcelUploadResponse } from '~/types/http/gis';
 import type { MunicipalityFinance, MunicipalityInfo } from '~/types/http/finance';
 
 export const financialApi = {
@@ -19,8 +19,7 @@ export const financialApi = {
   },
   getStateBoundaries: async () => {
     const response = await apiClient.get(`/financial/gis/states`);
-    const geojsonObj = JSON.parse(response.data);
-    return geojsonObj.features
+    return response.data.features
   },
   getMunicipalBoundaries: async (name:string, abbr:string, code:string) => {
     const response = await apiClient.get(
@@ -33,7 +32,7 @@ export const financialApi = {
     const response = await apiClient.post(`/financial/municipality/finances/add/year`, data);
     return response.data;
   },
-  uploadParcelData: async (file: File, mid:string):Promise<ParcelUploadResponse | ErrorResponse> => {
+  uploadParcelData: async (file: File, mid:string):Promise<ParcelJobResponse | ErrorResponse> => {
     const formData = new FormData();
     formData.append('file', file);
     const response = await apiClient.post(
@@ -46,5 +45,17 @@ export const financialApi = {
       }
     );
     return response.data;
+  },
+  getParcelJob: async (jobId: string):Promise<ParcelJobResponse> => {
+    const response = await apiClient.get<ParcelJobResponse>(
+      `/financial/gis/municipality/parcels/jobs/${jobId}`
+    );
+    return response.data;
+  },
+  getParcelJobResult: async (jobId: string):Promise<ParcelUploadResponse> => {
+    const response = await apiClient.get<ParcelUploadResponse>(
+      `/financial/gis/municipality/parcels/jobs/${jobId}/result`
+    );
+    return response.data;
   }
 };
\ No newline at end of file
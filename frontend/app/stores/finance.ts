@@ -1,12 +1,15 @@
 import { defineStore } from 'pinia'
 import { financialApi } from '@/composables/api/financialApi'
 import type { ErrorResponse } from '@/types/http/common'
-import type { MunicipalFeature, MunicipalBoundaryCollection, ParcelUploadResponse } from '@/types/http/gis'
+import type { MunicipalFeature, MunicipalBoundaryCollection, ParcelJobResponse, ParcelUploadResponse } from '@/types/http/gis'
 import type { MunicipalityFinance } from '@/types/http/finance'
 import type { StateInfo } from '@/types/store/finance'
 import { FrameType } from '@/types/store/frames'
 import type { List } from 'echarts'
 
+// Milliseconds between parcel job status polls
+const PARCEL_JOB_POLL_INTERVAL = 1000
+
 interface FinanceState {
   selectedStatesByFrame: Record<string, StateInfo | null>
   municipalBoundariesByState: Record<number, MunicipalBoundaryCollection | null>
@@ -109,9 +112,21 @@ export const useFinanceStore = defineStore('finance', {
         municipalityGisData = this.selectedMunicipalitiesByFrame[frameId] ?? null
       }
       
-      // Send parcel data to API to get modified GIS data for the municipality
-      const data = await financialApi.uploadParcelData(file, mid)
-      console.log('Received processed parcel data:', data)
+      // Upload the parcel file, then poll its job until the parcels are processed
+      let job: ParcelJobResponse | ErrorResponse = await financialApi.uploadParcelData(file, mid)
+      while ('status' in job && (job.status === 'queued' || job.status === 'running')) {
+        await new Promise(resolve => setTimeout(resolve, PARCEL_JOB_POLL_INTERVAL))
+        job = await financialApi.getParcelJob(job.job_id)
+      }
+
+      if ('error' in job) {
+        return job
+      }
+      if (job.status === 'failed') {
+        return { success: false, error: job.message || 'Error processing parcel file.' }
+      }
+
+      const data = await financialApi.getParcelJobResult(job.job_id)
       this.municipalParcelDataByFrame[frameId] = data
       return data
     }
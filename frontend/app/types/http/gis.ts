@@ -67,4 +67,17 @@ export interface ParcelFeatureProperties {
   export interface ParcelUploadResponse {
     type: string;
     features: ParcelFeature[];
-  }
\ No newline at end of file
+  }
+
+  export type ParcelJobStatus = 'queued' | 'running' | 'succeeded' | 'failed';
+
+  export interface ParcelJobResponse {
+    job_id: string;
+    mid: string;
+    status: ParcelJobStatus;
+    progress: number;
+    message: string;
+    feature_count: number | null;
+    created_at: string;
+    finished_at: string | null;
+  }